@@ -0,0 +1,168 @@
+"""
+Счётчики фасетов для /api/recipes/facets/: корзины времени
+приготовления, авторы и самые частые ингредиенты среди рецептов,
+подходящих под текущие фильтры списка.
+
+Корзины и авторы считаются одним запросом: GROUP BY автор с условными
+COUNT по корзинам, итог по корзине — сумма по авторам. Если фильтр по
+ингредиентам посчитан индексом recipes.ingredient_index и совпадений не
+больше MATCHED_IN_LIMIT (обычный случай), они добавляются в тот же
+запрос списком pk IN. Большие множества (при ?exclude_ingredients= это
+почти все рецепты) в SQL не передаются: строки с автором и корзинами
+читаются одним запросом по остальным фильтрам и отбираются по
+множеству из индекса здесь же. Ингредиенты —
+по индексу, если он включён, иначе одним GROUP BY по RecipeIngredient.
+Результат кэшируется по нормализованному набору фильтров на FACETS_TTL
+секунд.
+"""
+import hashlib
+from collections import Counter
+
+from django.db.models import BooleanField, Count, ExpressionWrapper
+
+from recipes.catalogue import get_catalogue
+from recipes.models import Ingredient, RecipeIngredient
+from users.models import User
+
+from .filters import COOKING_TIME_BUCKETS
+
+TOP_AUTHORS = 10
+TOP_INGREDIENTS = 20
+# Больше совпадений индекса — не IN-список, а проход по строкам.
+MATCHED_IN_LIMIT = 1000
+
+# Параметры RecipeViewSet, которые меняют набор рецептов.
+FILTER_PARAMS = {'author', 'cooking_time', 'is_favorited',
+                 'is_in_shopping_cart', 'ingredients', 'exclude_ingredients'}
+# Фильтры, результат которых зависит от пользователя.
+PERSONAL_PARAMS = {'is_favorited', 'is_in_shopping_cart'}
+
+
+def cache_key(request):
+    """
+    Ключ кэша по фильтрам запроса: порядок параметров и значений в
+    списках не важен, параметры не из фильтров (page, limit, ...)
+    не учитываются.
+    """
+    params = []
+    for name in sorted(FILTER_PARAMS & set(request.query_params)):
+        values = sorted({
+            part.strip()
+            for value in request.query_params.getlist(name)
+            for part in value.split(',') if part.strip()
+        })
+        if values:
+            params.append(f'{name}={",".join(values)}')
+    if (PERSONAL_PARAMS & set(request.query_params)
+            and request.user.is_authenticated):
+        params.append(f'user={request.user.pk}')
+    digest = hashlib.blake2b('&'.join(params).encode(), digest_size=16)
+    return f'facets:{digest.hexdigest()}'
+
+
+def _grouped_counts(queryset):
+    """Авторы, корзины и итог одним GROUP BY по автору."""
+    buckets = {
+        f'cooking_time_{key}': Count('pk', filter=condition)
+        for key, condition in COOKING_TIME_BUCKETS.items()
+    }
+    rows = list(
+        queryset.order_by().values('author_id', 'author__username')
+        .annotate(count=Count('pk'), **buckets)
+    )
+    authors = sorted(rows, key=lambda row: (-row['count'], row['author_id']))
+    return (
+        sum(row['count'] for row in rows),
+        {key: sum(row[f'cooking_time_{key}'] for row in rows)
+         for key in COOKING_TIME_BUCKETS},
+        [(row['author_id'], row['author__username'], row['count'])
+         for row in authors[:TOP_AUTHORS]],
+    )
+
+
+def _matched_counts(queryset, matched):
+    """
+    То же для рецептов queryset из множества matched. Возвращает ещё и
+    список отобранных id — для счётчиков ингредиентов.
+
+    Небольшое matched уходит в SQL фильтром pk IN; большое — строки
+    (id, автор, корзины) читаются потоком и отбираются в Python.
+    """
+    if len(matched) <= MATCHED_IN_LIMIT:
+        queryset = queryset.filter(pk__in=matched)
+        return _grouped_counts(queryset), list(
+            queryset.order_by().values_list('pk', flat=True))
+    flags = {
+        f'cooking_time_{key}': ExpressionWrapper(
+            condition, output_field=BooleanField())
+        for key, condition in COOKING_TIME_BUCKETS.items()
+    }
+    rows = (queryset.order_by().annotate(**flags)
+            .values_list('pk', 'author_id', *flags))
+    recipe_ids = []
+    authors = Counter()
+    buckets = Counter()
+    for pk, author_id, *values in rows.iterator(chunk_size=2000):
+        if pk not in matched:
+            continue
+        recipe_ids.append(pk)
+        authors[author_id] += 1
+        for key, value in zip(COOKING_TIME_BUCKETS, values):
+            buckets[key] += bool(value)
+    top = sorted(authors.items(), key=lambda item: (-item[1], item[0]))
+    top = top[:TOP_AUTHORS]
+    usernames = dict(User.objects.filter(
+        pk__in=[pk for pk, _ in top]).values_list('pk', 'username'))
+    return (
+        len(recipe_ids),
+        {key: buckets[key] for key in COOKING_TIME_BUCKETS},
+        [(pk, usernames.get(pk), count) for pk, count in top],
+    ), recipe_ids
+
+
+def recipe_facets(queryset, index=None, matched=None):
+    """
+    Фасеты для рецептов queryset. matched — множество id, подходящих
+    под фильтр по ингредиентам по индексу index (None — фильтра нет или
+    он уже в queryset).
+    """
+    recipe_ids = None
+    if matched is not None:
+        (count, buckets, authors), recipe_ids = _matched_counts(
+            queryset, matched)
+    else:
+        count, buckets, authors = _grouped_counts(queryset)
+        if index is not None and queryset.query.has_filters():
+            recipe_ids = list(
+                queryset.order_by().values_list('pk', flat=True))
+
+    if index is not None:
+        counts = index.ingredient_counts(recipe_ids, TOP_INGREDIENTS)
+    else:
+        counts = list(
+            RecipeIngredient.objects
+            .filter(recipe__in=queryset.order_by().values('pk'))
+            .values('ingredient_id').annotate(count=Count('pk'))
+            .order_by('-count', 'ingredient_id')
+            .values_list('ingredient_id', 'count')[:TOP_INGREDIENTS]
+        )
+    ingredients = (get_catalogue() or Ingredient.objects).in_bulk(
+        [pk for pk, _ in counts])
+
+    return {
+        'count': count,
+        'cooking_time': [
+            {'value': key, 'count': buckets[key]}
+            for key in COOKING_TIME_BUCKETS
+        ],
+        'author': [
+            {'id': pk, 'username': username, 'count': author_count}
+            for pk, username, author_count in authors
+        ],
+        'ingredients': [
+            {'id': pk, 'name': ingredients[pk].name,
+             'measurement_unit': ingredients[pk].measurement_unit,
+             'count': count}
+            for pk, count in counts if pk in ingredients
+        ],
+    }
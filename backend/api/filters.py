@@ -1,9 +1,26 @@
+from django.db.models import F, Q
 from django_filters import rest_framework as filters
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import SearchFilter
 
 from recipes.models import Recipe
 
 
+# Корзины времени приготовления: ?cooking_time=30 — не дольше 30 минут.
+COOKING_TIME_BUCKETS = {
+    '15': Q(cooking_time__lte=15),
+    '30': Q(cooking_time__lte=30),
+    '60': Q(cooking_time__lte=60),
+    'more': Q(cooking_time__gt=60),
+}
+
+ORDERINGS = {
+    # Оценки считает build_trending (recipes/trending.py); рецепты без
+    # отметок — в конце, новые первыми.
+    'trending': (F('trending__score').desc(nulls_last=True), '-pub_date'),
+}
+
+
 class RecipeFilter(filters.FilterSet):
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
@@ -27,6 +44,56 @@ class RecipeFilter(filters.FilterSet):
         return queryset
 
 
+def parse_id_list(request, param):
+    """?ingredients=1,2&ingredients=3 → [1, 2, 3]."""
+    ids = []
+    for value in request.query_params.getlist(param):
+        for part in value.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if not part.isdigit():
+                raise ValidationError(
+                    {param: 'Ожидается список id ингредиентов через запятую.'})
+            ids.append(int(part))
+    return ids
+
+
+def parse_cooking_time(request):
+    """?cooking_time=30 → условие корзины COOKING_TIME_BUCKETS или None."""
+    value = request.query_params.get('cooking_time')
+    if not value:
+        return None
+    if value not in COOKING_TIME_BUCKETS:
+        raise ValidationError({'cooking_time': 'Ожидается одно из значений: '
+                               + ', '.join(COOKING_TIME_BUCKETS) + '.'})
+    return COOKING_TIME_BUCKETS[value]
+
+
+def parse_ordering(request):
+    """?ordering=trending → аргументы order_by из ORDERINGS или None."""
+    value = request.query_params.get('ordering')
+    if not value:
+        return None
+    if value not in ORDERINGS:
+        raise ValidationError({'ordering': 'Ожидается одно из значений: '
+                               + ', '.join(ORDERINGS) + '.'})
+    return ORDERINGS[value]
+
+
+def filter_by_ingredients(queryset, include, exclude):
+    """
+    SQL-вариант фильтра по ингредиентам (когда индекс в памяти
+    отключён): JOIN с RecipeIngredient на каждый ингредиент.
+    """
+    for pk in set(include):
+        queryset = queryset.filter(recipe_ingredients__ingredient_id=pk)
+    if exclude:
+        queryset = queryset.exclude(
+            recipe_ingredients__ingredient_id__in=exclude)
+    return queryset
+
+
 class IngredientSearchFilter(SearchFilter):
     search_param = 'name'
 
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк накладных расходов на соединение с БД на запрос: '
+            'CONN_MAX_AGE=0 против текущей настройки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--database', default='default')
+        parser.add_argument(
+            '--max-age', type=int, default=None,
+            help='CONN_MAX_AGE для сравнения; по умолчанию — из настроек')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        connection = connections[alias]
+        configured = options['max_age']
+        if configured is None:
+            configured = connection.settings_dict['CONN_MAX_AGE']
+        for label, max_age in (('CONN_MAX_AGE=0', 0),
+                               (f'CONN_MAX_AGE={configured}', configured)):
+            elapsed = self._run(connection, max_age, options['requests'])
+            self.stdout.write(
+                f'{label:<20} {elapsed * 1e3 / options["requests"]:.3f} '
+                f'мс/запрос')
+
+    def _run(self, connection, max_age, requests):
+        """
+        Имитирует цикл запроса: request_started → SELECT 1 →
+        request_finished. Django закрывает устаревшие соединения именно
+        по этим сигналам.
+        """
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        started = time.perf_counter()
+        for _ in range(requests):
+            request_started.send(sender=self.__class__)
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            request_finished.send(sender=self.__class__)
+        elapsed = time.perf_counter() - started
+        connection.close()
+        return elapsed
@@ -0,0 +1,87 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Пропускная способность gunicorn (gunicorn.conf.py) для '
+            'нескольких конфигураций воркеров и потоков')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--configs', default='1x1,2x1,2x4,4x2',
+            help='Конфигурации "воркерыxпотоки" через запятую')
+        parser.add_argument('--path', default='/api/ingredients/?name=а')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=16)
+
+    def handle(self, *args, **options):
+        for config in options['configs'].split(','):
+            workers, threads = (int(part) for part in config.split('x'))
+            rps, errors = self._bench(workers, threads, options)
+            self.stdout.write(
+                f'{workers} воркеров x {threads} потоков: '
+                f'{rps:8.1f} запросов/с, ошибок: {errors}')
+
+    def _free_port(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def _wait(self, url, process, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError('gunicorn завершился при запуске')
+            try:
+                urllib.request.urlopen(url, timeout=1).read()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError('gunicorn не ответил за отведённое время')
+
+    def _bench(self, workers, threads, options):
+        port = self._free_port()
+        env = {
+            **os.environ,
+            'GUNICORN_BIND': f'127.0.0.1:{port}',
+            'GUNICORN_WORKERS': str(workers),
+            'GUNICORN_THREADS': str(threads),
+            'GUNICORN_ACCESS_LOG': '',
+            'GUNICORN_LOG_LEVEL': 'warning',
+            # Бенчмарк шлёт тысячи запросов с одного IP.
+            'THROTTLE_RATE_ANON': '1000000/s',
+        }
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+             'foodgram.wsgi'],
+            cwd=settings.BASE_DIR, env=env,
+        )
+        url = f'http://127.0.0.1:{port}{quote(options["path"], safe="/?=&")}'
+        try:
+            self._wait(url, process)
+
+            def fetch(_):
+                try:
+                    with urllib.request.urlopen(url, timeout=30) as response:
+                        response.read()
+                    return 0
+                except OSError:
+                    return 1
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as pool:
+                errors = sum(pool.map(fetch, range(options['requests'])))
+            elapsed = time.perf_counter() - started
+        finally:
+            process.terminate()
+            process.wait()
+        return options['requests'] / elapsed, errors
@@ -0,0 +1,105 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.catalogue import get_catalogue
+from recipes.fuzzy import FuzzyIndex
+from recipes.models import Ingredient
+
+BUDGET_MS = 1.0
+# Как название набирают латиницей.
+TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l',
+    'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's',
+    'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch',
+    'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e',
+    'ю': 'yu', 'я': 'ya',
+})
+LETTERS = 'абвгдежзийклмнопрстуфхцчшщыьэюя'
+
+
+def typo(rng, word):
+    """Одна случайная опечатка: замена, пропуск или перестановка."""
+    pos = rng.randrange(1, len(word))
+    kind = rng.choice(('replace', 'delete', 'swap'))
+    if kind == 'replace':
+        return word[:pos] + rng.choice(LETTERS) + word[pos + 1:]
+    if kind == 'delete':
+        return word[:pos] + word[pos + 1:]
+    return word[:pos - 1] + word[pos] + word[pos - 1] + word[pos + 1:]
+
+
+def make_cases(rows, queries, seed):
+    """Запросы по группам: [(запрос, ожидаемая строка справочника)]."""
+    rng = random.Random(seed)
+    cases = {'префикс': [], 'опечатка': [], 'латиница': [],
+             'латиница + опечатка': []}
+    for row in rng.choices(rows, k=queries):
+        word = row['name'].split()[0]
+        if len(word) < 5:
+            continue
+        cases['префикс'].append((word[:rng.randint(3, len(word))], row))
+        cases['опечатка'].append((typo(rng, word), row))
+        cases['латиница'].append((word.translate(TRANSLIT), row))
+        cases['латиница + опечатка'].append(
+            (typo(rng, word).translate(TRANSLIT), row))
+    return cases
+
+
+def measure(index, queries):
+    """Вернуть p50, p99 и max задержки в мс и долю найденных."""
+    timings, found = [], 0
+    for query, row in queries:
+        begin = time.perf_counter()
+        result = index.search(query)
+        timings.append((time.perf_counter() - begin) * 1e3)
+        found += row in result
+    timings.sort()
+    return (timings[len(timings) // 2], timings[int(len(timings) * 0.99)],
+            timings[-1], found / len(queries))
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк нечёткого поиска ингредиентов (?fuzzy=1): '
+            'задержка на запрос и доля найденных по запросам с '
+            'опечатками и латиницей. Бюджет — 1 мс на запрос.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path',
+                            help='JSON со справочником (как '
+                                 'data/ingredients.json); по умолчанию — '
+                                 'текущий каталог.')
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if options['path']:
+            with open(options['path'], encoding='utf-8') as file:
+                rows = [{'id': pk, **row}
+                        for pk, row in enumerate(json.load(file), 1)]
+        else:
+            catalogue = get_catalogue()
+            rows = (catalogue.search() if catalogue is not None else list(
+                Ingredient.objects.values('id', 'name', 'measurement_unit')))
+        if not rows:
+            raise CommandError('Справочник ингредиентов пуст.')
+
+        started = time.perf_counter()
+        index = FuzzyIndex(rows)
+        self.stdout.write(
+            f'Ингредиентов: {len(rows)}, индекс за '
+            f'{(time.perf_counter() - started) * 1e3:.1f} мс')
+
+        worst = 0.0
+        cases = make_cases(rows, options['queries'], options['seed'])
+        for label, queries in cases.items():
+            p50, p99, slowest, found = measure(index, queries)
+            worst = max(worst, p99)
+            self.stdout.write(
+                f'{label:<20} p50 {p50:.3f} мс  p99 {p99:.3f} мс  '
+                f'max {slowest:.3f} мс  найдено {found:.1%}')
+        verdict = 'в бюджете' if worst < BUDGET_MS else 'бюджет превышен'
+        self.stdout.write(f'p99 {worst:.3f} мс — {verdict} ({BUDGET_MS} мс)')
@@ -0,0 +1,78 @@
+import random
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+
+from recipes import ingredient_index
+from recipes.ingredient_index import IngredientIndex
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк /api/recipes/pantry/ и фильтра по ингредиентам на '
+            'синтетическом индексе (без БД): по умолчанию 1М рецептов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1_000_000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=10)
+        parser.add_argument('--pantry', type=int, default=15,
+                            help='Размер набора продуктов.')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        count = options['recipes']
+        # Популярность ингредиентов по Ципфу: соль и лук есть почти
+        # везде, редкие специи — в единицах рецептов.
+        weights = [1 / (rank + 1) for rank in range(options['ingredients'])]
+        ingredient_ids = list(range(1, options['ingredients'] + 1))
+
+        def rows():
+            for recipe_id in range(1, count + 1):
+                picked = set(rng.choices(
+                    ingredient_ids, weights, k=options['per_recipe']))
+                for ingredient_id in picked:
+                    yield ingredient_id, recipe_id
+
+        epoch = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+        recipes = (
+            (pk, datetime.fromtimestamp(epoch + pk * 60, timezone.utc))
+            for pk in range(1, count + 1)
+        )
+        index = IngredientIndex()
+        started = time.perf_counter()
+        index.build(rows(), recipes)
+        self.stdout.write(
+            f'построение индекса: {time.perf_counter() - started:.1f} с, '
+            f'{sum(map(len, index._postings.values()))} связей')
+
+        # Набор продуктов: несколько частых и несколько случайных.
+        pantry = set(ingredient_ids[:5]) | set(
+            rng.sample(ingredient_ids, options['pantry'] - 5))
+        repeat = options['repeat']
+
+        def measure(label, func):
+            best = float('inf')
+            for _ in range(repeat):
+                started = time.perf_counter()
+                result = func()
+                best = min(best, time.perf_counter() - started)
+            self.stdout.write(
+                f'{label:<36} {best * 1e3:9.1f} мс  ({len(result)} рецептов)')
+
+        if ingredient_index.np is not None:
+            measure('cover (NumPy)', lambda: index.cover(pantry))
+            measure('cover (NumPy), min_coverage=0.5',
+                    lambda: index.cover(pantry, 0.5))
+        numpy, ingredient_index.np = ingredient_index.np, None
+        try:
+            measure('cover (Python)', lambda: index.cover(pantry))
+        finally:
+            ingredient_index.np = numpy
+        common, rare = ingredient_ids[0], ingredient_ids[-1]
+        measure('match: частый + редкий', lambda: index.match([common, rare]))
+        measure('match: два частых',
+                lambda: index.match(ingredient_ids[:2]))
+        measure('match: без частого', lambda: index.match(exclude=[common]))
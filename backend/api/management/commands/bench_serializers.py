@@ -0,0 +1,92 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeSerializer
+from recipes.models import Favorite, Ingredient, Recipe, RecipeIngredient
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Микробенчмарк: стоимость сериализации одного рецепта '
+            'через RecipeSerializer и RecipeSerializer.lean')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100)
+        parser.add_argument('--ingredients', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        # Синтетические данные создаются в транзакции и откатываются.
+        with transaction.atomic():
+            ids, context = self._populate(
+                options['recipes'], options['ingredients'])
+            self._run(ids, context, options['repeat'])
+            transaction.set_rollback(True)
+
+    def _populate(self, recipes_count, ingredients_count):
+        author = User.objects.create(
+            username='bench_author', email='bench_author@example.com')
+        reader = User.objects.create(
+            username='bench_reader', email='bench_reader@example.com')
+        ingredients = list(Ingredient.objects.all()[:ingredients_count])
+        if len(ingredients) < ingredients_count:
+            ingredients += Ingredient.objects.bulk_create(
+                Ingredient(name=f'bench {i}', measurement_unit='г')
+                for i in range(ingredients_count - len(ingredients))
+            )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {i}', text='Описание ' * 40,
+                   image='recipes/images/bench.png', cooking_time=30,
+                   short_url=f'bn{i:06d}')
+            for i in range(recipes_count)
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=100)
+            for recipe in recipes for ingredient in ingredients
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=reader, recipe=recipe) for recipe in recipes[::2]
+        )
+        request = RequestFactory().get('/api/recipes/')
+        request.user = reader
+        return [recipe.pk for recipe in recipes], {'request': request}
+
+    def _measure(self, func, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func()
+            best = min(best, time.perf_counter() - started)
+        return best, result
+
+    def _run(self, ids, context, repeat):
+        def full():
+            recipes = (Recipe.objects.filter(pk__in=ids)
+                       .select_related('author')
+                       .prefetch_related('recipe_ingredients__ingredient'))
+            return RecipeSerializer(recipes, many=True, context=context).data
+
+        def lean():
+            return RecipeSerializer.lean(ids, context)
+
+        full_time, data = self._measure(full, repeat)
+        lean_time, _ = self._measure(lean, repeat)
+        stdlib_time, _ = self._measure(
+            lambda: JSONRenderer().render(data), repeat)
+        fast_time, _ = self._measure(
+            lambda: FastJSONRenderer().render(data), repeat)
+
+        count = len(ids)
+        for label, seconds in (
+            ('RecipeSerializer', full_time),
+            ('RecipeSerializer.lean', lean_time),
+            ('JSONRenderer', stdlib_time),
+            ('FastJSONRenderer', fast_time),
+        ):
+            self.stdout.write(
+                f'{label:<24} {seconds * 1e6 / count:10.1f} мкс/рецепт')
@@ -0,0 +1,85 @@
+import gzip
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {
+    '.css', '.html', '.js', '.json', '.map', '.svg', '.txt', '.xml',
+    '.yaml', '.yml',
+}
+
+
+class Command(BaseCommand):
+    help = ('Создаёт рядом со статикой сжатые копии (.gz, .br) для '
+            'gzip_static/brotli_static в nginx и печатает, сколько байт '
+            'это экономит. Документацию и фронтенд сжимает '
+            'frontend/precompress.js при сборке их образов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            help='Каталоги; по умолчанию STATIC_ROOT')
+        parser.add_argument(
+            '--min-size', type=int, default=settings.COMPRESSION_MIN_SIZE)
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or [
+            path for path in (settings.STATIC_ROOT,) if os.path.isdir(path)
+        ]
+        totals = {'raw': 0, 'gz': 0, 'br': 0}
+        files = 0
+        for root in paths:
+            for directory, _, names in os.walk(root):
+                for name in names:
+                    path = os.path.join(directory, name)
+                    if (os.path.splitext(name)[1] not in
+                            COMPRESSIBLE_EXTENSIONS):
+                        continue
+                    if os.path.getsize(path) < options['min_size']:
+                        continue
+                    sizes = self._compress(path)
+                    files += 1
+                    for key, size in sizes.items():
+                        totals[key] += size
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'{path}: ' + ', '.join(
+                            f'{key} {size}' for key, size in sizes.items()))
+
+        self.stdout.write(f'Файлов: {files}')
+        if not totals['raw']:
+            return
+        for key in ('raw', 'gz', 'br'):
+            if key == 'br' and brotli is None:
+                continue
+            self.stdout.write(
+                f'{key:>3}: {totals[key]:>10} байт '
+                f'({totals[key] / totals["raw"]:.1%})')
+
+    def _compress(self, path):
+        """Пишет .gz/.br, только если исходник новее уже сжатой копии."""
+        with open(path, 'rb') as file:
+            data = file.read()
+        sizes = {'raw': len(data)}
+        variants = [('gz', lambda: gzip.compress(data, 9, mtime=0))]
+        if brotli is not None:
+            variants.append(('br', lambda: brotli.compress(data, quality=11)))
+        for suffix, compress in variants:
+            target = f'{path}.{suffix}'
+            if (os.path.exists(target)
+                    and os.path.getmtime(target) >= os.path.getmtime(path)):
+                sizes[suffix] = os.path.getsize(target)
+                continue
+            compressed = compress()
+            if len(compressed) >= len(data):
+                sizes[suffix] = len(data)
+                continue
+            with open(target, 'wb') as file:
+                file.write(compressed)
+            sizes[suffix] = len(compressed)
+        return sizes
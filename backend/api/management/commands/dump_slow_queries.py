@@ -0,0 +1,41 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import slow_queries
+
+
+class Command(BaseCommand):
+    help = ('Выводит медленные запросы, захваченные api.slow_queries '
+            '(SLOW_QUERY_MS), вместе с планами выполнения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Сколько последних записей вывести.')
+        parser.add_argument('--json', action='store_true',
+                            help='Вывести записи как JSON.')
+        parser.add_argument('--clear', action='store_true',
+                            help='Очистить буфер после вывода.')
+
+    def handle(self, *args, **options):
+        entries = slow_queries.captures()[:options['limit']]
+        if options['json']:
+            self.stdout.write(json.dumps(entries, ensure_ascii=False,
+                                         indent=2))
+        elif not entries:
+            state = (f'порог {settings.SLOW_QUERY_MS} мс'
+                     if settings.SLOW_QUERY_MS else 'захват выключен')
+            self.stdout.write(f'Медленных запросов нет ({state}).')
+        for entry in entries if not options['json'] else ():
+            self.stdout.write(self.style.WARNING(
+                f'#{entry["seq"]} {entry["captured_at"]} '
+                f'{entry["duration_ms"]} мс [{entry["alias"]}] '
+                f'{entry["origin"] or ""}'))
+            self.stdout.write(entry['sql'])
+            self.stdout.write(f'params: {entry["params"]}')
+            if entry['plan']:
+                self.stdout.write(entry['plan'])
+            self.stdout.write('')
+        if options['clear']:
+            slow_queries.clear()
@@ -0,0 +1,152 @@
+"""
+Метрики запросов в памяти процесса.
+
+PerformanceMiddleware (api.middleware) для выбранных запросов меряет
+время, SQL (число и время запросов), сериализацию и размер ответа и
+складывает их в гистограммы по имени view (например,
+RecipeViewSet.list). metrics_view отдаёт их в формате Prometheus.
+
+Гистограммы у каждого воркера gunicorn свои; /metrics показывает данные
+того воркера, который ответил.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.http import HttpResponse
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES = (1, 2, 5, 10, 20, 50, 100, 200)
+BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+_timings = ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, view, value):
+        with self._lock:
+            series = self._series.get(view)
+            if series is None:
+                series = self._series[view] = [0] * len(self.buckets) + [0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = {view: list(series)
+                        for view, series in self._series.items()}
+        for view, series in sorted(snapshot.items()):
+            label = f'view="{view}"'
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} '
+                             f'{count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} '
+                         f'{series[-1]}')
+            lines.append(f'{self.name}_sum{{{label}}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{label}}} {series[-1]}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'foodgram_request_duration_seconds', 'Время обработки запроса.', SECONDS)
+DB_DURATION = Histogram(
+    'foodgram_db_duration_seconds', 'Время SQL-запросов на запрос.', SECONDS)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries', 'Число SQL-запросов на запрос.', QUERIES)
+SERIALIZE_DURATION = Histogram(
+    'foodgram_serialize_duration_seconds',
+    'Время сериализации ответа (включая запросы из сериализаторов).',
+    SECONDS)
+RESPONSE_SIZE = Histogram(
+    'foodgram_response_size_bytes', 'Размер тела ответа до сжатия.', BYTES)
+
+HISTOGRAMS = (REQUEST_DURATION, DB_DURATION, DB_QUERIES,
+              SERIALIZE_DURATION, RESPONSE_SIZE)
+
+
+@contextmanager
+def collect():
+    """Собирает тайминги запроса; возвращает словарь, который заполняется."""
+    timings = {'db': 0.0, 'queries': 0, 'serialize': 0.0, 'size': None,
+               'active': set()}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+@contextmanager
+def span(name):
+    """
+    Добавляет время блока к метрике name текущего запроса. Вложенные
+    блоки с тем же именем не считаются повторно.
+    """
+    timings = _timings.get()
+    if timings is None or name in timings['active']:
+        yield
+        return
+    timings['active'].add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] += time.perf_counter() - started
+        timings['active'].discard(name)
+
+
+def record_size(size):
+    """
+    Размер тела ответа до сжатия: CompressionMiddleware вызывает это
+    перед тем, как заменить тело сжатым.
+    """
+    timings = _timings.get()
+    if timings is not None:
+        timings['size'] = size
+
+
+def query_timer(execute, sql, params, many, context):
+    """Обёртка для connection.execute_wrapper: считает SQL текущего запроса."""
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings['db'] += time.perf_counter() - started
+        timings['queries'] += 1
+
+
+class TimedSerializerMixin:
+    """
+    Время to_representation сериализаторов проекта — в метрику
+    serialize. Для many=True ListSerializer вызывает to_representation
+    у каждого элемента, вложенные сериализаторы не считаются повторно
+    (span). Сериализаторы djoser и админки не засекаются.
+    """
+
+    def to_representation(self, instance):
+        with span('serialize'):
+            return super().to_representation(instance)
+
+
+def metrics_view(request):
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return HttpResponse('\n'.join(lines) + '\n',
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,250 @@
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.db_router import (has_recent_write, mark_recent_write,
+                                replica_reads)
+
+from . import metrics
+from .nplusone import NPlusOneError, QueryPatternDetector, logger
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+    'text/',
+)
+
+
+def accepted_encodings(header):
+    """Разбирает Accept-Encoding в {кодировка: q}."""
+    result = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        result[coding] = quality
+    return result
+
+
+def choose_encoding(header):
+    """
+    Лучшая из поддерживаемых кодировок (br, gzip) с учётом q-значений;
+    при равных q предпочитаем br. None — сжимать нельзя.
+    """
+    accepted = accepted_encodings(header)
+    default = accepted.get('*', 0.0)
+    supported = ('br', 'gzip') if brotli else ('gzip',)
+    quality, _, coding = max(
+        (accepted.get(coding, default), coding == 'br', coding)
+        for coding in supported
+    )
+    return coding if quality > 0 else None
+
+
+def brotli_sequence(sequence, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Сжатие ответов с согласованием br/gzip по Accept-Encoding.
+
+    Сжимаются только текстовые типы от COMPRESSION_MIN_SIZE байт; потоковые
+    ответы (например, выгрузка списка покупок) сжимаются по мере отдачи,
+    без буферизации целиком. gzip — через django.utils.text, с той же
+    защитой от BREACH, что и в GZipMiddleware. brotli используется, только
+    если установлен пакет Brotli.
+    """
+    max_random_bytes = 100
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        if not response.get('Content-Type', '').startswith(
+                COMPRESSIBLE_TYPES):
+            return response
+        if getattr(response, 'is_async', False):
+            return response
+        if (not response.streaming
+                and len(response.content) < settings.COMPRESSION_MIN_SIZE):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if coding is None:
+            return response
+
+        if response.streaming:
+            if coding == 'br':
+                response.streaming_content = brotli_sequence(
+                    response.streaming_content,
+                    settings.COMPRESSION_BROTLI_QUALITY,
+                )
+            else:
+                response.streaming_content = compress_sequence(
+                    response.streaming_content,
+                    max_random_bytes=self.max_random_bytes,
+                )
+            del response.headers['Content-Length']
+        else:
+            metrics.record_size(len(response.content))
+            if coding == 'br':
+                compressed = brotli.compress(
+                    response.content,
+                    quality=settings.COMPRESSION_BROTLI_QUALITY,
+                )
+            else:
+                compressed = compress_string(
+                    response.content, max_random_bytes=self.max_random_bytes
+                )
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = coding
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Безопасные запросы к API читают с реплик (foodgram.db_router), кроме
+    клиентов, которые писали в последние REPLICA_STICKY_SECONDS: им нужен
+    свежий is_in_shopping_cart, is_favorited и т.п. Клиент определяется
+    по заголовку Authorization или сессионной куке.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        client_key = (request.META.get('HTTP_AUTHORIZATION')
+                      or request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            if response.status_code < 400:
+                mark_recent_write(client_key)
+            return response
+
+        use_replica = (request.path.startswith('/api/')
+                       and not has_recent_write(client_key))
+        with replica_reads(use_replica):
+            return self.get_response(request)
+
+
+def view_name(request):
+    """
+    Имя обработчика для метрик: ViewSet.action для DRF (например,
+    RecipeViewSet.list), иначе имя класса или функции view.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    func = match.func
+    cls = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    if cls is None:
+        return getattr(func, '__name__', 'unknown')
+    action = getattr(func, 'actions', {}).get(request.method.lower())
+    return f'{cls.__name__}.{action}' if action else cls.__name__
+
+
+class PerformanceMiddleware:
+    """
+    Для доли запросов PERFORMANCE_SAMPLE_RATE меряет общее время, SQL
+    (через connection.execute_wrapper), сериализацию и размер ответа.
+    Пишет их в заголовок Server-Timing и в гистограммы api.metrics.
+    Стоит снаружи CompressionMiddleware, чтобы время включало сжатие;
+    размер — тела до сжатия (metrics.record_size).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.PERFORMANCE_SAMPLE_RATE:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with metrics.collect() as timings, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(metrics.query_timer))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        response['Server-Timing'] = ', '.join((
+            f'total;dur={total * 1e3:.1f}',
+            f'db;dur={timings["db"] * 1e3:.1f};'
+            f'desc="{timings["queries"]} queries"',
+            f'serialize;dur={timings["serialize"] * 1e3:.1f}',
+        ))
+        name = view_name(request)
+        metrics.REQUEST_DURATION.observe(name, total)
+        metrics.DB_DURATION.observe(name, timings['db'])
+        metrics.DB_QUERIES.observe(name, timings['queries'])
+        metrics.SERIALIZE_DURATION.observe(name, timings['serialize'])
+        if not response.streaming:
+            size = timings['size']
+            metrics.RESPONSE_SIZE.observe(
+                name, len(response.content) if size is None else size)
+        return response
+
+
+class QueryPatternMiddleware:
+    """
+    Для доли запросов NPLUSONE_SAMPLE_RATE ищет N+1 (api.nplusone).
+    NPLUSONE_MODE='raise' — падать с NPlusOneError (тесты, CI),
+    'log' — писать предупреждение в лог api.nplusone.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (not settings.NPLUSONE_MODE
+                or random.random() >= settings.NPLUSONE_SAMPLE_RATE):
+            return self.get_response(request)
+
+        with QueryPatternDetector(settings.NPLUSONE_THRESHOLD) as detector:
+            response = self.get_response(request)
+        if detector.violations():
+            report = detector.report(
+                f'{request.method} {request.get_full_path()} '
+                f'({view_name(request)})')
+            if settings.NPLUSONE_MODE == 'raise':
+                raise NPlusOneError(report)
+            logger.warning(report)
+        return response
@@ -0,0 +1,105 @@
+"""
+Поиск N+1 запросов.
+
+QueryPatternDetector снимает отпечаток каждого SQL запроса (литералы и
+списки IN заменяются заглушками) и считает повторы. Если один и тот же
+отпечаток выполнился threshold раз и больше, это N+1: запрос идёт в
+цикле по объектам. Для каждого запроса запоминается поле
+сериализатора, из которого он выполнен (например,
+CustomUserSerializer.is_subscribed), — его и надо чинить.
+"""
+import logging
+import re
+import sys
+from collections import Counter
+
+from django.db import connections
+from rest_framework.fields import Field
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger('api.nplusone')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+MAX_STACK_DEPTH = 80
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def serializer_field():
+    """
+    Поле сериализатора, из которого выполняется текущий запрос:
+    ближайший по стеку кадр, где self — поле DRF, а не сериализатор.
+    """
+    frame = sys._getframe(2)
+    depth = 0
+    while frame is not None and depth < MAX_STACK_DEPTH:
+        owner = frame.f_locals.get('self')
+        if isinstance(owner, Field) and not isinstance(owner, BaseSerializer):
+            parent = owner.parent
+            if isinstance(parent, BaseSerializer):
+                return f'{type(parent).__name__}.{owner.field_name}'
+            return owner.field_name
+        frame = frame.f_back
+        depth += 1
+    return None
+
+
+class QueryPatternDetector:
+    """
+    Контекстный менеджер: считает отпечатки SQL на всех подключениях.
+
+        with QueryPatternDetector(threshold=5) as detector:
+            client.get('/api/recipes/')
+        detector.violations()
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.counts = Counter()
+        self.fields = {}
+        self._wrappers = []
+
+    def __call__(self, execute, sql, params, many, context):
+        key = fingerprint(sql)
+        self.counts[key] += 1
+        if key not in self.fields:
+            self.fields[key] = serializer_field()
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        for connection in connections.all():
+            wrapper = connection.execute_wrapper(self)
+            wrapper.__enter__()
+            self._wrappers.append(wrapper)
+        return self
+
+    def __exit__(self, *exc_info):
+        while self._wrappers:
+            self._wrappers.pop().__exit__(*exc_info)
+
+    def violations(self):
+        """[(количество, поле, отпечаток)] для повторов выше порога."""
+        return [
+            (count, self.fields[key], key)
+            for key, count in self.counts.most_common()
+            if count >= self.threshold
+        ]
+
+    def report(self, label):
+        lines = [f'N+1 в {label}:']
+        for count, field, key in self.violations():
+            lines.append(f'  {count}× [{field or "вне сериализатора"}] {key}')
+        return '\n'.join(lines)
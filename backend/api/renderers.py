@@ -0,0 +1,37 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson, если он установлен; иначе — обычный
+    JSONRenderer на stdlib json.
+
+    Типы, которых orjson не знает (lazy-строки, Decimal, datetime и т.п.),
+    уходят в DRF JSONEncoder, так что вывод совпадает со стандартным.
+    Для `indent` (browsable API, `Accept: ...; indent=4`) используется
+    стандартный путь.
+    """
+    _options = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if orjson else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.get_indent(
+                accepted_media_type, renderer_context or {}) is not None):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data, default=self.encoder_class().default, option=self._options
+        )
+        # Как и JSONRenderer, экранируем U+2028/U+2029.
+        if b'\xe2\x80' in ret:
+            ret = (ret.replace(' '.encode(), b'\\u2028')
+                   .replace(' '.encode(), b'\\u2029'))
+        return ret
@@ -5,13 +5,19 @@ from rest_framework import serializers
 import base64
 from django.core.files.base import ContentFile
 from django.db import transaction
+from django.db.models import prefetch_related_objects
 import uuid
 
 from recipes.models import (
+    Favorite,
     Ingredient,
     Recipe,
     RecipeIngredient,
+    ShoppingCart,
 )
+from api.metrics import TimedSerializerMixin
+from recipes.catalogue import get_catalogue
+from recipes.signals import recipe_ingredients_changed
 from users.models import Follow, User
 
 MAX_AVATAR_SIZE_MB = 5
@@ -42,13 +48,76 @@ class PasswordSerializer(serializers.Serializer):
         return user
 
 
+def parse_sparse_fields(request):
+    """
+    Разбирает ?fields=a,b и ?expand=x,y.
+
+    Возвращает (fields, expand): fields — множество запрошенных полей или
+    None, если параметр не передан (нужны все поля); expand — вложенные
+    объекты, которые отдаются целиком.
+    """
+    if request is None:
+        return None, set()
+    params = getattr(request, "query_params", request.GET)
+
+    def split(name):
+        return {part.strip() for part in params.get(name, "").split(",")
+                if part.strip()}
+
+    fields = split("fields") if "fields" in params else None
+    return fields, split("expand")
+
+
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets: ?fields=a,b оставляет только перечисленные поля.
+    Вложенные объекты из compact_fields при этом отдаются в сокращённом
+    виде (без лишних запросов), если не перечислены в ?expand=. Без
+    ?fields ответ прежний.
+
+    Включается только аргументом sparse=True — его передают list и
+    retrieve представлений. Вложенные сериализаторы, в том числе
+    собранные вручную в SerializerMethodField, запрос не обрезает.
+    """
+    compact_fields = {}
+
+    def __init__(self, *args, sparse=False, **kwargs):
+        self.sparse = sparse
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.sparse:
+            return fields
+        wanted, expand = parse_sparse_fields(self.context.get("request"))
+        if wanted is None:
+            return fields
+        for name in list(fields):
+            if name not in wanted:
+                del fields[name]
+            elif name in self.compact_fields and name not in expand:
+                fields[name] = self.compact_fields[name]()
+        return fields
+
+
 class UserBasicSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ("id", "username", "first_name", "last_name", "email")
 
+    @classmethod
+    def lean(cls, user_ids):
+        """Облегчённый путь: {id: данные пользователя} одним запросом."""
+        return {
+            row["id"]: row
+            for row in User.objects.filter(pk__in=user_ids).values(
+                *cls.Meta.fields
+            )
+        }
+
 
-class CustomUserSerializer(serializers.ModelSerializer):
+class CustomUserSerializer(TimedSerializerMixin, SparseFieldsMixin,
+                           serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = serializers.SerializerMethodField()
 
@@ -70,6 +139,10 @@ class CustomUserSerializer(serializers.ModelSerializer):
         user = request.user if request else None
         if not (user and user.is_authenticated):
             return False
+        # Списки аннотируют флаг в queryset — без запроса на каждого автора.
+        subscribed = getattr(obj, "subscribed", None)
+        if subscribed is not None:
+            return subscribed
         return Follow.objects.filter(user=user, author=obj).exists()
 
     def get_avatar(self, obj):
@@ -80,8 +153,38 @@ class CustomUserSerializer(serializers.ModelSerializer):
             return obj.avatar.url
         return None
 
-
-class UserCreateResponseSerializer(serializers.ModelSerializer):
+    @classmethod
+    def lean(cls, user_ids, context):
+        """
+        Облегчённый путь: {id: данные пользователя} из строк .values(),
+        is_subscribed — одним запросом на всех.
+        """
+        request = context.get("request")
+        user = request.user if request else None
+        subscribed = set()
+        if user and user.is_authenticated:
+            subscribed = set(
+                Follow.objects.filter(user=user, author_id__in=user_ids)
+                .values_list("author_id", flat=True)
+            )
+        storage = User._meta.get_field("avatar").storage
+        result = {}
+        for row in User.objects.filter(pk__in=user_ids).values(
+            "id", "username", "first_name", "last_name", "email", "avatar"
+        ):
+            avatar = row.pop("avatar")
+            if avatar:
+                avatar = storage.url(avatar)
+                if request is not None:
+                    avatar = request.build_absolute_uri(avatar)
+            row["is_subscribed"] = row["id"] in subscribed
+            row["avatar"] = avatar or None
+            result[row["id"]] = row
+        return result
+
+
+class UserCreateResponseSerializer(TimedSerializerMixin,
+                                   serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ("id", "username", "first_name", "last_name", "email")
@@ -206,7 +309,8 @@ class SetAvatarSerializer(serializers.ModelSerializer):
         return instance
 
 
-class SetAvatarResponseSerializer(serializers.ModelSerializer):
+class SetAvatarResponseSerializer(TimedSerializerMixin,
+                                  serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ("avatar",)
@@ -249,7 +353,7 @@ class FollowSerializer(CustomUserSerializer):
         return RecipeShortSerializer(qs, many=True, context=self.context).data
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ("id", "name", "measurement_unit")
@@ -283,9 +387,61 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         model = RecipeIngredient
         fields = ("id", "name", "measurement_unit", "amount")
 
+    @classmethod
+    def lean(cls, recipe_ids):
+        """Облегчённый путь: {recipe_id: [ингредиенты]} одним запросом."""
+        result = {}
+        rows = (
+            RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+            .order_by("pk")
+            .values_list(
+                "recipe_id",
+                "ingredient_id",
+                "ingredient__name",
+                "ingredient__measurement_unit",
+                "amount",
+            )
+        )
+        for recipe_id, pk, name, unit, amount in rows:
+            result.setdefault(recipe_id, []).append(
+                {
+                    "id": pk,
+                    "name": name,
+                    "measurement_unit": unit,
+                    "amount": amount,
+                }
+            )
+        return result
+
+
+class IngredientIdField(serializers.Field):
+    """
+    id ингредиента без запроса к БД: существование проверяет
+    RecipeCreateSerializer.validate_ingredients. Ошибки для id не того
+    типа — те же, что у PrimaryKeyRelatedField.
+    """
+    default_error_messages = {
+        "incorrect_type": serializers.PrimaryKeyRelatedField
+        .default_error_messages["incorrect_type"],
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+    def to_representation(self, value):
+        return value
+
 
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    # Ингредиенты резолвятся разом в RecipeCreateSerializer
+    # .validate_ingredients (каталог или один in_bulk), а не по SELECT
+    # на строку.
+    id = IngredientIdField()
     amount = serializers.IntegerField(
         min_value=MIN_INGREDIENT_AMOUNT, max_value=MAX_INGREDIENT_AMOUNT
     )
@@ -295,7 +451,8 @@ class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
         fields = ("id", "amount")
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, SparseFieldsMixin,
+                       serializers.ModelSerializer):
     author = CustomUserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(
         source="recipe_ingredients", many=True, read_only=True
@@ -318,6 +475,12 @@ class RecipeSerializer(serializers.ModelSerializer):
             "cooking_time",
         )
 
+    # С ?fields=...,author автор отдаётся без is_subscribed и avatar,
+    # если не указан ?expand=author.
+    compact_fields = {
+        "author": lambda: UserBasicSerializer(read_only=True),
+    }
+
     def get_image(self, obj):
         if obj.image:
             request = self.context.get("request")
@@ -337,6 +500,79 @@ class RecipeSerializer(serializers.ModelSerializer):
             return False
         return obj.in_shopping_cart.filter(user=request.user).exists()
 
+    @classmethod
+    def lean(cls, recipe_ids, context):
+        """
+        То же, что RecipeSerializer(many=True).data, но словари строятся
+        прямо из строк .values(): фиксированное число запросов на страницу
+        и никаких экземпляров полей на каждый рецепт. Порядок — как в
+        recipe_ids. ?fields / ?expand учитываются так же, как в
+        SparseFieldsMixin, и лишние запросы не выполняются.
+        """
+        request = context.get("request")
+        user = request.user if request else None
+        wanted, expand = parse_sparse_fields(request)
+        names = [name for name in cls.Meta.fields
+                 if wanted is None or name in wanted]
+        columns = {"id"} | {
+            name for name in ("name", "image", "text", "cooking_time")
+            if name in names
+        }
+        if "author" in names:
+            columns.add("author_id")
+        recipes = {
+            row["id"]: row
+            for row in Recipe.objects.filter(pk__in=recipe_ids).values(
+                *columns
+            )
+        }
+
+        related = {}
+        if "author" in names:
+            author_ids = {row["author_id"] for row in recipes.values()}
+            if wanted is None or "author" in expand:
+                related["author"] = CustomUserSerializer.lean(
+                    author_ids, context)
+            else:
+                related["author"] = UserBasicSerializer.lean(author_ids)
+        if "ingredients" in names:
+            related["ingredients"] = RecipeIngredientSerializer.lean(
+                recipe_ids)
+        for name, model in (("is_favorited", Favorite),
+                            ("is_in_shopping_cart", ShoppingCart)):
+            if name not in names:
+                continue
+            related[name] = frozenset()
+            if user and user.is_authenticated:
+                related[name] = set(
+                    model.objects.filter(user=user, recipe_id__in=recipe_ids)
+                    .values_list("recipe_id", flat=True)
+                )
+        storage = Recipe._meta.get_field("image").storage
+
+        data = []
+        for pk in recipe_ids:
+            row = recipes.get(pk)
+            if row is None:
+                continue
+            item = {}
+            for name in names:
+                if name == "author":
+                    item[name] = related[name][row["author_id"]]
+                elif name == "ingredients":
+                    item[name] = related[name].get(pk, [])
+                elif name in related:
+                    item[name] = pk in related[name]
+                elif name == "image":
+                    item[name] = ""
+                    if row["image"] and request:
+                        item[name] = request.build_absolute_uri(
+                            storage.url(row["image"]))
+                else:
+                    item[name] = row[name]
+            data.append(item)
+        return data
+
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     ingredients = RecipeIngredientCreateSerializer(many=True)
@@ -352,6 +588,28 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     def validate_ingredients(self, value):
         if not value:
             raise serializers.ValidationError("Нужен хотя бы один ингредиент!")
+        ids = {item["id"] for item in value}
+        catalogue = get_catalogue()
+        found = (catalogue or Ingredient.objects).in_bulk(ids)
+        if catalogue is not None and len(found) < len(ids):
+            # Каталог мог ещё не увидеть ингредиент, добавленный в
+            # другом контейнере: недостающие id — из БД.
+            found.update(Ingredient.objects.in_bulk(ids - set(found)))
+        if len(found) < len(ids):
+            # Та же форма ошибки, что давал PrimaryKeyRelatedField,
+            # но сразу по всем отсутствующим id.
+            message = (serializers.PrimaryKeyRelatedField
+                       .default_error_messages["does_not_exist"])
+            raise serializers.ValidationError(
+                [
+                    {} if item["id"] in found
+                    else {"id": [serializers.ErrorDetail(
+                        message.format(pk_value=item["id"]),
+                        code="does_not_exist",
+                    )]}
+                    for item in value
+                ]
+            )
         seen = set()
         for item in value:
             ingr = item["id"]
@@ -360,25 +618,62 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                     "Ингредиенты не должны повторяться!"
                 )
             seen.add(ingr)
+            item["id"] = found[ingr]
         return value
 
-    def _create_recipe_ingredients(self, recipe, ingredients):
-        RecipeIngredient.objects.bulk_create(
-            [
-                RecipeIngredient(
+    def _sync_recipe_ingredients(self, recipe, ingredients):
+        """
+        Приводит ингредиенты рецепта к присланному списку минимальным
+        набором INSERT / UPDATE / DELETE. Возвращает True, если что-то
+        изменилось.
+        """
+        current = {
+            row.ingredient_id: row for row in recipe.recipe_ingredients.all()
+        }
+        before = set(current)
+        to_create, to_update = [], []
+        for ing in ingredients:
+            ingredient = ing["id"]
+            row = current.pop(ingredient.id, None)
+            if row is None:
+                to_create.append(
+                    RecipeIngredient(
+                        recipe=recipe,
+                        ingredient=ingredient,
+                        amount=ing["amount"],
+                    )
+                )
+            elif row.amount != ing["amount"]:
+                row.amount = ing["amount"]
+                to_update.append(row)
+
+        # В current остались строки, которых нет в запросе.
+        if current:
+            RecipeIngredient.objects.filter(
+                pk__in=[row.pk for row in current.values()]
+            ).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ["amount"])
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+
+        changed = bool(current or to_update or to_create)
+        if changed:
+            transaction.on_commit(
+                lambda: recipe_ingredients_changed.send(
+                    sender=Recipe,
                     recipe=recipe,
-                    ingredient=ing["id"],
-                    amount=ing["amount"],
+                    before=before,
+                    after={ing["id"].id for ing in ingredients},
                 )
-                for ing in ingredients
-            ]
-        )
+            )
+        return changed
 
     @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop("ingredients")
         recipe = Recipe.objects.create(**validated_data)
-        self._create_recipe_ingredients(recipe, ingredients)
+        self._sync_recipe_ingredients(recipe, ingredients)
         return recipe
 
     @transaction.atomic
@@ -388,15 +683,17 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 {"ingredients": "Поле ingredients обязательно!"}
             )
-        instance.recipe_ingredients.all().delete()
-        self._create_recipe_ingredients(instance, ingredients)
+        self._sync_recipe_ingredients(instance, ingredients)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        # Ответ не должен стоить по запросу на каждый ингредиент.
+        prefetch_related_objects([instance], "recipe_ingredients__ingredient")
         return RecipeSerializer(instance, context=self.context).data
 
 
-class RecipeShortLinkSerializer(serializers.ModelSerializer):
+class RecipeShortLinkSerializer(TimedSerializerMixin,
+                                serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ()
@@ -410,7 +707,8 @@ class RecipeShortLinkSerializer(serializers.ModelSerializer):
         return {"short-link": uri}
 
 
-class RecipeMinifiedSerializer(serializers.ModelSerializer):
+class RecipeMinifiedSerializer(TimedSerializerMixin,
+                               serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
 
     class Meta:
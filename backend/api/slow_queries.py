@@ -0,0 +1,148 @@
+"""
+Захват медленных SQL запросов вместе с планом выполнения.
+
+Включается настройкой SLOW_QUERY_MS: запросы дольше порога попадают в
+кольцевой буфер на SLOW_QUERY_BUFFER записей. Для SELECT к записи
+прикладывается план: EXPLAIN (ANALYZE, BUFFERS) на PostgreSQL (запрос
+выполняется повторно) или EXPLAIN QUERY PLAN на SQLite.
+
+Буфер лежит в кэше Django 'slow_queries' (слот = номер записи по модулю
+размера): в Redis или в файлах, общих для процессов контейнера. Его видят
+все воркеры, админский /api/slow-queries/ и команда dump_slow_queries.
+"""
+import logging
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, transaction
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+logger = logging.getLogger('api.slow_queries')
+
+SEQUENCE_KEY = 'slow_queries:seq'
+SLOT_KEY = 'slow_queries:{}'
+TTL = 24 * 60 * 60
+
+_local = threading.local()
+
+# Обёртки вокруг каждого запроса, а не его источник.
+_SKIP_ORIGIN = {'api/middleware.py', 'api/metrics.py', 'api/nplusone.py',
+                'api/slow_queries.py'}
+
+
+def _cache():
+    return caches['slow_queries']
+
+
+def _slot_keys():
+    return [SLOT_KEY.format(slot)
+            for slot in range(settings.SLOW_QUERY_BUFFER)]
+
+
+def _origin():
+    """Ближайший к запросу кадр кода проекта, а не Django и библиотек."""
+    root = str(settings.BASE_DIR) + '/'
+    for frame in reversed(traceback.extract_stack()):
+        if (not frame.filename.startswith(root)
+                or 'site-packages' in frame.filename):
+            continue
+        path = frame.filename[len(root):]
+        if path not in _SKIP_ORIGIN:
+            return f'{path}:{frame.lineno} {frame.name}'
+    return None
+
+
+def explain(connection, sql, params):
+    """План запроса или None, если база или запрос не поддерживаются."""
+    if sql.lstrip()[:6].upper() != 'SELECT':
+        return None
+    if connection.vendor == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) '
+    elif connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        return None
+    _local.explaining = True
+    try:
+        # Точка сохранения: ошибка EXPLAIN не должна ломать транзакцию
+        # самого запроса.
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                rows = cursor.fetchall()
+    except DatabaseError as error:
+        return f'EXPLAIN не удался: {error}'
+    finally:
+        _local.explaining = False
+    if connection.vendor == 'sqlite':
+        return '\n'.join(f'{row[0]}|{row[1]}| {row[-1]}' for row in rows)
+    return '\n'.join(row[0] for row in rows)
+
+
+def record(entry):
+    cache = _cache()
+    try:
+        seq = cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        cache.add(SEQUENCE_KEY, 0, None)
+        seq = cache.incr(SEQUENCE_KEY)
+    entry['seq'] = seq
+    cache.set(SLOT_KEY.format(seq % settings.SLOW_QUERY_BUFFER), entry, TTL)
+
+
+def captures():
+    """Записи буфера, от новых к старым."""
+    entries = _cache().get_many(_slot_keys()).values()
+    return sorted(entries, key=lambda entry: entry['seq'], reverse=True)
+
+
+def clear():
+    _cache().delete_many(_slot_keys() + [SEQUENCE_KEY])
+
+
+class SlowQueryCapture:
+    """execute_wrapper подключения: пишет в буфер запросы дольше порога."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_local, 'explaining', False):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - started) * 1e3
+        if duration >= settings.SLOW_QUERY_MS:
+            try:
+                record({
+                    'captured_at': timezone.now().isoformat(),
+                    'alias': self.connection.alias,
+                    'duration_ms': round(duration, 2),
+                    'sql': sql,
+                    'params': repr(params)[:1000],
+                    'origin': _origin(),
+                    'plan': None if many else explain(
+                        self.connection, sql, params),
+                })
+            except Exception:
+                # Диагностика не должна ронять сам запрос.
+                logger.exception('Не удалось сохранить медленный запрос')
+        return result
+
+
+def _install(sender, connection, **kwargs):
+    # Сигнал приходит на каждое переподключение того же DatabaseWrapper.
+    if not any(isinstance(wrapper, SlowQueryCapture)
+               for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.insert(0, SlowQueryCapture(connection))
+
+
+def install():
+    """Подключает захват ко всем новым подключениям, если он включён."""
+    if settings.SLOW_QUERY_MS:
+        connection_created.connect(
+            _install, dispatch_uid='api.slow_queries')
@@ -0,0 +1,1538 @@
+import gzip
+import io
+import itertools
+import json
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api import facets, metrics, slow_queries, sync, throttling
+from api.management.commands.bench_ingredient_search import (
+    BUDGET_MS, make_cases, measure)
+from api.middleware import (CompressionMiddleware, ReplicaRoutingMiddleware,
+                            brotli)
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeCreateSerializer, RecipeSerializer
+from foodgram import db_router
+from foodgram.db_router import ReplicaRouter
+from recipes import catalogue, trending
+from recipes.changelog import ChangeFeed, mark_changed
+from recipes.fuzzy import FuzzyIndex
+from recipes.ingredient_index import IngredientIndex
+from recipes.models import (Favorite, Ingredient, IngredientPair, Recipe,
+                            RecipeIngredient, RecipeTombstone,
+                            RecipeTrending, RecommendationNeighbours,
+                            Recommendations, ShoppingCart, SimilarRecipes,
+                            TrendingState)
+from recipes.recommender import recommend_from
+from recipes.signals import recipe_ingredients_changed
+from users.models import AuthorSuggestions, Follow, User
+from users.suggestions import POPULAR_KEY
+
+
+def make_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        password='password', first_name=username, last_name=username)
+
+
+def auth_client(user):
+    client = APIClient()
+    token, _ = Token.objects.get_or_create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+class ToggleRaceTests(TransactionTestCase):
+    """
+    Избранное, корзина и подписка: одновременные запросы к одной паре
+    дают ровно один успех, остальные — 400, но не 500 (unique_* и число
+    строк DELETE вместо проверки exists()).
+    """
+    THREADS = 8
+
+    def setUp(self):
+        self.user = make_user('reader')
+        self.author = make_user('author')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Текст',
+            image='recipes/images/test.png', cooking_time=10)
+        # Токен создаём заранее: get_or_create в потоках сам по себе гонка.
+        Token.objects.get_or_create(user=self.user)
+
+    def race(self, method, url):
+        """Коды ответов THREADS одновременных запросов, по возрастанию."""
+        barrier = threading.Barrier(self.THREADS)
+        codes = []
+
+        def request():
+            client = auth_client(self.user)
+            try:
+                barrier.wait()
+                codes.append(getattr(client, method)(url).status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=request)
+                   for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(codes)
+
+    def assert_toggle(self, url, model, **pair):
+        self.assertEqual(self.race('post', url),
+                         [201] + [400] * (self.THREADS - 1))
+        self.assertEqual(model.objects.filter(**pair).count(), 1)
+        self.assertEqual(self.race('delete', url),
+                         [204] + [400] * (self.THREADS - 1))
+        self.assertFalse(model.objects.filter(**pair).exists())
+
+    def test_favorite(self):
+        self.assert_toggle(f'/api/recipes/{self.recipe.pk}/favorite/',
+                           Favorite, user=self.user, recipe=self.recipe)
+
+    def test_shopping_cart(self):
+        self.assert_toggle(f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+                           ShoppingCart, user=self.user, recipe=self.recipe)
+
+    def test_subscribe(self):
+        self.assert_toggle(f'/api/users/{self.author.pk}/subscribe/',
+                           Follow, user=self.user, author=self.author)
+
+    def test_delete_twice(self):
+        client = auth_client(self.user)
+        url = f'/api/recipes/{self.recipe.pk}/favorite/'
+        self.assertEqual(client.post(url).status_code, 201)
+        self.assertEqual(client.delete(url).status_code, 204)
+        self.assertEqual(client.delete(url).status_code, 400)
+
+
+@override_settings(
+    NPLUSONE_MODE='raise',
+    NPLUSONE_SAMPLE_RATE=1.0,
+    NPLUSONE_THRESHOLD=5,
+    # Индексы и каталог в памяти выключены: проверяются SQL-пути.
+    INGREDIENT_CATALOGUE_PATH='',
+    RECIPE_CHANGELOG_PATH='',
+)
+class NPlusOneTests(TestCase):
+    """
+    Списочные эндпоинты на данных, где объектов больше порога
+    NPLUSONE_THRESHOLD: запрос в цикле по объектам (N+1) поднимает
+    NPlusOneError из QueryPatternMiddleware (api.nplusone).
+    """
+    COUNT = 12
+    ENDPOINTS = [
+        '/api/recipes/',
+        '/api/recipes/?is_favorited=1',
+        '/api/recipes/?is_in_shopping_cart=1',
+        '/api/recipes/?fields=id,name,author,is_favorited',
+        '/api/recipes/?ingredients={ingredient}',
+        '/api/recipes/?ordering=trending',
+        '/api/recipes/pantry/?ingredients={ingredients}',
+        '/api/recipes/recommended/',
+        '/api/recipes/{recipe}/similar/',
+        '/api/recipes/facets/',
+        '/api/recipes/changes/',
+        '/api/users/',
+        '/api/users/subscriptions/',
+        '/api/users/subscriptions/?recipes_limit=2',
+        '/api/users/suggestions/',
+        '/api/ingredients/',
+        '/api/ingredients/?name=а',
+        '/api/ingredients/?name=nplusone&fuzzy=1',
+        '/api/ingredients/suggest/?ingredients={ingredient}',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = make_user('nplusone_reader')
+        authors = User.objects.bulk_create(
+            User(username=f'nplusone_{i}', email=f'nplusone_{i}@example.com',
+                 avatar=f'users/avatars/{i}.png')
+            for i in range(cls.COUNT)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'а nplusone {i}', measurement_unit='г')
+            for i in range(3)
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {i}', text='Описание',
+                   image='recipes/images/nplusone.png', cooking_time=10,
+                   short_url=f'np{i:06d}')
+            for i, author in enumerate(authors * 2)
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in recipes for ingredient in ingredients
+        )
+        # Читатель подписан на половину авторов, авторы — друг на друга:
+        # у /api/users/suggestions/ есть что подсказать.
+        Follow.objects.bulk_create(
+            [Follow(user=cls.reader, author=author)
+             for author in authors[:cls.COUNT // 2]]
+            + [Follow(user=author, author=other)
+               for author in authors for other in authors
+               if author != other])
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.reader, recipe=recipe) for recipe in recipes)
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.reader, recipe=recipe)
+            for recipe in recipes)
+        Recommendations.objects.create(
+            user=cls.reader,
+            recipes=[[recipe.pk, 1.0] for recipe in recipes])
+        SimilarRecipes.objects.create(
+            recipe=recipes[0], signature='nplusone',
+            neighbours=[[recipe.pk, 0.5] for recipe in recipes[1:]])
+        IngredientPair.objects.bulk_create(
+            IngredientPair(ingredient=first, other=second, count=1)
+            for first in ingredients for second in ingredients
+            if first != second)
+        cls.params = {
+            'recipe': recipes[0].pk,
+            'ingredient': ingredients[0].pk,
+            'ingredients': ','.join(str(item.pk) for item in ingredients),
+        }
+
+    def check_endpoints(self, client, anonymous):
+        for url in self.ENDPOINTS:
+            url = url.format(**self.params)
+            with self.subTest(url=url, anonymous=anonymous):
+                response = client.get(url)
+                if anonymous and response.status_code == 401:
+                    continue
+                self.assertEqual(response.status_code, 200)
+
+    def test_anonymous(self):
+        self.check_endpoints(APIClient(), anonymous=True)
+
+    def test_authenticated(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        self.check_endpoints(client, anonymous=False)
+
+
+class SlowQueryTests(TestCase):
+    """Буфер api.slow_queries общий для процессов, а не LocMem воркера."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        override = override_settings(SLOW_QUERY_MS=0, CACHES={
+            **settings.CACHES,
+            'slow_queries': {
+                'BACKEND': 'django.core.cache.backends.filebased'
+                           '.FileBasedCache',
+                'LOCATION': self.directory,
+            },
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_capture_visible_to_other_process(self):
+        capture = slow_queries.SlowQueryCapture(connection)
+        with connection.execute_wrapper(capture):
+            list(Recipe.objects.filter(name='slow_queries'))
+        # Отдельный экземпляр бэкенда поверх тех же файлов — так буфер
+        # видят другие воркеры и dump_slow_queries.
+        other = FileBasedCache(self.directory, {})
+        entries = [other.get(slow_queries.SLOT_KEY.format(seq))
+                   for seq in range(1, other.get(
+                       slow_queries.SEQUENCE_KEY) + 1)]
+        self.assertTrue(any('slow_queries' in entry['params']
+                            and entry['plan'] for entry in entries))
+        self.assertEqual([entry['seq'] for entry in entries][::-1],
+                         [entry['seq'] for entry in slow_queries.captures()])
+
+    def test_capture_does_not_write_to_database(self):
+        capture = slow_queries.SlowQueryCapture(connection)
+        with connection.execute_wrapper(capture):
+            with CaptureQueriesContext(connection) as queries:
+                list(Recipe.objects.filter(name='slow_queries'))
+        # Сам запрос и его EXPLAIN, без записи буфера в таблицу кэша.
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'django_cache' in query['sql']])
+        self.assertTrue(slow_queries.captures())
+
+
+class TokenBucketTests(TestCase):
+    """
+    Корзины api.throttling: 'local' всегда, 'redis' — если задан
+    REDIS_URL. Ключи с случайным префиксом: Redis общий между запусками.
+    """
+    STORES = ['local'] + (['redis'] if settings.REDIS_URL else [])
+    NOW = 1_000_000.0
+
+    def setUp(self):
+        patcher = mock.patch.dict(
+            throttling.STORES, {'local': throttling.LocalBucketStore()})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.prefix = uuid.uuid4().hex
+
+    def test_exhaustion_and_refill(self):
+        for name in self.STORES:
+            store = throttling.STORES[name]
+            with self.subTest(store=name):
+                # Объём 3, пополнение — токен в 2 секунды.
+                key = f'{self.prefix}:{name}:key'
+                results = [store.consume(key, 3, 0.5, self.NOW)
+                           for _ in range(4)]
+                self.assertEqual([allowed for allowed, _ in results],
+                                 [True, True, True, False])
+                self.assertAlmostEqual(results[-1][1], 2.0)
+                self.assertEqual(store.consume(key, 3, 0.5, self.NOW + 1),
+                                 (False, 1.0))
+                self.assertEqual(store.consume(key, 3, 0.5, self.NOW + 2)[0],
+                                 True)
+                # Полная корзина не копит токены сверх объёма.
+                later = self.NOW + 3600
+                self.assertEqual(
+                    [store.consume(key, 3, 0.5, later)[0]
+                     for _ in range(4)],
+                    [True, True, True, False])
+
+    def test_keys_are_independent(self):
+        for name in self.STORES:
+            store = throttling.STORES[name]
+            first, second = (f'{self.prefix}:{name}:{key}'
+                             for key in ('first', 'second'))
+            with self.subTest(store=name):
+                store.consume(first, 1, 1, self.NOW)
+                self.assertFalse(store.consume(first, 1, 1, self.NOW)[0])
+                self.assertTrue(store.consume(second, 1, 1, self.NOW)[0])
+
+    def test_no_database_queries(self):
+        for name in self.STORES:
+            store = throttling.STORES[name]
+            with self.subTest(store=name), self.assertNumQueries(0):
+                for _ in range(3):
+                    store.consume(f'{self.prefix}:{name}', 1, 1, self.NOW)
+
+    def test_default_store(self):
+        self.assertEqual(settings.THROTTLE_STORE,
+                         'redis' if settings.REDIS_URL else 'local')
+
+    def test_too_many_requests(self):
+        rates = {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'],
+                 'anon': '3/min'}
+        rest_framework = {**settings.REST_FRAMEWORK,
+                          'DEFAULT_THROTTLE_RATES': rates}
+        timer = mock.Mock(return_value=self.NOW)
+        for name in self.STORES:
+            with self.subTest(store=name), override_settings(
+                    THROTTLE_STORE=name, REST_FRAMEWORK=rest_framework), \
+                    mock.patch.object(throttling.TokenBucketThrottle,
+                                      'timer', timer):
+                client = APIClient(REMOTE_ADDR='10.{}.{}.{}'.format(
+                    *uuid.uuid4().bytes[:3]))
+                timer.return_value = self.NOW
+                codes = [client.get('/api/ingredients/').status_code
+                         for _ in range(4)]
+                self.assertEqual(codes, [200, 200, 200, 429])
+                response = client.get('/api/ingredients/')
+                self.assertEqual(response.status_code, 429)
+                self.assertEqual(response['Retry-After'], '20')
+                timer.return_value = self.NOW + 20
+                self.assertEqual(
+                    client.get('/api/ingredients/').status_code, 200)
+
+    def test_forwarded_for_is_not_trusted_by_default(self):
+        rates = {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'],
+                 'anon': '1/min'}
+        with override_settings(
+                THROTTLE_STORE='local', REST_FRAMEWORK={
+                    **settings.REST_FRAMEWORK,
+                    'DEFAULT_THROTTLE_RATES': rates}):
+            client = APIClient(REMOTE_ADDR='10.255.0.1')
+            codes = [client.get('/api/ingredients/',
+                                HTTP_X_FORWARDED_FOR=f'192.0.2.{i}')
+                     .status_code for i in range(2)]
+        # Подменённый X-Forwarded-For не даёт новой корзины.
+        self.assertEqual(codes, [200, 429])
+
+
+@override_settings(FACETS_TTL=0)
+class FacetTests(TestCase):
+    """/api/recipes/facets/ по индексу ингредиентов и через SQL."""
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = [make_user(f'facets_{i}') for i in range(2)]
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'facets {i}', measurement_unit='г')
+            for i in range(4))
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=authors[i % 2], name=f'Рецепт {i}', text='Описание',
+                   image='recipes/images/facets.png', cooking_time=5 + 20 * i,
+                   short_url=f'fc{i:06d}')
+            for i in range(6))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for i, recipe in enumerate(recipes)
+            for j, ingredient in enumerate(cls.ingredients)
+            if (i + j) % 3)
+        cls.author = authors[0]
+
+    def facets(self, url, index):
+        with mock.patch('api.views.get_ingredient_index',
+                        return_value=index):
+            with CaptureQueriesContext(connection) as queries:
+                response = APIClient().get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [query['sql']
+                                 for query in queries.captured_queries]
+
+    def test_index_matches_sql(self):
+        index = IngredientIndex()
+        index.build(
+            RecipeIngredient.objects.order_by('recipe_id')
+            .values_list('ingredient_id', 'recipe_id'),
+            Recipe.objects.order_by('pk').values_list('pk', 'pub_date'))
+        first, second, third = (item.pk for item in self.ingredients[:3])
+        queries = ['', f'ingredients={first}',
+                   f'ingredients={first},{second}',
+                   f'exclude_ingredients={third}',
+                   f'ingredients={first}&exclude_ingredients={second}',
+                   f'ingredients={second}&author={self.author.pk}']
+        # 0 — любое совпадение индекса считается «большим».
+        for limit, query in itertools.product(
+                (facets.MATCHED_IN_LIMIT, 0), queries):
+            url = f'/api/recipes/facets/?{query}'
+            with self.subTest(query=query, limit=limit), mock.patch.object(
+                    facets, 'MATCHED_IN_LIMIT', limit):
+                expected, _ = self.facets(url, None)
+                data, sql = self.facets(url, index)
+                self.assertEqual(data, expected)
+                self.assertFalse([statement for statement in sql
+                                  if 'recipes_recipeingredient' in statement])
+                # Большое множество совпадений не уходит в SQL списком IN,
+                # небольшое — уходит вместо прохода по всем рецептам.
+                in_list = [statement for statement in sql
+                           if '"recipes_recipe"."id" IN' in statement]
+                if 'ingredients' not in query:
+                    self.assertFalse(in_list)
+                else:
+                    self.assertEqual(bool(in_list), bool(limit))
+
+
+class AuthorSuggestionTests(TestCase):
+    """
+    Подписка и отписка только помечают подсказки stale (после коммита),
+    пересчёт — в build_author_suggestions --stale, тем же FollowGraph.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.first, cls.second, cls.third = (
+            make_user(f'suggest_{i}') for i in range(4))
+        Follow.objects.bulk_create([
+            Follow(user=cls.reader, author=cls.first),
+            Follow(user=cls.first, author=cls.second),
+            Follow(user=cls.first, author=cls.third),
+        ])
+
+    def suggestions(self, user=None):
+        client = APIClient()
+        client.force_authenticate(user or self.reader)
+        response = client.get('/api/users/suggestions/')
+        self.assertEqual(response.status_code, 200)
+        return [(item['id'], item['mutual'])
+                for item in response.json()['results']]
+
+    def test_subscribe_marks_stale_without_graph_query(self):
+        client = auth_client(self.reader)
+        call_command('build_author_suggestions', stdout=io.StringIO())
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                response = client.post(
+                    f'/api/users/{self.second.pk}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        # Ни одного GROUP BY по Follow (второго шага графа) в запросе.
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if 'users_follow' in query['sql'] and 'GROUP BY' in query['sql']])
+        self.assertTrue(AuthorSuggestions.objects.get(user=self.reader).stale)
+        # До пересчёта уже подписанный автор не подсказывается.
+        self.assertEqual(self.suggestions(), [(self.third.pk, 1)])
+
+    def test_without_row_popular_authors_are_suggested(self):
+        cache.delete(POPULAR_KEY)
+        # second ни на кого не подписан, reader подписан на first;
+        # строк AuthorSuggestions ещё нет.
+        self.assertEqual(self.suggestions(self.second),
+                         [(self.first.pk, 0), (self.third.pk, 0)])
+        self.assertEqual(self.suggestions(),
+                         [(self.second.pk, 0), (self.third.pk, 0)])
+
+    def test_unsubscribe_marks_stale_on_commit(self):
+        call_command('build_author_suggestions', stdout=io.StringIO())
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = auth_client(self.reader).delete(
+                f'/api/users/{self.first.pk}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(
+            AuthorSuggestions.objects.get(user=self.reader).stale)
+        for callback in callbacks:
+            callback()
+        self.assertTrue(AuthorSuggestions.objects.get(user=self.reader).stale)
+
+    def test_deleting_follower_cascades(self):
+        call_command('build_author_suggestions', stdout=io.StringIO())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reader.delete()
+        self.assertFalse(
+            AuthorSuggestions.objects.filter(user=self.reader).exists())
+
+    def test_stale_run_matches_full_run(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(user=self.reader, author=self.second)
+        row = AuthorSuggestions.objects.get(user=self.reader)
+        self.assertEqual((row.authors, row.stale), ([], True))
+        call_command('build_author_suggestions', stale=True,
+                     stdout=io.StringIO())
+        row.refresh_from_db()
+        self.assertEqual((row.authors, row.stale),
+                         ([[self.third.pk, 1]], False))
+        call_command('build_author_suggestions', stdout=io.StringIO())
+        self.assertEqual(
+            AuthorSuggestions.objects.get(user=self.reader).authors,
+            row.authors)
+
+
+class RecipeChangelogTests(TransactionTestCase):
+    """
+    Журнал recipes.changelog получает рецепт, только когда меняется его
+    состав или рецепт удалён: индексы в памяти строятся по составу.
+    Записи в журнал идут после настоящего коммита.
+    """
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        override = override_settings(
+            RECIPE_CHANGELOG_PATH=f'{directory}/recipes.changelog')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.author = make_user('changelog')
+        self.ingredient = Ingredient.objects.create(
+            name='changelog', measurement_unit='г')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Текст',
+            image='recipes/images/changelog.png', cooking_time=10)
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=1)
+        self.feed = ChangeFeed()
+        self.feed.sync()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def patch(self, **data):
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/', {
+                'ingredients': [{'id': self.ingredient.pk, 'amount': 1}],
+                **data,
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        return self.feed.poll()
+
+    def test_field_edit_is_not_logged(self):
+        self.assertEqual(self.patch(name='Новое название'), set())
+
+    def test_ingredient_change_is_logged(self):
+        self.assertEqual(
+            self.patch(ingredients=[{'id': self.ingredient.pk,
+                                     'amount': 2}]),
+            {self.recipe.pk})
+
+    def test_delete_is_logged(self):
+        response = self.client.delete(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.feed.poll(), {self.recipe.pk})
+
+
+@override_settings(INGREDIENT_CATALOGUE_PATH='')
+class SparseFieldsTests(TestCase):
+    """
+    ?fields= / ?expand= обрезают только list и retrieve; ответы на запись
+    и вложенные сериализаторы не меняются.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('sparse')
+        cls.ingredient = Ingredient.objects.create(
+            name='sparse', measurement_unit='г')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст',
+            image='recipes/images/sparse.png', cooking_time=10)
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [query['sql']
+                                 for query in queries.captured_queries]
+
+    def test_retrieve(self):
+        data, sql = self.get(f'/api/recipes/{self.recipe.pk}/?fields=id,name')
+        self.assertEqual(data, {'id': self.recipe.pk, 'name': 'Рецепт'})
+        self.assertFalse([statement for statement in sql
+                          if 'recipes_recipeingredient' in statement
+                          or '"users_user"."username"' in statement])
+
+    def test_list_compact_and_expanded_author(self):
+        data, _ = self.get('/api/recipes/?fields=id,author')
+        self.assertEqual(set(data['results'][0]), {'id', 'author'})
+        self.assertNotIn('is_subscribed', data['results'][0]['author'])
+        data, _ = self.get('/api/recipes/?fields=id,author&expand=author')
+        self.assertIn('is_subscribed', data['results'][0]['author'])
+
+    def test_users_list_skips_subscribed_annotation(self):
+        data, sql = self.get('/api/users/?fields=id,username')
+        self.assertEqual(set(data['results'][0]), {'id', 'username'})
+        self.assertFalse([statement for statement in sql
+                          if 'users_follow' in statement])
+
+    def test_write_response_is_not_trimmed(self):
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/?fields=id', {
+                'ingredients': [{'id': self.ingredient.pk, 'amount': 2}],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {
+            'id', 'author', 'ingredients', 'is_favorited',
+            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'})
+
+    def test_nested_serializer_is_not_trimmed(self):
+        reader = make_user('sparse_reader')
+        Follow.objects.create(user=reader, author=self.author)
+        self.client.force_authenticate(reader)
+        data, _ = self.get('/api/users/subscriptions/?fields=id,recipes')
+        item = data['results'][0]
+        self.assertEqual(set(item), {'id', 'recipes'})
+        self.assertEqual(set(item['recipes'][0]),
+                         {'id', 'name', 'image', 'cooking_time'})
+
+
+@override_settings(INGREDIENT_CATALOGUE_PATH='', RECIPE_CHANGELOG_PATH='')
+class LeanRecipeSerializerTests(TestCase):
+    """
+    RecipeSerializer.lean (список /api/recipes/) побайтно совпадает с
+    RecipeSerializer: анонимно и с авторизацией, автор с аватаром и без,
+    с ?fields= / ?expand= и без.
+    """
+    QUERIES = ['', '?fields=id,author,is_favorited,image',
+               '?fields=id,author,is_in_shopping_cart&expand=author']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = make_user('lean_reader')
+        with_avatar = make_user('lean_avatar')
+        with_avatar.avatar = 'users/avatars/lean.png'
+        with_avatar.save()
+        without_avatar = make_user('lean_plain')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'lean {i}', measurement_unit='г')
+            for i in range(3))
+        recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {i}', text='Текст ',
+                image='' if i == 3 else 'recipes/images/lean.png',
+                cooking_time=10 + i)
+            for i, author in enumerate(
+                [with_avatar, without_avatar, with_avatar, without_avatar])
+        ]
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=i + j + 1)
+            for i, recipe in enumerate(recipes)
+            for j, ingredient in enumerate(reversed(ingredients[:i + 1])))
+        Follow.objects.create(user=cls.reader, author=with_avatar)
+        Favorite.objects.create(user=cls.reader, recipe=recipes[0])
+        ShoppingCart.objects.create(user=cls.reader, recipe=recipes[1])
+        cls.ids = [recipe.pk for recipe in reversed(recipes)]
+
+    def render(self, user, query):
+        request = Request(APIRequestFactory().get(f'/api/recipes/{query}'))
+        request.user = user
+        context = {'request': request}
+        recipes = {
+            recipe.pk: recipe for recipe in
+            Recipe.objects.filter(pk__in=self.ids).select_related('author')
+            .prefetch_related('recipe_ingredients__ingredient')
+        }
+        full = RecipeSerializer(
+            [recipes[pk] for pk in self.ids], many=True, sparse=True,
+            context=context).data
+        renderer = FastJSONRenderer()
+        return (renderer.render(RecipeSerializer.lean(self.ids, context)),
+                renderer.render(full))
+
+    def test_matches_serializer(self):
+        for user in (AnonymousUser(), self.reader):
+            for query in self.QUERIES:
+                with self.subTest(user=user, query=query):
+                    lean, full = self.render(user, query)
+                    self.assertEqual(lean, full)
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'нужна реплика: DB_REPLICAS')
+@override_settings(INGREDIENT_CATALOGUE_PATH='', RECIPE_CHANGELOG_PATH='')
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    foodgram.db_router и ReplicaRoutingMiddleware на двух базах. Локально
+    (и в CI) — две SQLite:
+
+        DB_ENGINE=django.db.backends.sqlite3 DB_NAME=/tmp/primary.sqlite3 \\
+        DB_REPLICAS=/tmp/replica.sqlite3 \\
+        python manage.py test api.tests.ReplicaRoutingTests
+
+    Реплика в тестах — зеркало default (TEST.MIRROR), поэтому данные
+    общие, а куда ушёл запрос, видно по журналу запросов подключения.
+    Остальные тесты с DB_REPLICAS не запускаются: TestCase не
+    коммитит, и реплика не видит их данных.
+    """
+    databases = {'default', *settings.DATABASE_REPLICAS}
+
+    def setUp(self):
+        self.user = make_user('replica')
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Текст',
+            image='recipes/images/replica.png', cooking_time=10)
+        self.client = auth_client(self.user)
+
+    def queries(self, table, func):
+        """(результат func(), {alias: число запросов к table})."""
+        contexts = {alias: CaptureQueriesContext(connections[alias])
+                    for alias in self.databases}
+        for context in contexts.values():
+            context.__enter__()
+        try:
+            result = func()
+        finally:
+            for context in contexts.values():
+                context.__exit__(None, None, None)
+        return result, {
+            alias: sum(f'"{table}"' in query['sql']
+                       for query in context.captured_queries)
+            for alias, context in contexts.items()
+        }
+
+    def recipe_queries(self, method, url):
+        """(код ответа, {alias: число запросов к recipes_recipe})."""
+        response, counts = self.queries(
+            'recipes_recipe', lambda: getattr(self.client, method)(url))
+        return response.status_code, counts
+
+    def replica_reads(self, counts):
+        return sum(counts[alias] for alias in settings.DATABASE_REPLICAS)
+
+    def test_reads_go_to_replica(self):
+        code, counts = self.recipe_queries(
+            'get', f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(code, 200)
+        self.assertTrue(self.replica_reads(counts))
+        self.assertEqual(counts['default'], 0)
+
+    def test_writes_and_sticky_reads_go_to_primary(self):
+        code, counts = self.recipe_queries(
+            'post', f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertEqual(code, 201)
+        self.assertEqual(self.replica_reads(counts), 0)
+        self.assertTrue(Favorite.objects.using('default').exists())
+        # В окне REPLICA_STICKY_SECONDS тот же клиент читает из primary.
+        code, counts = self.recipe_queries(
+            'get', f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(code, 200)
+        self.assertEqual(self.replica_reads(counts), 0)
+        self.assertTrue(counts['default'])
+        # Другой клиент по-прежнему читает с реплики.
+        self.client = APIClient()
+        _, counts = self.recipe_queries(
+            'get', f'/api/recipes/{self.recipe.pk}/')
+        self.assertTrue(self.replica_reads(counts))
+
+    def test_catalogue_rebuild_reads_primary(self):
+        Ingredient.objects.create(name='replica', measurement_unit='г')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with override_settings(
+                INGREDIENT_CATALOGUE_PATH=f'{directory}/catalogue'), \
+                db_router.replica_reads():
+            _, counts = self.queries(
+                'recipes_ingredient',
+                lambda: catalogue.rebuild_catalogue(force=True))
+        self.assertEqual(self.replica_reads(counts), 0)
+        self.assertTrue(counts['default'])
+
+    def test_ingredient_index_reads_primary(self):
+        ingredient = Ingredient.objects.create(
+            name='replica', measurement_unit='г')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with override_settings(
+                RECIPE_CHANGELOG_PATH=f'{directory}/recipes.changelog'):
+            index = IngredientIndex()
+
+            def refresh():
+                with db_router.replica_reads():
+                    _, counts = self.queries(
+                        'recipes_recipeingredient', index.refresh)
+                self.assertEqual(self.replica_reads(counts), 0)
+                self.assertTrue(counts['default'])
+
+            refresh()
+            RecipeIngredient.objects.create(
+                recipe=self.recipe, ingredient=ingredient, amount=1)
+            mark_changed(self.recipe.pk)
+            # Второй refresh дочитывает журнал (_apply).
+            with mock.patch.object(index, '_load',
+                                   side_effect=AssertionError):
+                refresh()
+            self.assertTrue(index.loaded)
+
+    def test_context_is_reset_between_requests(self):
+        self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertFalse(db_router._read_from_replica.get())
+        self.assertIsNone(ReplicaRouter().db_for_read(Recipe))
+
+        def fail(request):
+            self.assertTrue(db_router._read_from_replica.get())
+            raise RuntimeError
+
+        request = APIRequestFactory().get('/api/recipes/')
+        with self.assertRaises(RuntimeError):
+            ReplicaRoutingMiddleware(fail)(request)
+        self.assertFalse(db_router._read_from_replica.get())
+
+
+@override_settings(INGREDIENT_CATALOGUE_PATH='', RECIPE_CHANGELOG_PATH='')
+class RecipeIngredientSyncTests(TestCase):
+    """
+    RecipeCreateSerializer меняет состав разницей INSERT / UPDATE /
+    DELETE и после коммита шлёт recipe_ingredients_changed — только если
+    состав изменился.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('sync')
+        cls.first, cls.second = Ingredient.objects.bulk_create(
+            Ingredient(name=f'sync {i}', measurement_unit='г')
+            for i in range(2))
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст',
+            image='recipes/images/sync.png', cooking_time=10)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=cls.recipe, ingredient=ingredient,
+                             amount=1)
+            for ingredient in (cls.first, cls.second))
+
+    def setUp(self):
+        self.sent = []
+
+        def receiver(**kwargs):
+            self.sent.append(kwargs)
+
+        recipe_ingredients_changed.connect(receiver, weak=False)
+        self.addCleanup(recipe_ingredients_changed.disconnect, receiver)
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def patch(self, amounts):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.pk}/', {'ingredients': [
+                    {'id': ingredient.pk, 'amount': amount}
+                    for ingredient, amount in amounts]}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def amounts(self):
+        return dict(self.recipe.recipe_ingredients
+                    .values_list('ingredient_id', 'amount'))
+
+    def test_unchanged_sends_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.patch([(self.first, 1), (self.second, 1)])
+        self.assertEqual(self.sent, [])
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+            and 'recipes_recipeingredient' in query['sql']])
+
+    def test_changed_amount_sends_once(self):
+        self.patch([(self.first, 5), (self.second, 1)])
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(
+            (self.sent[0]['before'], self.sent[0]['after']),
+            ({self.first.pk, self.second.pk},
+             {self.first.pk, self.second.pk}))
+        self.assertEqual(self.amounts(),
+                         {self.first.pk: 5, self.second.pk: 1})
+
+    def test_removed_row_single_delete(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.patch([(self.first, 1)])
+        table = 'recipes_recipeingredient'
+        self.assertEqual(len([
+            query for query in queries.captured_queries
+            if query['sql'].startswith('DELETE') and table in query['sql']
+        ]), 1)
+        # Без получателей post_delete коллектор не выбирает строки.
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT')
+            and f'"{table}"."id" IN' in query['sql']])
+        self.assertEqual(len(self.sent), 1)
+
+    def test_admin_delete_sends_change(self):
+        admin = User.objects.create_superuser(
+            username='sync_admin', email='sync_admin@example.com',
+            password='password')
+        client = APIClient()
+        client.force_login(admin)
+        row = self.recipe.recipe_ingredients.get(ingredient=self.second)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                f'/admin/recipes/recipeingredient/{row.pk}/delete/',
+                {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(
+            (self.sent[0]['before'], self.sent[0]['after']),
+            ({self.first.pk, self.second.pk}, {self.first.pk}))
+
+    def test_rollback_sends_nothing(self):
+        request = APIRequestFactory().patch('/')
+        request.user = self.author
+        serializer = RecipeCreateSerializer(
+            self.recipe, data={'ingredients': [
+                {'id': self.first.pk, 'amount': 7}]},
+            partial=True, context={'request': Request(request)})
+        self.assertTrue(serializer.is_valid())
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    serializer.save()
+                    raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.sent, [])
+        self.assertEqual(self.amounts(),
+                         {self.first.pk: 1, self.second.pk: 1})
+
+
+@override_settings(INGREDIENT_CATALOGUE_PATH='')
+class IngredientValidationTests(TestCase):
+    """
+    validate_ingredients: один in_bulk на все id и ошибки в той же
+    форме, что давал PrimaryKeyRelatedField.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('validate')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'validate {i}', measurement_unit='г')
+            for i in range(3))
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст',
+            image='recipes/images/validate.png', cooking_time=10)
+
+    def serializer(self, ids):
+        request = APIRequestFactory().patch('/')
+        request.user = self.author
+        return RecipeCreateSerializer(
+            self.recipe, partial=True, context={'request': Request(request)},
+            data={'ingredients': [{'id': pk, 'amount': 1} for pk in ids]})
+
+    def related_error(self, value):
+        """Ошибка PrimaryKeyRelatedField для value."""
+        field = serializers.PrimaryKeyRelatedField(
+            queryset=Ingredient.objects.all())
+        with self.assertRaises(serializers.ValidationError) as error:
+            field.run_validation(value)
+        return error.exception.detail
+
+    def test_single_query(self):
+        serializer = self.serializer([item.pk for item in self.ingredients])
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+
+    def test_all_missing_ids_reported(self):
+        existing = self.ingredients[0].pk
+        missing = [item.pk + 1000 for item in self.ingredients[1:]]
+        serializer = self.serializer([existing, *missing])
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['ingredients'], [
+            {}, *({'id': self.related_error(pk)} for pk in missing)])
+
+    def test_incorrect_type_matches_related_field(self):
+        for value in ('abc', True, [1], '1.5'):
+            with self.subTest(value=value):
+                serializer = self.serializer([value])
+                self.assertFalse(serializer.is_valid())
+                self.assertEqual(serializer.errors['ingredients'],
+                                 [{'id': self.related_error(value)}])
+
+
+class CatalogueTests(TestCase):
+    """
+    Каталог ингредиентов отвечает так же, как ORM, а правки из другого
+    контейнера замечает по stamp в общем кэше.
+    """
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.paths = [f'{directory}/a.catalogue', f'{directory}/b.catalogue']
+        override = override_settings(
+            INGREDIENT_CATALOGUE_PATH=self.paths[0],
+            INGREDIENT_CATALOGUE_CHECK_SECONDS=0,
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            }})
+        override.enable()
+        self.addCleanup(override.disable)
+        patcher = mock.patch.multiple(
+            catalogue, _current=None, _checked_at=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit=unit)
+            for name, unit in (('Salt', 'г'), ('sauce', 'мл'),
+                               ('Sugar', 'г'), ('Apple', 'шт')))
+
+    def test_matches_orm(self):
+        current = catalogue.get_catalogue()
+        fields = catalogue.FIELDS
+        for prefix in ('', 's', 'SA', 'apple', 'none'):
+            with self.subTest(prefix=prefix):
+                self.assertEqual(
+                    current.search(prefix),
+                    list(Ingredient.objects
+                         .filter(name__istartswith=prefix)
+                         .values(*fields)))
+        ids = [item.pk for item in self.ingredients] + [0, 10 ** 9]
+        self.assertEqual(
+            {pk: (item.name, item.measurement_unit)
+             for pk, item in current.in_bulk(ids).items()},
+            {pk: (item.name, item.measurement_unit)
+             for pk, item in Ingredient.objects.in_bulk(ids).items()})
+
+    def test_change_from_another_container(self):
+        stale = catalogue.get_catalogue()
+        added = Ingredient.objects.create(name='Перец', measurement_unit='г')
+        with override_settings(INGREDIENT_CATALOGUE_PATH=self.paths[1]):
+            catalogue.rebuild_catalogue()
+        self.assertIsNone(stale.get(added.pk))
+        self.assertIsNotNone(catalogue.get_catalogue().get(added.pk))
+
+    @override_settings(INGREDIENT_CATALOGUE_CHECK_SECONDS=3600)
+    def test_stale_catalogue_falls_back_to_db(self):
+        catalogue.get_catalogue()
+        added = Ingredient.objects.create(name='Перец', measurement_unit='г')
+        self.assertIsNone(catalogue.get_catalogue().get(added.pk))
+
+        client = APIClient()
+        response = client.get(f'/api/ingredients/{added.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Перец')
+
+        author = make_user('catalogue')
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Текст',
+            image='recipes/images/catalogue.png', cooking_time=10)
+        request = APIRequestFactory().patch('/')
+        request.user = author
+        serializer = RecipeCreateSerializer(
+            recipe, partial=True, context={'request': Request(request)},
+            data={'ingredients': [{'id': added.pk, 'amount': 1}]})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+
+@override_settings(CHANGES_SAFETY_WINDOW=0)
+class RecommendationsRefreshTests(TestCase):
+    """
+    build_recommendations: дозапуск пересчитывает только пользователей с
+    новыми отметками по сохранённым соседям и даёт тот же результат, что
+    и полный запуск на тех же соседях.
+    """
+    COMMAND = 'recipes.management.commands.build_recommendations'
+
+    @classmethod
+    def setUpTestData(cls):
+        author = make_user('recommend_author')
+        cls.users = [make_user(f'recommend_{i}') for i in range(4)]
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {i}', text='Текст',
+                   image='recipes/images/recommend.png', cooking_time=10,
+                   short_url=f'rc{i:06d}')
+            for i in range(6))
+        marks = {0: [0, 1, 2], 1: [1, 2, 3], 2: [2, 3, 4], 3: [0, 4, 5]}
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.users[user], recipe=cls.recipes[recipe])
+            for user, recipes in marks.items() for recipe in recipes)
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user=cls.users[0], recipe=cls.recipes[5]),
+            ShoppingCart(user=cls.users[1], recipe=cls.recipes[0]),
+        ])
+
+    def build(self, *args):
+        call_command('build_recommendations', *args, stdout=io.StringIO())
+        return dict(Recommendations.objects.values_list('user_id', 'recipes'))
+
+    def test_full_matches_stored_neighbours(self):
+        full = self.build('--full')
+        similar = dict(RecommendationNeighbours.objects.values_list(
+            'recipe_id', 'neighbours'))
+        for user in self.users:
+            own = sorted(
+                {*user.favorites.values_list('recipe_id', flat=True),
+                 *user.shopping_cart.values_list('recipe_id', flat=True)})
+            self.assertEqual(recommend_from(own, similar, 30), full[user.pk])
+
+    @override_settings(INGREDIENT_CATALOGUE_PATH='', RECIPE_CHANGELOG_PATH='')
+    def test_popular_fallback_skips_own_and_marked(self):
+        reader = make_user('recommend_reader')
+        own = Recipe.objects.create(
+            author=reader, name='Свой', text='Текст',
+            image='recipes/images/recommend.png', cooking_time=10)
+        Favorite.objects.create(user=reader, recipe=self.recipes[1])
+        ShoppingCart.objects.create(user=reader, recipe=self.recipes[2])
+        response = auth_client(reader).get('/api/recipes/recommended/')
+        self.assertEqual(response.status_code, 200)
+        ids = {item['id'] for item in response.json()['results']}
+        self.assertTrue(ids)
+        self.assertFalse(
+            ids & {own.pk, self.recipes[1].pk, self.recipes[2].pk})
+
+    def test_incremental_touches_only_new_marks(self):
+        self.build('--full')
+        computed = dict(Recommendations.objects.values_list(
+            'user_id', 'computed_at'))
+        touched = self.users[2]
+        Favorite.objects.create(user=touched, recipe=self.recipes[0])
+        with mock.patch(f'{self.COMMAND}.load_interactions',
+                        side_effect=AssertionError('полная загрузка')):
+            result = self.build()
+        self.assertTrue(result[touched.pk])
+        self.assertNotIn(self.recipes[0].pk,
+                         [pk for pk, _ in result[touched.pk]])
+        for user in self.users:
+            with self.subTest(user=user.username):
+                changed = (Recommendations.objects.get(user=user).computed_at
+                           != computed[user.pk])
+                self.assertEqual(changed, user == touched)
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100)
+class CompressionTests(SimpleTestCase):
+    """
+    CompressionMiddleware: кодировка по Accept-Encoding, порог размера,
+    потоковые ответы и Vary.
+    """
+    BODY = ('{"results": [' + '{"id": 1, "name": "Рецепт"}, ' * 20
+            + ']}').encode()
+
+    def compress(self, accept, response=None):
+        request = RequestFactory().get('/api/recipes/',
+                                       HTTP_ACCEPT_ENCODING=accept)
+        if response is None:
+            response = HttpResponse(self.BODY,
+                                    content_type='application/json')
+        return CompressionMiddleware(lambda request: response)(request)
+
+    @skipUnless(brotli, 'нужен пакет Brotli')
+    def test_brotli_preferred(self):
+        response = self.compress('gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), self.BODY)
+        self.assertEqual(response['Content-Length'],
+                         str(len(response.content)))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_gzip(self):
+        for accept in ('gzip', 'br;q=0.5, gzip', 'br;q=0, *'):
+            with self.subTest(accept=accept):
+                response = self.compress(accept)
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                self.assertEqual(gzip.decompress(response.content),
+                                 self.BODY)
+
+    def test_identity(self):
+        for accept in ('', 'identity', 'gzip;q=0, br;q=0'):
+            with self.subTest(accept=accept):
+                response = self.compress(accept)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(response.content, self.BODY)
+                # Ответ зависит от Accept-Encoding, даже несжатый.
+                self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_below_min_size_untouched(self):
+        with override_settings(COMPRESSION_MIN_SIZE=len(self.BODY) + 1):
+            response = self.compress('gzip, br')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertFalse(response.has_header('Vary'))
+        self.assertEqual(response.content, self.BODY)
+
+    def test_binary_and_encoded_untouched(self):
+        image = HttpResponse(self.BODY, content_type='image/png')
+        encoded = HttpResponse(self.BODY, content_type='application/json')
+        encoded['Content-Encoding'] = 'identity'
+        for response in (image, encoded):
+            with self.subTest(response=response):
+                result = self.compress('gzip', response)
+                self.assertEqual(result.content, self.BODY)
+                self.assertFalse(result.has_header('Vary'))
+
+    def test_streaming(self):
+        chunks = [self.BODY[:50], self.BODY[50:]]
+        response = StreamingHttpResponse(
+            iter(chunks), content_type='text/plain')
+        response['Content-Length'] = str(len(self.BODY))
+        response = self.compress('gzip', response)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            self.BODY)
+
+
+@override_settings(PERFORMANCE_SAMPLE_RATE=1, COMPRESSION_MIN_SIZE=100,
+                   INGREDIENT_CATALOGUE_PATH='', RECIPE_CHANGELOG_PATH='')
+class PerformanceMetricsTests(TestCase):
+    """
+    PerformanceMiddleware: заголовок Server-Timing и гистограммы на
+    /metrics, размер ответа — до сжатия.
+    """
+    VIEW = 'RecipeViewSet.list'
+
+    @classmethod
+    def setUpTestData(cls):
+        author = make_user('metrics')
+        Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {i}', text='Текст',
+                   image='recipes/images/metrics.png', cooking_time=10,
+                   short_url=f'mt{i:06d}')
+            for i in range(3))
+
+    def scrape(self):
+        """{имя серии с метками: значение} с /metrics."""
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        return dict(line.rsplit(' ', 1)
+                    for line in response.content.decode().splitlines()
+                    if not line.startswith('#'))
+
+    def series(self, values, histogram, suffix):
+        return float(values.get(
+            f'{histogram.name}_{suffix}{{view="{self.VIEW}"}}', 0))
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        for metric in ('total;dur=', 'db;dur=', 'queries"',
+                       'serialize;dur='):
+            self.assertIn(metric, timing)
+
+    def test_histograms_record_uncompressed_size(self):
+        before = self.scrape()
+        compressed = self.client.get('/api/recipes/',
+                                     HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        plain = self.client.get('/api/recipes/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        after = self.scrape()
+        for histogram in metrics.HISTOGRAMS:
+            with self.subTest(histogram=histogram.name):
+                self.assertEqual(
+                    self.series(after, histogram, 'count')
+                    - self.series(before, histogram, 'count'), 2)
+        size = (self.series(after, metrics.RESPONSE_SIZE, 'sum')
+                - self.series(before, metrics.RESPONSE_SIZE, 'sum'))
+        self.assertEqual(size, 2 * len(plain.content))
+
+
+# data/ смонтирован в /app/data в контейнере и лежит рядом с backend/
+# в репозитории.
+INGREDIENTS_JSON = next(
+    (path for path in (settings.BASE_DIR / 'data' / 'ingredients.json',
+                       settings.BASE_DIR.parent / 'data' / 'ingredients.json')
+     if path.exists()), None)
+
+
+@skipUnless(INGREDIENTS_JSON, 'нужен data/ingredients.json')
+class FuzzySearchBudgetTests(SimpleTestCase):
+    """Нечёткий поиск по полному справочнику укладывается в бюджет."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(INGREDIENTS_JSON, encoding='utf-8') as file:
+            cls.rows = [{'id': pk, **row}
+                        for pk, row in enumerate(json.load(file), 1)]
+        cls.index = FuzzyIndex(cls.rows)
+
+    def test_p99_within_budget(self):
+        for label, queries in make_cases(self.rows, 2000, 1).items():
+            with self.subTest(label):
+                _, p99, _, found = measure(self.index, queries)
+                self.assertLess(p99, BUDGET_MS)
+                # Отсечение кандидатов не должно терять опечатки.
+                self.assertGreater(found, 0.85)
+
+
+@override_settings(CHANGES_SAFETY_WINDOW=60)
+class RecipeChangesSyncTests(TestCase):
+    """
+    /api/recipes/changes/: keyset-лента изменённых и удалённых рецептов
+    с токеном позиции (api/sync.py).
+    """
+
+    URL = '/api/recipes/changes/'
+
+    def setUp(self):
+        self.author = make_user('sync')
+        self.client = APIClient()
+        # Всё, кроме отдельно оговорённого, старше окна безопасности.
+        self.past = timezone.now() - timedelta(hours=1)
+        self.recipes = [self.recipe(i) for i in range(5)]
+
+    def recipe(self, i, updated_at=None):
+        recipe = Recipe.objects.create(
+            author=self.author, name=f'Рецепт {i}', text='Текст',
+            image='recipes/images/sync.png', cooking_time=10,
+            short_url=f'sy{i:06d}')
+        Recipe.objects.filter(pk=recipe.pk).update(
+            updated_at=updated_at or self.past + timedelta(seconds=i))
+        return recipe
+
+    def fetch(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_token_round_trip(self):
+        position = (1700000000000000, 7, 1700000000000001, 0)
+        token = sync.encode(position)
+        self.assertRegex(token, r'^[A-Za-z0-9_-]+$')
+        self.assertEqual(sync.decode(token), position)
+        for broken in ('', '!!!', sync.encode((1, 2, 3)),
+                       sync.encode((1, 2, -3, 4)), 'bm90LWEtdG9rZW4'):
+            with self.subTest(token=broken):
+                with self.assertRaises(ValidationError):
+                    sync.decode(broken)
+
+    def test_malformed_token_is_rejected(self):
+        response = self.client.get(self.URL, {'since': 'bm90LWEtdG9rZW4'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('since', response.json())
+
+    def test_first_sync_returns_everything_then_nothing(self):
+        page = self.fetch()
+        self.assertEqual(page['changed'], [r.pk for r in self.recipes])
+        self.assertEqual((page['deleted'], page['has_more']), ([], False))
+        again = self.fetch(page['next'])
+        self.assertEqual((again['changed'], again['deleted']), ([], []))
+
+    def later(self, minutes):
+        """Часы ленты сдвинуты вперёд: окно безопасности прошло."""
+        return mock.patch.object(
+            sync.timezone, 'now',
+            return_value=timezone.now() + timedelta(minutes=minutes))
+
+    def test_edit_is_returned_after_token(self):
+        token = self.fetch()['next']
+        edited = self.recipes[2]
+        edited.name = 'Новое название'
+        edited.save()
+        self.assertEqual(self.fetch(token)['changed'], [edited.pk])
+
+    def test_safety_window_repeats_fresh_changes(self):
+        token = self.fetch()['next']
+        fresh = self.recipe(10, updated_at=timezone.now())
+        # Свежее bound отдаётся, но позиция за него не сдвигается:
+        # рецепт придёт и в следующем ответе.
+        page = self.fetch(token)
+        self.assertEqual(page['changed'], [fresh.pk])
+        page = self.fetch(page['next'])
+        self.assertEqual(page['changed'], [fresh.pk])
+        # Когда окно прошло, позиция сдвигается и повтора нет.
+        with self.later(minutes=2):
+            page = self.fetch(page['next'])
+            self.assertEqual(page['changed'], [fresh.pk])
+            self.assertEqual(self.fetch(page['next'])['changed'], [])
+
+    def test_deleted_recipe_is_tombstoned(self):
+        token = self.fetch()['next']
+        deleted = self.recipes[1]
+        response = auth_client(self.author).delete(
+            f'/api/recipes/{deleted.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(RecipeTombstone.objects.get().recipe_id,
+                         deleted.pk)
+        with self.later(minutes=2):
+            page = self.fetch(token)
+            self.assertEqual((page['changed'], page['deleted']),
+                             ([], [deleted.pk]))
+            again = self.fetch(page['next'])
+        self.assertEqual((again['changed'], again['deleted']), ([], []))
+
+    def test_tombstones_before_first_sync_are_skipped(self):
+        RecipeTombstone.objects.create(
+            recipe_id=999, deleted_at=self.past)
+        self.assertEqual(self.fetch()['deleted'], [])
+
+    def test_pages_until_has_more_is_false(self):
+        # Одинаковый updated_at: порядок и позиция держатся на id.
+        Recipe.objects.filter(pk__in=[r.pk for r in self.recipes[1:4]]
+                              ).update(updated_at=self.past)
+        seen, token, pages = [], None, 0
+        while True:
+            page = self.fetch(token, limit=2)
+            seen += page['changed']
+            token, pages = page['next'], pages + 1
+            if not page['has_more']:
+                break
+        self.assertEqual(pages, 3)
+        self.assertCountEqual(seen, [r.pk for r in self.recipes])
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_expired_token_is_gone(self):
+        token = self.fetch()['next']
+        with override_settings(RECIPE_TOMBSTONE_DAYS=0):
+            response = self.client.get(self.URL, {'since': token})
+        self.assertEqual(response.status_code, 410)
+        self.assertIn('since', response.json())
+        ancient = sync.encode((0, 0, 1, 0))
+        response = self.client.get(self.URL, {'since': ancient})
+        self.assertEqual(response.status_code, 410)
+
+
+@override_settings(CHANGES_SAFETY_WINDOW=0, TRENDING_HALF_LIFE_HOURS=24)
+class TrendingTests(TestCase):
+    """
+    Рейтинг ?ordering=trending (recipes/trending.py): вес отметки
+    убывает вдвое за TRENDING_HALF_LIFE_HOURS, build_trending дописывает
+    новые отметки, полный пересчёт учитывает снятые.
+    """
+
+    def setUp(self):
+        self.author = make_user('trending')
+        self.users = [make_user(f'trending{i}') for i in range(3)]
+        self.now = timezone.now()
+        # old: две отметки трое суток назад — 2 / 2^3; fresh: одна час
+        # назад — почти 1; cart: корзина час назад — почти 0.5; quiet:
+        # без отметок.
+        self.old, self.fresh, self.cart, self.quiet = (
+            Recipe.objects.create(
+                author=self.author, name=name, text='Текст',
+                image='recipes/images/trending.png', cooking_time=10,
+                short_url=f'tr{i:06d}')
+            for i, name in enumerate(('old', 'fresh', 'cart', 'quiet')))
+        for user in self.users[:2]:
+            self.favorite(user, self.old, hours=72)
+        self.favorite(self.users[0], self.fresh, hours=1)
+        ShoppingCart.objects.create(
+            user=self.users[0], recipe=self.cart,
+            created_at=self.now - timedelta(hours=1))
+
+    def favorite(self, user, recipe, hours=None):
+        """Отметка hours часов назад, без hours — сейчас."""
+        created_at = (timezone.now() if hours is None
+                      else self.now - timedelta(hours=hours))
+        return Favorite.objects.create(user=user, recipe=recipe,
+                                       created_at=created_at)
+
+    def scores(self):
+        return dict(RecipeTrending.objects.values_list('recipe_id', 'score'))
+
+    def test_ordering_follows_decayed_score(self):
+        call_command('build_trending', '--full', stdout=io.StringIO())
+        scores = self.scores()
+        self.assertAlmostEqual(scores[self.fresh.pk] / scores[self.old.pk],
+                               2.0 ** (72 / 24 - 1 / 24) / 2, places=6)
+        self.assertAlmostEqual(scores[self.cart.pk] / scores[self.fresh.pk],
+                               0.5, places=6)
+        self.assertNotIn(self.quiet.pk, scores)
+        response = APIClient().get('/api/recipes/?ordering=trending')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [self.fresh.pk, self.cart.pk, self.old.pk, self.quiet.pk])
+
+    def test_incremental_matches_full(self):
+        self.assertEqual(trending.refresh(), (True, 3))
+        self.favorite(self.users[2], self.old)
+        self.favorite(self.users[1], self.quiet)
+        self.assertEqual(trending.refresh(), (False, 2))
+        incremental = self.scores()
+        trending.refresh(full=True)
+        full = self.scores()
+        self.assertEqual(incremental.keys(), full.keys())
+        for recipe_id, score in full.items():
+            self.assertAlmostEqual(incremental[recipe_id] / score, 1,
+                                   places=6)
+
+    def test_removed_mark_leaves_on_full_refresh(self):
+        trending.refresh()
+        Favorite.objects.filter(recipe=self.fresh).delete()
+        trending.refresh()
+        self.assertIn(self.fresh.pk, self.scores())
+        trending.refresh(full=True)
+        self.assertNotIn(self.fresh.pk, self.scores())
+
+    def test_half_life_change_forces_full_refresh(self):
+        trending.refresh()
+        with override_settings(TRENDING_HALF_LIFE_HOURS=12):
+            self.assertEqual(trending.refresh(), (True, 3))
+        self.assertEqual(TrendingState.objects.get().half_life_hours, 12)
+
+    def test_anchor_moves_after_max_halvings(self):
+        trending.refresh()
+        later = self.now + timedelta(
+            hours=24 * (trending.MAX_HALVINGS + 1))
+        self.favorite(self.users[2], self.quiet,
+                      hours=-24 * (trending.MAX_HALVINGS + 1))
+        with mock.patch.object(trending.timezone, 'now',
+                               return_value=later):
+            self.assertEqual(trending.refresh(), (False, 1))
+        # Старые оценки остыли ниже MIN_SCORE и удалены, новая отметка
+        # весит почти 1 относительно нового anchor.
+        self.assertEqual(list(self.scores()), [self.quiet.pk])
+        self.assertAlmostEqual(self.scores()[self.quiet.pk], 1, places=3)
+        self.assertEqual(TrendingState.objects.get().anchor, later)
@@ -0,0 +1,178 @@
+"""
+Ограничение частоты запросов по алгоритму token bucket.
+
+Штатные throttle-классы DRF хранят в кэше список временных меток всех
+запросов окна и на каждой проверке фильтруют его — O(n) от лимита.
+Здесь на ключ хранится пара (токены, время): корзина объёмом в лимит
+пополняется равномерно, запрос забирает один токен. Проверка — O(1)
+и без запросов к БД; всплеск до объёма корзины проходит сразу.
+
+Хранилище задаётся настройкой THROTTLE_STORE:
+    'redis' — Redis из REDIS_URL: один лимит на все воркеры и
+              контейнеры;
+    'local' — словарь в памяти воркера (лимит фактически умножается на
+              число воркеров gunicorn); по умолчанию без REDIS_URL.
+Кэш Django в БД (django_cache) для корзин не используется: каждая
+проверка стоила бы нескольких SQL-запросов.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle
+
+
+def _refill(state, capacity, rate, now):
+    """Списывает токен; возвращает (новое состояние, пропущен, ожидание)."""
+    tokens, stamp = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + (now - stamp) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), True, 0.0
+    return (tokens, now), False, (1 - tokens) / rate
+
+
+class LocalBucketStore:
+    """Корзины в памяти процесса; самые давние вытесняются (LRU)."""
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, now):
+        with self._lock:
+            state, allowed, wait = _refill(
+                self._buckets.pop(key, None), capacity, rate, now)
+            self._buckets[key] = state
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, wait
+
+
+class RedisBucketStore:
+    """
+    Корзины в Redis. Пополнение и списание — один Lua-скрипт, который
+    Redis выполняет атомарно: параллельные запросы одного клиента не
+    прочитают одно и то же состояние, а проверка — один round-trip без
+    блокировок и ожидания.
+    """
+    SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+        local tokens = tonumber(state[1]) or capacity
+        local stamp = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + (now - stamp) * rate)
+        local allowed, wait = 0, 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        else
+            wait = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens),
+                   'stamp', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.floor(capacity / rate) + 1)
+        return {allowed, tostring(wait)}
+    """
+
+    def __init__(self):
+        self._script = None
+
+    def get_script(self):
+        if self._script is None:
+            client = redis.Redis.from_url(settings.REDIS_URL)
+            self._script = client.register_script(self.SCRIPT)
+        return self._script
+
+    def consume(self, key, capacity, rate, now):
+        allowed, wait = self.get_script()(
+            keys=[key], args=[capacity, repr(rate), repr(now)])
+        return bool(allowed), float(wait)
+
+
+STORES = {
+    'local': LocalBucketStore(),
+    'redis': RedisBucketStore(),
+}
+
+
+def get_store():
+    return STORES[settings.THROTTLE_STORE]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    База: лимит берётся из DEFAULT_THROTTLE_RATES[scope] в формате DRF
+    ('100/min'), объём корзины равен числу запросов.
+    """
+    scope = None
+    timer = time.time
+
+    def __init__(self):
+        num, period = SimpleRateThrottle.parse_rate(
+            None, api_settings.DEFAULT_THROTTLE_RATES.get(self.scope))
+        self.capacity = num
+        self.rate = num / period if num else None
+        self.wait_seconds = None
+
+    def get_cache_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        allowed, self.wait_seconds = get_store().consume(
+            f'throttle:{self.scope}:{key}',
+            self.capacity, self.rate, self.timer())
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class AnonBucketThrottle(TokenBucketThrottle):
+    """Анонимные запросы — по IP."""
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
+
+
+class UserBucketThrottle(TokenBucketThrottle):
+    """Запросы авторизованных пользователей — по id."""
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class WriteActionThrottle(TokenBucketThrottle):
+    """
+    Изменяющие запросы — отдельная корзина на каждое действие
+    (favorite, shopping_cart, subscribe, ...), чтобы скриптовое
+    переключение одного действия не съедало общий лимит.
+    """
+    scope = 'write'
+
+    def get_cache_key(self, request, view):
+        if request.method in SAFE_METHODS:
+            return None
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        action = getattr(view, 'action', None) or type(view).__name__
+        return f'{ident}:{action}'
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from api.views import IngredientViewSet, RecipeViewSet, CustomUserViewSet
+from api.views import (IngredientViewSet, RecipeViewSet, CustomUserViewSet,
+                       SlowQueryView)
 
 router = DefaultRouter()
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
@@ -10,4 +11,5 @@ router.register(r'users', CustomUserViewSet, basename='users')
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('slow-queries/', SlowQueryView.as_view(), name='slow-queries'),
 ]
@@ -1,30 +1,47 @@
 import string
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Sum, Value
 
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import (IsAuthenticated, AllowAny,
+                                        IsAdminUser,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
-
-from recipes.models import (Recipe, Ingredient,
-                            Favorite, ShoppingCart)
+from rest_framework.views import APIView
+
+from recipes import cooccurrence
+from recipes.catalogue import get_catalogue
+from recipes.fuzzy import get_fuzzy_index
+from recipes.ingredient_index import cover_queryset, get_ingredient_index
+from recipes.models import (Recipe, Ingredient, Favorite, ShoppingCart,
+                            Recommendations, SimilarRecipes)
+from recipes.recommender import popular_for_user, popular_recipes
 from users.models import User, Follow
+from users.suggestions import get_suggestions
 
 from .serializers import (
     RecipeSerializer, RecipeCreateSerializer, IngredientSerializer,
     RecipeMinifiedSerializer, CustomUserSerializer, UserBasicSerializer,
     UserCreateSerializer, FollowSerializer, SetAvatarSerializer,
-    SetAvatarResponseSerializer, PasswordSerializer,
+    SetAvatarResponseSerializer, PasswordSerializer, parse_sparse_fields,
+    RecipeIngredientSerializer,
 )
-from api.filters import IngredientSearchFilter
+from api import facets, metrics, slow_queries, sync
+from api.filters import (IngredientSearchFilter, filter_by_ingredients,
+                         parse_cooking_time, parse_id_list,
+                         parse_ordering)
 from api.pagination import CustomPagination
 from api.permissions import IsAuthorOrReadOnly
 
 from djoser.views import UserViewSet
 
+MAX_SUGGESTIONS = 50
+
 
 # ------------------------------------------------------------------ #
 #                             USERS                                  #
@@ -56,6 +73,22 @@ class CustomUserViewSet(UserViewSet):
             return PasswordSerializer
         return CustomUserSerializer
 
+    def get_queryset(self):
+        qs = super().get_queryset()
+        user = self.request.user
+        wanted, _ = parse_sparse_fields(self.request)
+        if (self.action == 'list' and user.is_authenticated
+                and (wanted is None or 'is_subscribed' in wanted)):
+            qs = qs.annotate(subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('pk'))))
+        return qs
+
+    def get_serializer(self, *args, **kwargs):
+        # ?fields= / ?expand= — только для списка и карточки.
+        if self.action in ('list', 'retrieve'):
+            kwargs.setdefault('sparse', True)
+        return super().get_serializer(*args, **kwargs)
+
     def get_permissions(self):
         if self.action in ('list', 'create', 'retrieve'):
             return [AllowAny()]
@@ -95,23 +128,26 @@ class CustomUserViewSet(UserViewSet):
                     {'detail': 'Нельзя подписаться на себя.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            if Follow.objects.filter(user=user, author=author).exists():
+            # Один INSERT: повторную подписку ловим по unique_follow,
+            # поэтому одновременные запросы не превращаются в 500.
+            try:
+                with transaction.atomic():
+                    Follow.objects.create(user=user, author=author)
+            except IntegrityError:
                 return Response(
                     {'detail': 'Уже подписаны.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            Follow.objects.create(user=user, author=author)
             ser = FollowSerializer(author, context={'request': request})
             return Response(ser.data, status=status.HTTP_201_CREATED)
 
         # DELETE
-        follow = Follow.objects.filter(user=user, author=author).first()
-        if not follow:
+        deleted, _ = Follow.objects.filter(user=user, author=author).delete()
+        if not deleted:
             return Response(
                 {'detail': 'Подписки не было.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        follow.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     # ---------------------- subscriptions ----------------------- #
@@ -119,13 +155,41 @@ class CustomUserViewSet(UserViewSet):
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        authors = User.objects.filter(
-            following__user=request.user).order_by('id')
+        # recipes и recipes_count берутся из одного prefetch.
+        authors = (
+            User.objects.filter(following__user=request.user)
+            .annotate(subscribed=Value(True))
+            .prefetch_related('recipes')
+            .order_by('id')
+        )
         page = self.paginate_queryset(authors)
-        serializer = FollowSerializer(page, many=True,
+        serializer = FollowSerializer(page, many=True, sparse=True,
                                       context={'request': request})
         return self.get_paginated_response(serializer.data)
 
+    # ----------------------- suggestions ------------------------ #
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def suggestions(self, request):
+        """
+        GET /api/users/suggestions/
+
+        На кого подписаться: авторы, на которых подписаны ваши подписки,
+        с числом таких подписок (mutual). Список готовит
+        build_author_suggestions, после подписки или отписки — запуск
+        с --stale (users/suggestions.py).
+        """
+        page = self.paginate_queryset(
+            get_suggestions(request.user.pk))
+        users = CustomUserSerializer.lean(
+            [pk for pk, _ in page], self.get_serializer_context())
+        data = []
+        for pk, mutual in page:
+            if pk in users:
+                data.append({**users[pk], 'mutual': mutual})
+        return self.get_paginated_response(data)
+
     # ------------------------- avatar --------------------------- #
 
     @action(detail=False, methods=['put', 'delete'],
@@ -173,6 +237,59 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
         name = self.request.query_params.get('name')
         return qs.filter(name__istartswith=name) if name else qs
 
+    @action(detail=False, methods=['get'], url_path='suggest')
+    def suggest(self, request):
+        """
+        GET /api/ingredients/suggest/?ingredients=1,2[&limit=10]
+
+        Ингредиенты, которые чаще всего встречаются в рецептах вместе с
+        уже выбранными, с числом таких рецептов (count).
+        """
+        chosen = set(parse_id_list(request, 'ingredients'))
+        if not chosen:
+            return Response(
+                {'ingredients': 'Укажите id выбранных ингредиентов.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = request.query_params.get('limit', '')
+        limit = min(int(limit), MAX_SUGGESTIONS) if limit.isdigit() else 10
+        suggestions = cooccurrence.suggest(chosen, limit)
+        ingredients = (get_catalogue() or Ingredient.objects).in_bulk(
+            [pk for pk, _ in suggestions])
+        return Response([
+            {'id': pk, 'name': ingredients[pk].name,
+             'measurement_unit': ingredients[pk].measurement_unit,
+             'count': count}
+            for pk, count in suggestions if pk in ingredients
+        ])
+
+    # list/retrieve отдаются из каталога (recipes/catalogue.py) без
+    # обращения к БД; без каталога работает обычный путь через ORM.
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name and request.query_params.get('fuzzy') in ('1', 'true'):
+            # ?fuzzy=1: с опечатками и латиницей (recipes/fuzzy.py).
+            return Response(get_fuzzy_index().search(name))
+        catalogue = get_catalogue()
+        if catalogue is None:
+            return super().list(request, *args, **kwargs)
+        return Response(catalogue.search(name))
+
+    def retrieve(self, request, *args, **kwargs):
+        catalogue = get_catalogue()
+        if catalogue is None:
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            row = catalogue.get(int(kwargs['pk']))
+        except ValueError:
+            raise Http404
+        if row is None:
+            # Ингредиента может ещё не быть в каталоге (см.
+            # recipes/catalogue.py) — проверяем в БД.
+            return super().retrieve(request, *args, **kwargs)
+        return Response(row)
+
 
 def _base36(num: int) -> str:
     """Простая, но детерминированная «короткая» строка из числа."""
@@ -220,6 +337,200 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeCreateSerializer
         return RecipeSerializer
 
+    def get_serializer(self, *args, **kwargs):
+        # ?fields= / ?expand= для карточки; список — в RecipeSerializer.lean.
+        if self.action == 'retrieve':
+            kwargs.setdefault('sparse', True)
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Пагинируем только id, а страницу собираем облегчённым
+        RecipeSerializer.lean — фиксированное число запросов вместо
+        нескольких на каждый рецепт.
+
+        ?ingredients= / ?exclude_ingredients= (id через запятую)
+        считаются по инвертированному индексу recipes.ingredient_index.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        include = parse_id_list(request, 'ingredients')
+        exclude = parse_id_list(request, 'exclude_ingredients')
+        index = get_ingredient_index() if include or exclude else None
+        if (include or exclude) and index is None:
+            queryset = filter_by_ingredients(queryset, include, exclude)
+        ids = queryset.prefetch_related(None).values_list('pk', flat=True)
+        if index is not None:
+            matched = index.match(include, exclude)
+            if queryset.query.order_by:
+                # ?ordering= — порядок и остальные фильтры из SQL.
+                matched = set(matched)
+                matched = [pk for pk in ids if pk in matched]
+            elif queryset.query.has_filters():
+                # Остальные фильтры (author, is_favorited, ...) — в SQL.
+                allowed = set(ids)
+                matched = [pk for pk in matched if pk in allowed]
+            ids = matched
+        context = self.get_serializer_context()
+        page = self.paginate_queryset(ids)
+        with metrics.span('serialize'):
+            data = RecipeSerializer.lean(
+                list(ids if page is None else page), context)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @action(detail=False, methods=['get'], url_path='changes',
+            permission_classes=[AllowAny])
+    def changes(self, request):
+        """
+        GET /api/recipes/changes/[?since=<токен>&limit=500]
+
+        Синхронизация: id изменённых (changed) и удалённых (deleted)
+        рецептов с момента, записанного в токене, и токен next для
+        следующего запроса. Пока has_more — запрашивать сразу. Без
+        since — все рецепты. Устаревший токен — 410, нужна полная
+        синхронизация.
+        """
+        token = request.query_params.get('since')
+        position = sync.decode(token) if token else sync.initial_position()
+        if sync.expired(position):
+            return Response(
+                {'since': 'Токен устарел, нужна полная синхронизация.'},
+                status=status.HTTP_410_GONE
+            )
+        limit = request.query_params.get('limit', '')
+        limit = (min(int(limit), sync.MAX_LIMIT) if limit.isdigit()
+                 and int(limit) > 0 else sync.DEFAULT_LIMIT)
+        return Response(sync.changes(position, limit))
+
+    @action(detail=False, methods=['get'], url_path='facets',
+            permission_classes=[AllowAny])
+    def facet_counts(self, request):
+        """
+        GET /api/recipes/facets/?<фильтры списка>
+
+        Сколько рецептов при текущих фильтрах в каждой корзине времени
+        приготовления, у каждого из частых авторов и с каждым из частых
+        ингредиентов (см. api.facets).
+        """
+        key = facets.cache_key(request)
+        data = cache.get(key)
+        if data is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            include = parse_id_list(request, 'ingredients')
+            exclude = parse_id_list(request, 'exclude_ingredients')
+            index = get_ingredient_index()
+            matched = None
+            if index is None:
+                queryset = filter_by_ingredients(queryset, include, exclude)
+            elif include or exclude:
+                # Ингредиенты — по индексу, как в list(): без JOIN с
+                # RecipeIngredient и без списка id в SQL.
+                matched = set(index.match(include, exclude))
+            data = facets.recipe_facets(queryset, index, matched)
+            cache.set(key, data, settings.FACETS_TTL)
+        return Response(data)
+
+    @action(detail=False, methods=['get'], url_path='pantry',
+            permission_classes=[AllowAny])
+    def pantry(self, request):
+        """
+        GET /api/recipes/pantry/?ingredients=1,2,3[&min_coverage=0.5]
+
+        «Что приготовить»: рецепты по доле ингредиентов, которые есть в
+        наборе, с этой долей (coverage) и недостающими ингредиентами.
+        Покрытие считается по индексу recipes.ingredient_index.
+        """
+        pantry = set(parse_id_list(request, 'ingredients'))
+        if not pantry:
+            return Response(
+                {'ingredients': 'Укажите id имеющихся ингредиентов.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            min_coverage = float(request.query_params.get('min_coverage', 0))
+        except ValueError:
+            min_coverage = -1
+        if not 0 <= min_coverage <= 1:
+            return Response(
+                {'min_coverage': 'Ожидается число от 0 до 1.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        index = get_ingredient_index()
+        if index is not None:
+            coverage = index.cover(pantry, min_coverage)
+        else:
+            coverage = cover_queryset(pantry, min_coverage)
+        page = self.paginate_queryset(range(len(coverage)))
+        rows = [coverage[pos] for pos in page]
+        ingredients = RecipeIngredientSerializer.lean(
+            [pk for pk, _, _ in rows])
+        # Рецепт, удалённый после расчёта, пропускает и lean().
+        rows = [row for row in rows if row[0] in ingredients]
+        with metrics.span('serialize'):
+            data = RecipeSerializer.lean(
+                [pk for pk, _, _ in rows], self.get_serializer_context())
+        for item, (pk, matched, size) in zip(data, rows):
+            item['coverage'] = round(matched / size, 3)
+            item['missing_ingredients'] = [
+                ingredient for ingredient in ingredients[pk]
+                if ingredient['id'] not in pantry
+            ]
+        return self.get_paginated_response(data)
+
+    @action(detail=False, methods=['get'], url_path='recommended',
+            permission_classes=[AllowAny])
+    def recommended(self, request):
+        """
+        GET /api/recipes/recommended/
+
+        Рекомендации по избранному и корзине из таблицы Recommendations
+        (её заполняет build_recommendations), у каждого рецепта — score.
+        Анонимам и пользователям без истории — популярные рецепты (без
+        своих и уже отмеченных).
+        """
+        if not request.user.is_authenticated:
+            recommended = popular_recipes()
+        else:
+            recommended = (
+                Recommendations.objects.filter(user_id=request.user.pk)
+                .values_list('recipes', flat=True).first()
+            ) or popular_for_user(request.user.pk)
+        page = self.paginate_queryset(recommended)
+        scores = dict(page)
+        with metrics.span('serialize'):
+            data = RecipeSerializer.lean(
+                list(scores), self.get_serializer_context())
+        for item in data:
+            item['score'] = scores[item['id']]
+        return self.get_paginated_response(data)
+
+    @action(detail=True, methods=['get'], url_path='similar',
+            permission_classes=[AllowAny])
+    def similar(self, request, pk=None):
+        """
+        GET /api/recipes/<id>/similar/[?limit=5]
+
+        Похожие по составу рецепты из таблицы SimilarRecipes (её
+        заполняет build_similar_recipes), у каждого — similarity.
+        """
+        neighbours = (SimilarRecipes.objects.filter(recipe_id=pk)
+                      .values_list('neighbours', flat=True).first())
+        if neighbours is None:
+            get_object_or_404(Recipe, pk=pk)
+            neighbours = []
+        limit = request.query_params.get('limit')
+        if limit and limit.isdigit():
+            neighbours = neighbours[:int(limit)]
+        scores = dict(neighbours)
+        with metrics.span('serialize'):
+            data = RecipeSerializer.lean(
+                list(scores), self.get_serializer_context())
+        for item in data:
+            item['similarity'] = scores[item['id']]
+        return Response(data)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -232,25 +543,30 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response(data, status=code)
 
     def _toggle_relation(self, model, recipe):
+        """
+        POST — один INSERT, дубль отсекается уникальным ограничением;
+        DELETE — один DELETE, наличие связи определяем по числу строк.
+        """
         user = self.request.user
-        exists = model.objects.filter(user=user, recipe=recipe).exists()
 
         if self.request.method == 'POST':
-            if exists:
+            try:
+                with transaction.atomic():
+                    model.objects.create(user=user, recipe=recipe)
+            except IntegrityError:
                 msg = ('Этот рецепт уже в избранном.' if model is Favorite
                        else 'Этот рецепт уже в корзине.')
                 return Response({'detail': msg},
                                 status=status.HTTP_400_BAD_REQUEST)
-            model.objects.create(user=user, recipe=recipe)
             return self._short_response(recipe, status.HTTP_201_CREATED)
 
         # DELETE
-        if not exists:
+        deleted, _ = model.objects.filter(user=user, recipe=recipe).delete()
+        if not deleted:
             msg = ('Этот рецепт не был в избранном.' if model is Favorite
                    else 'Этот рецепт не был в корзине.')
             return Response({'detail': msg},
                             status=status.HTTP_400_BAD_REQUEST)
-        model.objects.filter(user=user, recipe=recipe).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['post', 'delete'],
@@ -271,9 +587,27 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         qs = super().get_queryset()
         params = self.request.query_params
+        if self.action == 'retrieve':
+            # ?fields= без author/ingredients/text — не тянем их из БД.
+            # Список собирает RecipeSerializer.lean, он сам выбирает
+            # только нужные столбцы.
+            wanted, _ = parse_sparse_fields(self.request)
+            if wanted is not None:
+                if 'author' not in wanted:
+                    qs = qs.select_related(None)
+                if 'ingredients' not in wanted:
+                    qs = qs.prefetch_related(None)
+                if 'text' not in wanted:
+                    qs = qs.defer('text')
         author_id = params.get('author')
         if author_id:
             qs = qs.filter(author_id=author_id)
+        cooking_time = parse_cooking_time(self.request)
+        if cooking_time is not None:
+            qs = qs.filter(cooking_time)
+        ordering = parse_ordering(self.request)
+        if ordering is not None:
+            qs = qs.order_by(*ordering)
 
         user = self.request.user
         if user.is_authenticated:
@@ -292,21 +626,44 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     .annotate(total=Sum('ingredient_recipes__amount'))
                     .order_by('name'))
 
-        report_lines = [
-            f"Список покупок для {request.user.username}",
-            "Продукты:",
-        ]
-        for idx, item in enumerate(products, start=1):
-            report_lines.append(
-                f"{idx}. {item['name'].title()} "
-                f"({item['measurement_unit']}) — {item['total']}"
-            )
+        def report():
+            # Отдаём построчно: выгрузка не собирается в памяти целиком и
+            # сжимается CompressionMiddleware по мере отдачи.
+            yield f"Список покупок для {request.user.username}"
+            yield "\nПродукты:"
+            for idx, item in enumerate(products.iterator(), start=1):
+                yield (
+                    f"\n{idx}. {item['name'].title()} "
+                    f"({item['measurement_unit']}) — {item['total']}"
+                )
 
-        report_content = "\n".join(report_lines)
-        return HttpResponse(
-            report_content,
+        return StreamingHttpResponse(
+            report(),
             content_type='text/plain; charset=utf-8',
             headers={
                 'Content-Disposition': 'attachment; filename="shopping_list.txt"'
             }
         )
+
+
+# ------------------------------------------------------------------ #
+#                           DIAGNOSTICS                              #
+# ------------------------------------------------------------------ #
+
+class SlowQueryView(APIView):
+    """
+    GET    /api/slow-queries/ — захваченные медленные запросы с планами
+    DELETE /api/slow-queries/ — очистить буфер
+    """
+    permission_classes = [IsAdminUser]
+    pagination_class = None
+
+    def get(self, request):
+        return Response({
+            'threshold_ms': settings.SLOW_QUERY_MS,
+            'results': slow_queries.captures(),
+        })
+
+    def delete(self, request):
+        slow_queries.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,16 +1,25 @@
 #!/bin/bash
 
-echo "Waiting for database..."
-while ! nc -z db 5432; do
-  sleep 1
-done
-echo "Database is ready!"
+# STARTUP_MODE=full — прежний полный прогон при каждом старте;
+# по умолчанию prestart пропускает migrate и загрузку ингредиентов,
+# если делать нечего.
+if [ "$STARTUP_MODE" = "full" ]; then
+  echo "Waiting for database..."
+  while ! nc -z "${DB_HOST:-db}" "${DB_PORT:-5432}"; do
+    sleep 1
+  done
+  echo "Database is ready!"
 
-echo "Running migrations..."
-python manage.py migrate
+  echo "Running migrations..."
+  python manage.py migrate
+  python manage.py createcachetable
 
-echo "Loading ingredients..."
-python manage.py load_ingredients
+  echo "Loading ingredients..."
+  python manage.py load_ingredients --force
+else
+  echo "Preparing startup..."
+  python manage.py prestart
+fi
 
 echo "Starting server..."
-exec gunicorn --bind 0.0.0.0:8000 foodgram.wsgi 
\ No newline at end of file
+exec gunicorn -c gunicorn.conf.py foodgram.wsgi
@@ -0,0 +1,70 @@
+"""
+Маршрутизация запросов к репликам чтения.
+
+ReplicaRoutingMiddleware (api.middleware) включает чтение с реплик на
+время безопасных (GET/HEAD/OPTIONS) запросов к API; всё остальное —
+записи, фоновые команды, админка — идёт в default. Если реплик нет
+(DATABASE_REPLICAS пуст), роутер ничего не меняет.
+"""
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Токены и сессии проверяются сразу после логина — их читаем только с
+# primary, иначе свежий токен может ещё не доехать до реплики. Так же и
+# кэш в БД (django_cache): в нём отметки mark_recent_write.
+PRIMARY_ONLY_APPS = {'authtoken', 'sessions', 'django_cache'}
+
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Включает (или выключает) чтение с реплик внутри блока."""
+    token = _read_from_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+def _sticky_cache_key(client_key):
+    digest = hashlib.sha256(client_key.encode()).hexdigest()
+    return f'db-sticky:{digest}'
+
+
+def mark_recent_write(client_key):
+    """
+    Клиент только что писал: REPLICA_STICKY_SECONDS его чтения идут в
+    primary (read-your-writes), пока реплика догоняет.
+    """
+    if client_key:
+        cache.set(_sticky_cache_key(client_key), True,
+                  settings.REPLICA_STICKY_SECONDS)
+
+
+def has_recent_write(client_key):
+    return bool(client_key) and cache.get(_sticky_cache_key(client_key),
+                                          False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (settings.DATABASE_REPLICAS and _read_from_replica.get()
+                and model._meta.app_label not in PRIMARY_ONLY_APPS):
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии default, объекты из них можно связывать.
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -11,8 +11,13 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
+from dotenv import load_dotenv
+
+load_dotenv()
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -60,8 +65,50 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.AnonBucketThrottle',
+        'api.throttling.UserBucketThrottle',
+        'api.throttling.WriteActionThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': os.getenv('THROTTLE_RATE_ANON', '120/min'),
+        'user': os.getenv('THROTTLE_RATE_USER', '600/min'),
+        'write': os.getenv('THROTTLE_RATE_WRITE', '30/min'),
+    },
+    # Сколько доверенных прокси стоит перед бэкендом. 0 — IP клиента
+    # берётся из REMOTE_ADDR, X-Forwarded-For игнорируется. Значение 1
+    # (nginx) задавайте, только если порт бэкенда недоступен в обход
+    # прокси: иначе клиент подставит любой X-Forwarded-For и будет
+    # получать новую корзину anon на каждый запрос.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
 }
 
+# Сколько секунд кэшируются счётчики /api/recipes/facets/.
+FACETS_TTL = int(os.getenv('FACETS_TTL', '30'))
+
+# Лента /api/recipes/changes/ (api/sync.py): насколько позиция токена
+# отстаёт от текущего времени (с запасом на долгие транзакции) и сколько
+# дней хранятся записи об удалённых рецептах.
+CHANGES_SAFETY_WINDOW = int(os.getenv('CHANGES_SAFETY_WINDOW', '5'))
+RECIPE_TOMBSTONE_DAYS = int(os.getenv('RECIPE_TOMBSTONE_DAYS', '30'))
+
+# ?ordering=trending (recipes/trending.py): за сколько часов вес отметки
+# в избранном или корзине убывает вдвое. Отметки моложе
+# CHANGES_SAFETY_WINDOW build_trending учтёт при следующем запуске.
+TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', '72'))
+
+# Redis (в docker-compose): кэш Django и корзины api.throttling.
+REDIS_URL = os.getenv('REDIS_URL', '')
+
+# Хранилище корзин api.throttling: 'redis' (REDIS_URL, один лимит на все
+# воркеры) или 'local' (память воркера). В БД корзины не хранятся.
+THROTTLE_STORE = os.getenv(
+    'THROTTLE_STORE', 'redis' if REDIS_URL else 'local')
+
 # Опции для Djoser
 DJOSER = {
     'LOGIN_FIELD': 'email',
@@ -88,7 +135,11 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
+    'api.middleware.QueryPatternMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,6 +149,26 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Сжатие ответов (api.middleware.CompressionMiddleware)
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_BROTLI_QUALITY = 5
+
+# Доля запросов, для которых PerformanceMiddleware собирает метрики
+# (Server-Timing и гистограммы на /metrics). 0 — выключено.
+PERFORMANCE_SAMPLE_RATE = float(os.getenv('PERFORMANCE_SAMPLE_RATE', '0.1'))
+
+# Поиск N+1: 'log' — предупреждение в лог, 'raise' — исключение
+# (для тестов и CI), пусто — выключено.
+NPLUSONE_MODE = os.getenv('NPLUSONE_MODE', 'log')
+NPLUSONE_THRESHOLD = int(os.getenv('NPLUSONE_THRESHOLD', '5'))
+NPLUSONE_SAMPLE_RATE = float(os.getenv('NPLUSONE_SAMPLE_RATE', '0.01'))
+
+# Захват медленных запросов с EXPLAIN (api.slow_queries): порог в мс,
+# 0 — выключено. Буфер в кэше 'slow_queries' (CACHES ниже) на
+# SLOW_QUERY_BUFFER последних записей.
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '0'))
+SLOW_QUERY_BUFFER = int(os.getenv('SLOW_QUERY_BUFFER', '200'))
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -122,17 +193,112 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Параметры берутся из окружения (или .env через python-dotenv); имена
+# POSTGRES_* совпадают с переменными контейнера postgres.
+# DB_CONN_MAX_AGE — сколько секунд держать соединение между запросами
+# (0 — новое соединение на каждый запрос); перед повторным
+# использованием соединение проверяется (CONN_HEALTH_CHECKS), так что
+# закрытое сервером или pgbouncer соединение заменяется новым, а не
+# роняет запрос. Постоянное соединение — у каждого потока каждого
+# воркера gunicorn: бюджет max_connections см. в gunicorn.conf.py.
+# DB_POOL_MODE=pgbouncer — работа через pgbouncer в transaction mode:
+# серверные курсоры (QuerySet.iterator()) там не переживают транзакцию,
+# поэтому отключаются.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'foodgram',
-        'USER': 'foodgram_user',
-        'PASSWORD': 'foodgram_password',
-        'HOST': 'db',
-        'PORT': '5432'
+        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
+        'NAME': os.getenv('DB_NAME', os.getenv('POSTGRES_DB', 'foodgram')),
+        'USER': os.getenv('POSTGRES_USER', 'foodgram_user'),
+        'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'foodgram_password'),
+        'HOST': os.getenv('DB_HOST', 'db'),
+        'PORT': os.getenv('DB_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.getenv('DB_POOL_MODE', '') == 'pgbouncer'
+        ),
     }
 }
 
+# Реплики только для чтения: DB_REPLICAS — хосты через запятую (для SQLite —
+# пути к файлам, удобно проверять роутинг локально). GET-запросы к API
+# читают с реплик (foodgram.db_router), записи идут в default.
+DATABASE_REPLICAS = []
+for _index, _location in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1):
+    _key = 'NAME' if 'sqlite' in DATABASES['default']['ENGINE'] else 'HOST'
+    DATABASES[f'replica{_index}'] = {
+        **DATABASES['default'],
+        _key: _location.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{_index}')
+
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+
+# Сколько секунд после записи клиент читает из primary. Отметки хранятся
+# в общем кэше Django (CACHES), поэтому их видят все воркеры.
+REPLICA_STICKY_SECONDS = 5
+
+# Кэши общие для всех воркеров gunicorn и команд manage.py: в 'default'
+# отметки read-your-writes, в 'slow_queries' —
+# буфер api.slow_queries. REDIS_URL — Redis (в docker-compose); без него
+# 'default' — таблица django_cache в основной БД (её создаёт prestart
+# через createcachetable), 'slow_queries' — файлы в SLOW_QUERY_CACHE_DIR.
+# Буфер не пишется в БД: запись шла бы через тот же захват и в транзакции
+# самого медленного запроса. Локальный кэш процесса (LocMemCache) для
+# этого не годится.
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'slow_queries': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'slow_queries',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        },
+        'slow_queries': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv(
+                'SLOW_QUERY_CACHE_DIR',
+                os.path.join(tempfile.gettempdir(), 'foodgram_slow_queries')),
+            # Слоты буфера и счётчик не должны вытесняться.
+            'OPTIONS': {'MAX_ENTRIES': SLOW_QUERY_BUFFER + 100},
+        },
+    }
+
+# Компактный каталог ингредиентов (recipes/catalogue.py): файл, который
+# воркеры gunicorn читают через mmap. Пустое значение отключает каталог,
+# и ингредиенты читаются из БД.
+INGREDIENT_CATALOGUE_PATH = os.getenv(
+    'INGREDIENT_CATALOGUE_PATH',
+    os.path.join(tempfile.gettempdir(), 'foodgram_ingredients.catalogue')
+)
+# Как часто (в секундах) процесс сверяет свой каталог с версией в общем
+# кэше (CACHES): правки ингредиентов из других контейнеров видны не
+# позже, чем через столько секунд.
+INGREDIENT_CATALOGUE_CHECK_SECONDS = float(
+    os.getenv('INGREDIENT_CATALOGUE_CHECK_SECONDS', '5'))
+
+# Журнал изменённых рецептов (recipes/changelog.py), по которому воркеры
+# обновляют индексы в памяти. Пустое значение отключает индексы — фильтры
+# работают через SQL. Все контейнеры бэкенда должны видеть один файл
+# (общий том на одном хосте); с бэкендами на разных хостах индексы
+# отключайте.
+RECIPE_CHANGELOG_PATH = os.getenv(
+    'RECIPE_CHANGELOG_PATH',
+    os.path.join(tempfile.gettempdir(), 'foodgram_recipes.changelog')
+)
+
 # Custom User model
 AUTH_USER_MODEL = 'users.User'
 
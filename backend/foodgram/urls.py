@@ -3,6 +3,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from api.metrics import metrics_view
 from .views import AboutView, TechnologiesView
 
 urlpatterns = [
@@ -10,6 +11,8 @@ urlpatterns = [
     path('api/', include('api.urls')),
     path('about/', AboutView.as_view(), name='about'),
     path('technologies/', TechnologiesView.as_view(), name='technologies'),
+    # Метрики для Prometheus; nginx наружу этот путь не проксирует.
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,107 @@
+"""
+Профиль запуска gunicorn для продакшена (entrypoint.sh).
+
+Все параметры переопределяются переменными окружения GUNICORN_*.
+"""
+import multiprocessing
+import os
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+def _cpu_count():
+    # sched_getaffinity учитывает cpuset контейнера (docker --cpuset-cpus).
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return multiprocessing.cpu_count()
+
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Воркеры по числу CPU (классическое 2 * CPU + 1), но не больше
+# GUNICORN_MAX_WORKERS: cpu_count() без cpuset — это CPU хоста, а не
+# лимит контейнера, отсюда потолок.
+cpus = _cpu_count()
+workers = _env_int('GUNICORN_WORKERS', min(
+    cpus * 2 + 1,
+    _env_int('GUNICORN_MAX_WORKERS', 8),
+))
+# Запросы к API в основном ждут БД, поэтому на CPU приходится
+# GUNICORN_THREADS_PER_CPU одновременных запросов; их делят между
+# воркерами потоки gthread (дешевле лишних процессов), но не больше
+# GUNICORN_MAX_THREADS на воркер.
+threads = _env_int('GUNICORN_THREADS', max(1, min(
+    -(-cpus * _env_int('GUNICORN_THREADS_PER_CPU', 4) // workers),
+    _env_int('GUNICORN_MAX_THREADS', 4),
+)))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Бюджет соединений с PostgreSQL. При DB_CONN_MAX_AGE > 0 каждый поток
+# каждого воркера держит своё соединение: workers * threads на один
+# контейнер backend (по умолчанию не больше 8 * 4 = 32). Вместе с
+# остальными контейнерами, командами manage.py и запасом для
+# суперпользователя сумма должна укладываться в max_connections
+# (в PostgreSQL по умолчанию 100). DB_CONNECTION_BUDGET — доля этого
+# лимита для одного контейнера; при превышении мастер пишет
+# предупреждение. Больше воркеров — через pgbouncer (DB_POOL_MODE).
+db_connection_budget = _env_int('DB_CONNECTION_BUDGET', 40)
+
+# Django и каталог ингредиентов загружаются один раз в мастере до fork,
+# страницы памяти делятся между воркерами (copy-on-write).
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+# Перезапуск воркеров с разбросом, чтобы они не рестартовали разом.
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+timeout = _env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+# Heartbeat-файлы воркеров в памяти, а не на overlayfs контейнера.
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+# Метрики мастера и воркеров (число воркеров, запросы, длительность,
+# коды ответов) — в statsd, если он задан.
+statsd_host = os.getenv('GUNICORN_STATSD_HOST') or None
+statsd_prefix = os.getenv('GUNICORN_STATSD_PREFIX', 'foodgram')
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from django.db import connections
+
+    from recipes.catalogue import get_catalogue
+
+    try:
+        get_catalogue()
+    except Exception as error:
+        server.log.warning('Каталог ингредиентов не загружен: %s', error)
+    finally:
+        # Соединения мастера не должны достаться воркерам после fork.
+        connections.close_all()
+    server.log.info('Конфигурация: %s воркеров x %s потоков (%s)',
+                    workers, threads, worker_class)
+    conn_needed = workers * threads
+    if (int(os.getenv('DB_CONN_MAX_AGE', '60'))
+            and conn_needed > db_connection_budget):
+        server.log.warning(
+            'Постоянных соединений с БД до %s при бюджете %s '
+            '(DB_CONNECTION_BUDGET): уменьшите GUNICORN_WORKERS/THREADS '
+            'или используйте pgbouncer', conn_needed, db_connection_budget)
+
+
+def post_fork(server, worker):
+    server.log.info('Воркер %s запущен', worker.pid)
+
+
+def child_exit(server, worker):
+    server.log.info('Воркер %s завершился', worker.pid)
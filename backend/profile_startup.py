@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+Профиль холодного старта: сколько стоит django.setup() для этого проекта
+и какие импорты тянут больше всего времени.
+
+    python profile_startup.py [--top 20]
+
+Запускает отдельный интерпретатор с `-X importtime`, чтобы кэш модулей
+текущего процесса не искажал картину.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+SETUP_CODE = (
+    'import os, time;'
+    'started = time.perf_counter();'
+    'os.environ.setdefault("DJANGO_SETTINGS_MODULE", "foodgram.settings");'
+    'import django; django.setup();'
+    'print(f"django.setup(): {time.perf_counter() - started:.3f} s")'
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', SETUP_CODE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True,
+    )
+    print(result.stdout.strip())
+
+    # Строки вида "import time: self [us] | cumulative | imported package".
+    # Собственное время модулей суммируем по пакетам верхнего уровня —
+    # так вложенные импорты не считаются дважды.
+    packages = defaultdict(int)
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, _, name = line[len('import time:'):].split('|')
+        packages[name.strip().split('.')[0]] += int(own)
+
+    total = sum(packages.values())
+    print(f'Импорты: {total / 1e6:.3f} s')
+    for name, micros in sorted(
+            packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f'{micros / 1e3:10.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+    main()
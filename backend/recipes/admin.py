@@ -3,6 +3,13 @@ from .models import (
     Recipe, Ingredient,
     RecipeIngredient, Favorite, ShoppingCart
 )
+from .signals import track_ingredient_changes
+
+
+class RecipeIngredientInline(admin.TabularInline):
+    model = RecipeIngredient
+    autocomplete_fields = ('ingredient',)
+    extra = 0
 
 
 @admin.register(Recipe)
@@ -10,6 +17,14 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = ('name', 'author')
     list_filter = ('author', 'name')
     search_fields = ('name', 'author__username', 'author__email')
+    inlines = (RecipeIngredientInline,)
+
+    def save_related(self, request, form, formsets, change):
+        # Состав из инлайна — в журнал и пары ингредиентов, как из API.
+        if not any(formset.has_changed() for formset in formsets):
+            return super().save_related(request, form, formsets, change)
+        with track_ingredient_changes({form.instance.pk}):
+            super().save_related(request, form, formsets, change)
 
 
 @admin.register(Ingredient)
@@ -24,6 +39,22 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount')
     search_fields = ('recipe__name', 'ingredient__name')
 
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id}
+        if change and 'recipe' in form.changed_data:
+            recipe_ids.add(form.initial['recipe'])
+        with track_ingredient_changes(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with track_ingredient_changes({obj.recipe_id}):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        with track_ingredient_changes(recipe_ids):
+            super().delete_queryset(request, queryset)
+
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
@@ -0,0 +1,316 @@
+"""
+Компактный каталог ингредиентов.
+
+Справочник ингредиентов меняется только через load_ingredients и админку,
+а читается на каждом /api/ingredients/ и при каждой валидации рецепта.
+Каталог хранит id, названия и единицы измерения в плоском бинарном
+файле, который каждый воркер gunicorn открывает через mmap: страницы
+файла общие для всех процессов (page cache), а строки декодируются
+только для найденных записей.
+
+Формат файла (little-endian):
+
+    header    MAGIC, FORMAT, stamp, count, units
+    ids       int64[count]       — id в порядке Ingredient.Meta.ordering
+    unit_idx  uint16[count]      — индекс единицы измерения
+    name_off  uint32[count + 1]  — смещения названий в names
+    key_pos   uint32[count]      — позиции строк, отсортированных по ключу
+    key_off   uint32[count + 1]  — смещения ключей (name.lower()) в keys
+    id_sorted int64[count]       — id по возрастанию
+    id_pos    uint32[count]      — позиция строки для id_sorted
+    unit_off  uint32[units + 1]
+    names, keys, units           — UTF-8
+
+stamp — хэш содержимого таблицы: если он не изменился, файл не
+переписывается и воркеры ничего не перечитывают.
+
+Файл локален для контейнера, а ингредиент может поменяться в другом
+(админка, load_ingredients). Поэтому rebuild_catalogue публикует stamp
+в общем кэше Django (STAMP_KEY), а get_catalogue не чаще раза в
+INGREDIENT_CATALOGUE_CHECK_SECONDS сверяет с ним свой файл и при
+расхождении перестраивает его из БД. До сверки каталог может отставать:
+поиск отдаст старый список, а id, которых в каталоге нет, вызывающий
+код перепроверяет в БД.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+
+from .models import Ingredient
+
+MAGIC = b'FGIC'
+FORMAT = 1
+HEADER = struct.Struct('<4sIQII')
+FIELDS = ['id', 'name', 'measurement_unit']
+STAMP_KEY = 'ingredient-catalogue:stamp'
+
+_current = None
+_checked_at = None
+
+
+def _aligned(size):
+    return (size + 7) & ~7
+
+
+class IngredientCatalogue:
+    """Read-only представление файла каталога."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.signature = self._signature(os.fstat(file.fileno()))
+            self._buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, self.stamp, count, units = HEADER.unpack_from(self._buf)
+        if magic != MAGIC or fmt != FORMAT:
+            raise ValueError(f'Неизвестный формат каталога: {path}')
+        self.count = count
+
+        view = memoryview(self._buf)
+        offset = _aligned(HEADER.size)
+
+        def take(code, length):
+            nonlocal offset
+            size = length * struct.calcsize(code)
+            section = view[offset:offset + size].cast(code)
+            offset = _aligned(offset + size)
+            return section
+
+        self._ids = take('q', count)
+        self._unit_idx = take('H', count)
+        self._name_off = take('I', count + 1)
+        self._key_pos = take('I', count)
+        self._key_off = take('I', count + 1)
+        self._id_sorted = take('q', count)
+        self._id_pos = take('I', count)
+        unit_off = take('I', units + 1)
+        self._names_at = offset
+        self._keys_at = self._names_at + self._name_off[count]
+        units_at = self._keys_at + self._key_off[count]
+        # Единиц измерения десятки — их держим как интернированные строки.
+        self._units = tuple(
+            sys.intern(
+                self._buf[units_at + unit_off[i]:
+                          units_at + unit_off[i + 1]].decode()
+            )
+            for i in range(units)
+        )
+
+    @staticmethod
+    def _signature(stat):
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def __len__(self):
+        return self.count
+
+    def _row(self, pos):
+        start = self._names_at + self._name_off[pos]
+        end = self._names_at + self._name_off[pos + 1]
+        return {
+            'id': self._ids[pos],
+            'name': self._buf[start:end].decode(),
+            'measurement_unit': self._units[self._unit_idx[pos]],
+        }
+
+    def _key(self, slot, length=None):
+        start = self._keys_at + self._key_off[slot]
+        end = self._keys_at + self._key_off[slot + 1]
+        if length is not None:
+            end = min(end, start + length)
+        return self._buf[start:end]
+
+    def _position(self, pk):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._id_sorted[mid] < pk:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._id_sorted[lo] == pk:
+            return self._id_pos[lo]
+        return None
+
+    def search(self, prefix=''):
+        """
+        Ингредиенты, название которых начинается с prefix (без учёта
+        регистра), в порядке Ingredient.Meta.ordering.
+        """
+        if not prefix:
+            return [self._row(pos) for pos in range(self.count)]
+        needle = prefix.lower().encode()
+        length = len(needle)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < needle:
+                lo = mid + 1
+            else:
+                hi = mid
+        first, hi = lo, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid, length) <= needle:
+                lo = mid + 1
+            else:
+                hi = mid
+        positions = sorted(self._key_pos[slot] for slot in range(first, lo))
+        return [self._row(pos) for pos in positions]
+
+    def get(self, pk):
+        pos = self._position(pk)
+        return None if pos is None else self._row(pos)
+
+    def in_bulk(self, pks):
+        """Аналог Ingredient.objects.in_bulk без обращения к БД."""
+        result = {}
+        for pk in pks:
+            row = self.get(pk)
+            if row is not None:
+                result[pk] = Ingredient.from_db(
+                    DEFAULT_DB_ALIAS, FIELDS,
+                    (row['id'], row['name'], row['measurement_unit'])
+                )
+        return result
+
+
+def _stamp(rows):
+    digest = hashlib.blake2b(digest_size=8)
+    for pk, name, unit in rows:
+        digest.update(f'{pk}\x1f{name}\x1f{unit}\x1e'.encode())
+    return int.from_bytes(digest.digest(), 'little')
+
+
+def _blob(encoded):
+    offsets = array('I', [0])
+    parts = []
+    for value in encoded:
+        parts.append(value)
+        offsets.append(offsets[-1] + len(value))
+    return offsets, b''.join(parts)
+
+
+def _serialize(rows, stamp):
+    count = len(rows)
+    ids = array('q', (pk for pk, _, _ in rows))
+    units = sorted({unit for _, _, unit in rows})
+    unit_index = {unit: idx for idx, unit in enumerate(units)}
+    unit_idx = array('H', (unit_index[unit] for _, _, unit in rows))
+    name_off, names = _blob(name.encode() for _, name, _ in rows)
+
+    keys = [name.lower().encode() for _, name, _ in rows]
+    key_pos = array('I', sorted(range(count), key=keys.__getitem__))
+    key_off, key_blob = _blob(keys[pos] for pos in key_pos)
+    id_pos = array('I', sorted(range(count), key=ids.__getitem__))
+    id_sorted = array('q', (ids[pos] for pos in id_pos))
+    unit_off, unit_blob = _blob(unit.encode() for unit in units)
+
+    chunks = [HEADER.pack(MAGIC, FORMAT, stamp, count, len(units))]
+    for section in (ids, unit_idx, name_off, key_pos, key_off,
+                    id_sorted, id_pos, unit_off):
+        size = sum(map(len, chunks))
+        chunks.append(b'\0' * (_aligned(size) - size))
+        chunks.append(section.tobytes())
+    size = sum(map(len, chunks))
+    chunks.append(b'\0' * (_aligned(size) - size))
+    chunks.extend((names, key_blob, unit_blob))
+    return b''.join(chunks)
+
+
+def _path():
+    return getattr(settings, 'INGREDIENT_CATALOGUE_PATH', None)
+
+
+def rebuild_catalogue(force=False):
+    """
+    Перестраивает файл каталога из БД. Возвращает True, если файл
+    изменился. Запись атомарная (os.replace), поэтому воркеры видят либо
+    старую, либо новую версию целиком.
+    """
+    path = _path()
+    if not path:
+        return False
+    # Из default: перестройку запускает и GET-запрос, где чтения идут
+    # на реплику, а отстающий снимок стал бы общим stamp для всех.
+    rows = list(
+        Ingredient.objects.using(DEFAULT_DB_ALIAS)
+        .order_by(*Ingredient._meta.ordering).values_list(*FIELDS)
+    )
+    stamp = _stamp(rows)
+    cache.set(STAMP_KEY, stamp, None)
+    if not force and os.path.exists(path):
+        try:
+            if IngredientCatalogue(path).stamp == stamp:
+                return False
+        except (OSError, ValueError):
+            pass
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.catalogue-')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(_serialize(rows, stamp))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return True
+
+
+def _rebuild_on_commit():
+    rebuild_catalogue()
+
+
+def schedule_rebuild():
+    """
+    Перестроить каталог после коммита текущей транзакции. Сколько бы
+    ингредиентов ни поменялось в транзакции, перестройка будет одна.
+    """
+    if any(entry[1] is _rebuild_on_commit
+           for entry in connection.run_on_commit):
+        return
+    transaction.on_commit(_rebuild_on_commit)
+
+
+def _open(path):
+    global _current
+    try:
+        signature = IngredientCatalogue._signature(os.stat(path))
+    except FileNotFoundError:
+        rebuild_catalogue(force=True)
+        signature = None
+    catalogue = _current
+    if catalogue is None or catalogue.signature != signature:
+        catalogue = _current = IngredientCatalogue(path)
+    return catalogue
+
+
+def get_catalogue():
+    """
+    Текущий каталог процесса или None, если каталог отключён.
+
+    На каждом вызове сверяется stat() файла: после rebuild_catalogue()
+    в любом процессе контейнера воркер переоткрывает новую версию.
+    Правки из других контейнеров — по STAMP_KEY (см. описание модуля).
+    """
+    global _checked_at
+    path = _path()
+    if not path:
+        return None
+    catalogue = _open(path)
+    now = time.monotonic()
+    if (_checked_at is None or now - _checked_at
+            >= settings.INGREDIENT_CATALOGUE_CHECK_SECONDS):
+        _checked_at = now
+        if (cache.get(STAMP_KEY) != catalogue.stamp
+                and rebuild_catalogue()):
+            catalogue = _open(path)
+    return catalogue
@@ -0,0 +1,112 @@
+"""
+Журнал изменённых рецептов для индексов в памяти воркеров.
+
+Индексы по рецептам (api: фильтр по ингредиентам и др.) живут в памяти
+каждого воркера gunicorn. Чтобы после записи в одном воркере остальные
+обновились без полной перестройки, id изменённых рецептов после коммита
+дописываются строками в файл RECIPE_CHANGELOG_PATH. Читатель
+(ChangeFeed) помнит смещение в файле и на каждом poll() по stat()
+узнаёт, появились ли новые строки.
+
+Когда файл вырастает больше ROTATE_BYTES, он удаляется и создаётся
+заново; читатели видят смену inode и перестраивают индекс целиком.
+
+Журнал — файл, поэтому его видят только процессы одного хоста, которым
+доступен один и тот же путь: несколько контейнеров бэкенда должны
+монтировать общий том (в docker-compose — runtime). Бэкенд на другом
+хосте изменений не увидит и будет отдавать устаревший индекс.
+"""
+import fcntl
+import os
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+
+ROTATE_BYTES = 1 << 20
+
+_local = threading.local()
+
+
+def _path():
+    return getattr(settings, 'RECIPE_CHANGELOG_PATH', None)
+
+
+def _append(recipe_ids):
+    path = _path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.path.getsize(path) > ROTATE_BYTES:
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+        with open(path, 'a') as log:
+            log.write(''.join(f'{pk}\n' for pk in recipe_ids))
+
+
+def _flush():
+    recipe_ids, _local.pending = _local.pending, set()
+    if recipe_ids:
+        _append(sorted(recipe_ids))
+
+
+def mark_changed(recipe_id):
+    """
+    Записать рецепт в журнал после коммита текущей транзакции. Все
+    рецепты одной транзакции попадают в журнал одной записью.
+    """
+    if not _path():
+        return
+    if not any(entry[1] is _flush for entry in connection.run_on_commit):
+        _local.pending = set()
+        _local.pending.add(recipe_id)
+        transaction.on_commit(_flush)
+    else:
+        _local.pending.add(recipe_id)
+
+
+class ChangeFeed:
+    """Читатель журнала: у каждого индекса свой."""
+
+    def __init__(self):
+        self._inode = None
+        self._offset = 0
+
+    def enabled(self):
+        return bool(_path())
+
+    def sync(self):
+        """Встать в конец журнала (перед полной загрузкой индекса)."""
+        path = _path()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'a'):
+            pass
+        stat = os.stat(path)
+        self._inode = stat.st_dev, stat.st_ino
+        self._offset = stat.st_size
+
+    def poll(self):
+        """
+        id рецептов, изменённых с прошлого вызова, или None, если журнал
+        сменился и индекс надо перестроить целиком (после None читатель
+        уже стоит в конце нового журнала).
+        """
+        path = _path()
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stat = None
+        if stat is None or (stat.st_dev, stat.st_ino) != self._inode:
+            self.sync()
+            return None
+        if stat.st_size == self._offset:
+            return set()
+        with open(path, 'rb') as log:
+            log.seek(self._offset)
+            data = log.read(stat.st_size - self._offset)
+        # Берём только дописанные до конца строки.
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        return {int(pk) for pk in data[:end].split()}
@@ -0,0 +1,64 @@
+"""
+Совместная встречаемость ингредиентов (IngredientPair) — для подсказок
+в редакторе рецепта.
+
+Матрицу целиком считает команда build_ingredient_pairs. Создание,
+правка и удаление рецепта через API сдвигают счётчики затронутых пар
+сразу после коммита (apply_change). Правки состава в обход
+сериализатора (админка, bulk-операции) попадут в матрицу при следующем
+полном пересчёте; он же исправляет редкий недосчёт, когда два рецепта
+одновременно создают одну и ту же новую пару.
+"""
+from itertools import permutations
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+
+from .models import IngredientPair
+
+
+def pairs(ingredient_ids):
+    """Упорядоченные пары разных ингредиентов: (a, b) и (b, a)."""
+    return set(permutations(set(ingredient_ids), 2))
+
+
+def _inside(ingredient_ids):
+    return Q(ingredient_id__in=ingredient_ids, other_id__in=ingredient_ids)
+
+
+def apply_change(before, after):
+    """Состав рецепта сменился с before на after (множества id)."""
+    before, after = set(before), set(after)
+    added = pairs(after) - pairs(before)
+    removed = pairs(before) - pairs(after)
+    with transaction.atomic():
+        if removed:
+            # Пары внутри before, которых нет внутри after.
+            gone = IngredientPair.objects.filter(
+                _inside(before) & ~_inside(after))
+            gone.update(count=F('count') - 1)
+            gone.filter(count__lte=0).delete()
+        if added:
+            new = IngredientPair.objects.filter(
+                _inside(after) & ~_inside(before))
+            existing = set(new.values_list('ingredient_id', 'other_id'))
+            new.update(count=F('count') + 1)
+            IngredientPair.objects.bulk_create(
+                [IngredientPair(ingredient_id=first, other_id=second, count=1)
+                 for first, second in added - existing],
+                ignore_conflicts=True,
+            )
+
+
+def suggest(chosen, limit=10):
+    """
+    [(ingredient_id, число рецептов), ...] — ингредиенты, чаще всего
+    встречающиеся вместе с chosen (сумма по выбранным), кроме них самих.
+    """
+    return list(
+        IngredientPair.objects.filter(ingredient_id__in=chosen)
+        .exclude(other_id__in=chosen)
+        .values('other_id').annotate(total=Sum('count'))
+        .order_by('-total', 'other_id')
+        .values_list('other_id', 'total')[:limit]
+    )
@@ -0,0 +1,230 @@
+"""
+Нечёткий поиск ингредиентов: опечатки и латиница.
+
+Названия и запрос приводятся к ключам (words): нижний регистр,
+латиница → кириллица (сначала сочетания: shch, sh, ch, ya, ...),
+ё → е, й → и, без ь и ъ. Так «kartofel», «картофель» и «картофел»
+дают один ключ, а опечатка в кириллице остаётся одной правкой.
+
+Каждое слово запроса ищется как префикс слов названия с допустимым
+числом правок (max_edits): «карт» находит «картофель», «картфоель» —
+тоже. Правка — вставка, удаление, замена или перестановка соседних
+букв. Сначала ищутся точные префиксы (бинарным поиском по словам),
+если их нет — слова с одной правкой, если нет и таких — с двумя:
+дальние варианты всё равно шли бы в выдаче после ближних, а поиск с
+двумя правками самый дорогой.
+
+Кандидаты с правками отбираются по индексу позиционных биграмм:
+правка портит не больше трёх биграмм, поэтому при k правках префикс
+слова разделяет с запросом не меньше n - 3k биграмм запроса,
+сдвинутых не больше чем на k позиций; слова короче n - k тоже
+отбрасываются. Расстоянием Дамерау — Левенштейна с отсечением по k
+проверяются только MAX_CANDIDATES кандидатов с наибольшим числом
+общих биграмм — так задержка не растёт на коротких запросах с
+сотнями похожих слов.
+"""
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from .catalogue import get_catalogue
+from .models import Ingredient
+
+LATIN = {
+    'shch': 'щ', 'sch': 'щ', 'sh': 'ш', 'ch': 'ч', 'zh': 'ж', 'kh': 'х',
+    'ts': 'ц', 'ya': 'я', 'ja': 'я', 'ia': 'я', 'yu': 'ю', 'ju': 'ю',
+    'iu': 'ю', 'yo': 'е', 'jo': 'е', 'a': 'а', 'b': 'б', 'c': 'к',
+    'd': 'д', 'e': 'е', 'f': 'ф', 'g': 'г', 'h': 'х', 'i': 'и', 'j': 'и',
+    'k': 'к', 'l': 'л', 'm': 'м', 'n': 'н', 'o': 'о', 'p': 'п', 'q': 'к',
+    'r': 'р', 's': 'с', 't': 'т', 'u': 'у', 'v': 'в', 'w': 'в',
+    'x': 'кс', 'y': 'ы', 'z': 'з',
+}
+LATIN_RE = re.compile('|'.join(sorted(LATIN, key=len, reverse=True)))
+CYRILLIC = str.maketrans({'ё': 'е', 'й': 'и', 'ъ': None, 'ь': None})
+WORD = re.compile(r'[а-я0-9]+')
+PAD = '$'
+# Сколько кандидатов с правками проверять расстоянием (по убыванию
+# общих биграмм).
+MAX_CANDIDATES = 30
+
+_index = None
+
+
+def words(text):
+    """Ключи слов текста для сравнения (см. описание модуля)."""
+    text = LATIN_RE.sub(lambda match: LATIN[match.group()], text.lower())
+    return WORD.findall(text.translate(CYRILLIC))
+
+
+def max_edits(word):
+    """Сколько правок допускается в слове запроса такой длины."""
+    if len(word) <= 4:
+        return 0
+    if len(word) <= 7:
+        return 1
+    return 2
+
+
+def _grams(word):
+    padded = PAD + word
+    return [padded[pos:pos + 2] for pos in range(len(word))]
+
+
+def prefix_distance(query, word, limit):
+    """
+    Наименьшее расстояние Дамерау — Левенштейна от query до префикса
+    word или None, если оно больше limit. Считаются только клетки
+    |i - j| <= limit: остальные заведомо больше limit.
+    """
+    if word.startswith(query):
+        return 0
+    word = word[:len(query) + limit]
+    size, over = len(word), limit + 1
+    previous = [pos if pos < over else over for pos in range(size + 1)]
+    earlier = None
+    for row, char in enumerate(query, 1):
+        first, last = max(1, row - limit), min(size, row + limit)
+        current = [over] * (size + 1)
+        left = current[first - 1] = (
+            row if first == 1 and row < over else over)
+        smallest = left
+        for pos in range(first, last + 1):
+            # Вместо min() — сравнения: это самый горячий цикл поиска.
+            value = previous[pos - 1]
+            if char != word[pos - 1]:
+                value += 1
+                if left + 1 < value:
+                    value = left + 1
+                if previous[pos] + 1 < value:
+                    value = previous[pos] + 1
+                if (earlier is not None and pos > 1
+                        and char == word[pos - 2]
+                        and query[row - 2] == word[pos - 1]
+                        and earlier[pos - 2] + 1 < value):
+                    value = earlier[pos - 2] + 1
+                if value > over:
+                    value = over
+            current[pos] = left = value
+            if value < smallest:
+                smallest = value
+        if smallest > limit:
+            return None
+        earlier, previous = previous, current
+    best = min(previous)
+    return best if best <= limit else None
+
+
+class FuzzyIndex:
+    """Индекс по строкам {'id', 'name', 'measurement_unit'}."""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.source = None
+        self._words = []
+        # Слово → [(номер строки, позиция слова в названии), ...].
+        self._rows_of = []
+        self._grams = defaultdict(list)
+        ids = {}
+        for row_pos, row in enumerate(self.rows):
+            for word_pos, word in enumerate(words(row['name'])):
+                word_id = ids.get(word)
+                if word_id is None:
+                    word_id = ids[word] = len(self._words)
+                    self._words.append(word)
+                    self._rows_of.append([])
+                    for gram_pos, gram in enumerate(_grams(word + PAD)):
+                        self._grams[gram, gram_pos].append(word_id)
+                self._rows_of[word_id].append((row_pos, word_pos))
+        self._sorted = sorted(
+            (word, word_id) for word_id, word in enumerate(self._words))
+
+    def _prefixed(self, query):
+        """Слова, которые начинаются с query."""
+        pos = bisect_left(self._sorted, (query,))
+        result = {}
+        while (pos < len(self._sorted)
+               and self._sorted[pos][0].startswith(query)):
+            result[self._sorted[pos][1]] = 0
+            pos += 1
+        return result
+
+    def _match_word(self, query):
+        """{номер слова: расстояние} для слов с префиксом, близким к query."""
+        result = self._prefixed(query)
+        for limit in range(1, max_edits(query) + 1):
+            if result:
+                break
+            result = self._match_within(query, limit)
+        return result
+
+    def _match_within(self, query, limit):
+        grams = _grams(query)
+        # Биграмма запроса засчитывается слову не больше одного раза:
+        # слова со сдвигом до limit собираются в множество.
+        shared = Counter()
+        for query_pos, gram in enumerate(grams):
+            near = set()
+            for gram_pos in range(max(0, query_pos - limit),
+                                  query_pos + limit + 1):
+                near.update(self._grams.get((gram, gram_pos), ()))
+            shared.update(near)
+        needed = max(1, len(grams) - 3 * limit)
+        # Префикс слова короче query - limit не получить limit правками.
+        shortest = len(query) - limit
+        candidates = sorted(
+            (-count, word_id) for word_id, count in shared.items()
+            if count >= needed and len(self._words[word_id]) >= shortest)
+        result = {}
+        for _, word_id in candidates[:MAX_CANDIDATES]:
+            distance = prefix_distance(query, self._words[word_id], limit)
+            if distance is not None:
+                result[word_id] = distance
+        return result
+
+    def search(self, text, limit=50):
+        """
+        Строки, в названии которых каждому слову text нашлось близкое
+        слово. Порядок: меньше правок, совпадение с начала названия,
+        короче название.
+        """
+        matched = None
+        for query in words(text):
+            best = {}
+            for word_id, distance in self._match_word(query).items():
+                for row_pos, word_pos in self._rows_of[word_id]:
+                    key = (distance, word_pos)
+                    if row_pos not in best or key < best[row_pos]:
+                        best[row_pos] = key
+            if matched is None:
+                matched = best
+            else:
+                matched = {
+                    row_pos: (key[0] + best[row_pos][0], key[1])
+                    for row_pos, key in matched.items() if row_pos in best
+                }
+            if not matched:
+                return []
+        if matched is None:
+            return []
+        ranked = sorted(
+            matched.items(),
+            key=lambda item: (item[1], len(self.rows[item[0]]['name']),
+                              self.rows[item[0]]['name']))
+        return [self.rows[row_pos] for row_pos, _ in ranked[:limit]]
+
+
+def get_fuzzy_index():
+    """
+    Индекс по текущему каталогу ингредиентов: перестраивается, когда
+    каталог сменился. Без каталога — по таблице Ingredient на каждый
+    вызов.
+    """
+    global _index
+    catalogue = get_catalogue()
+    if catalogue is None:
+        return FuzzyIndex(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'))
+    if _index is None or _index.source != catalogue.signature:
+        _index = FuzzyIndex(catalogue.search())
+        _index.source = catalogue.signature
+    return _index
@@ -0,0 +1,393 @@
+"""
+Инвертированный индекс ингредиент → рецепты.
+
+Фильтр «рецепты с курицей и рисом, но без орехов» в SQL — отдельный
+JOIN с RecipeIngredient на каждый ингредиент. Индекс держит для каждого
+ингредиента отсортированный массив id рецептов (posting list) в памяти
+воркера; пересечение идёт от самого короткого списка бинарным поиском
+по остальным.
+
+По сути это разреженная матрица рецепт × ингредиент по столбцам, поэтому
+на ней же считается покрытие рецептов набором продуктов (cover):
+сколько ингредиентов рецепта есть в наборе — это сумма posting lists
+ингредиентов набора. С NumPy подсчёт векторный (bincount), без него —
+через Counter.
+
+Индекс строится при первом обращении и дальше обновляется по журналу
+recipes.changelog: перечитываются только изменённые рецепты.
+"""
+import heapq
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast
+
+from .changelog import ChangeFeed
+from .models import Recipe, RecipeIngredient
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_index = None
+
+# С какого размера списков выгоднее считать через NumPy.
+NUMPY_THRESHOLD = 4096
+
+
+def _remove(ids, pk):
+    pos = bisect_left(ids, pk)
+    if pos < len(ids) and ids[pos] == pk:
+        del ids[pos]
+
+
+def _insert(ids, pk):
+    pos = bisect_left(ids, pk)
+    if pos == len(ids) or ids[pos] != pk:
+        ids.insert(pos, pk)
+
+
+def intersect(postings):
+    """Пересечение отсортированных массивов, от самого короткого."""
+    postings = sorted(postings, key=len)
+    result = postings[0]
+    if np is not None and len(result) > NUMPY_THRESHOLD:
+        result = np.array(result, dtype=np.int64)
+        for other in postings[1:]:
+            result = np.intersect1d(
+                result, np.array(other, dtype=np.int64), assume_unique=True)
+        return result.tolist()
+    for other in postings[1:]:
+        kept = array('q')
+        lo, size = 0, len(other)
+        for pk in result:
+            lo = bisect_left(other, pk, lo)
+            if lo == size:
+                break
+            if other[lo] == pk:
+                kept.append(pk)
+        result = kept
+        if not result:
+            break
+    return result
+
+
+class Coverage:
+    """
+    Результат cover(): параллельные последовательности id рецепта, числа
+    найденных в наборе ингредиентов и числа ингредиентов рецепта —
+    уже в порядке выдачи.
+    """
+
+    def __init__(self, recipe_ids, matched, sizes):
+        self.recipe_ids = recipe_ids
+        self.matched = matched
+        self.sizes = sizes
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def __getitem__(self, pos):
+        return (int(self.recipe_ids[pos]), int(self.matched[pos]),
+                int(self.sizes[pos]))
+
+
+class IngredientIndex:
+
+    def __init__(self):
+        self.feed = ChangeFeed()
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._postings = {}
+        # Все рецепты: id по возрастанию и параллельно pub_date и число
+        # ингредиентов — для исключающего фильтра, сортировки результата
+        # как в API и расчёта покрытия.
+        self._recipe_ids = array('q')
+        self._pub_dates = array('d')
+        self._sizes = array('H')
+        # Производные данные (порядок выдачи, копии массивов для NumPy)
+        # считаются лениво и сбрасываются при изменениях.
+        self._derived = {}
+
+    def refresh(self):
+        """
+        Дочитать журнал. Таблицы читаются из default: refresh идёт из
+        GET-запросов, где чтения уходят на реплику, а смещение журнала
+        сдвигается сразу — рецепт с отстающей реплики остался бы в
+        индексе устаревшим до полной перезагрузки.
+        """
+        with self._lock:
+            changed = self.feed.poll() if self.loaded else None
+            if changed is None:
+                self._load()
+            elif changed:
+                self._apply(changed)
+
+    def _load(self):
+        self.feed.sync()
+        self.build(
+            RecipeIngredient.objects.using(DEFAULT_DB_ALIAS)
+            .order_by('recipe_id').values_list('ingredient_id', 'recipe_id')
+            .iterator(chunk_size=10000),
+            Recipe.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+            .values_list('pk', 'pub_date').iterator(chunk_size=10000),
+        )
+
+    def build(self, rows, recipes):
+        """
+        Полная загрузка: rows — пары (ingredient_id, recipe_id) по
+        возрастанию recipe_id, recipes — пары (id, pub_date) по
+        возрастанию id.
+        """
+        postings = {}
+        sizes = Counter()
+        for ingredient_id, recipe_id in rows:
+            postings.setdefault(ingredient_id, array('q')).append(recipe_id)
+            sizes[recipe_id] += 1
+        recipe_ids, pub_dates = array('q'), array('d')
+        recipe_sizes = array('H')
+        for pk, pub_date in recipes:
+            recipe_ids.append(pk)
+            pub_dates.append(pub_date.timestamp())
+            recipe_sizes.append(sizes[pk])
+        self._postings = postings
+        self._recipe_ids, self._pub_dates = recipe_ids, pub_dates
+        self._sizes = recipe_sizes
+        self._derived = {}
+        self.loaded = True
+
+    def _apply(self, recipe_ids):
+        self._derived = {}
+        for ids in self._postings.values():
+            for pk in recipe_ids:
+                _remove(ids, pk)
+        for pk in recipe_ids:
+            pos = self._position(pk)
+            if pos is not None:
+                del self._recipe_ids[pos]
+                del self._pub_dates[pos]
+                del self._sizes[pos]
+        sizes = Counter()
+        for ingredient_id, recipe_id in (
+                RecipeIngredient.objects.using(DEFAULT_DB_ALIAS)
+                .filter(recipe_id__in=recipe_ids)
+                .values_list('ingredient_id', 'recipe_id')):
+            _insert(self._postings.setdefault(ingredient_id, array('q')),
+                    recipe_id)
+            sizes[recipe_id] += 1
+        for pk, pub_date in Recipe.objects.using(DEFAULT_DB_ALIAS).filter(
+                pk__in=recipe_ids).values_list('pk', 'pub_date'):
+            pos = bisect_left(self._recipe_ids, pk)
+            self._recipe_ids.insert(pos, pk)
+            self._pub_dates.insert(pos, pub_date.timestamp())
+            self._sizes.insert(pos, sizes[pk])
+
+    def _position(self, pk):
+        pos = bisect_left(self._recipe_ids, pk)
+        if pos < len(self._recipe_ids) and self._recipe_ids[pos] == pk:
+            return pos
+        return None
+
+    def _order(self, recipe_ids):
+        # Рецепт, удалённый между чтениями таблиц при загрузке, до
+        # следующей записи журнала есть в posting list, но не в
+        # _recipe_ids — его пропускаем.
+        if np is not None:
+            recipe_ids = np.fromiter(recipe_ids, dtype=np.int64)
+            if len(recipe_ids) > NUMPY_THRESHOLD:
+                ids, pub_dates, _ = self._arrays()
+                rows = self._rows(recipe_ids)
+                order = np.lexsort((-ids[rows], -pub_dates[rows]))
+                return ids[rows[order]].tolist()
+            recipe_ids = recipe_ids.tolist()
+        keyed = []
+        for pk in recipe_ids:
+            pos = self._position(pk)
+            if pos is not None:
+                keyed.append((self._pub_dates[pos], pk))
+        keyed.sort(reverse=True)
+        return [pk for _, pk in keyed]
+
+    def match(self, include=(), exclude=()):
+        """
+        id рецептов, где есть все ингредиенты include и нет ни одного
+        из exclude, в порядке Recipe.Meta.ordering (-pub_date).
+        """
+        with self._lock:
+            excluded = set()
+            for pk in set(exclude):
+                excluded.update(self._postings.get(pk, ()))
+            if not include:
+                if 'ordered' not in self._derived:
+                    self._derived['ordered'] = self._order(self._recipe_ids)
+                return [pk for pk in self._derived['ordered']
+                        if pk not in excluded]
+            empty = array('q')
+            result = intersect(
+                [self._postings.get(pk, empty) for pk in set(include)])
+            return self._order(pk for pk in result if pk not in excluded)
+
+    def cover(self, pantry, min_coverage=0.0):
+        """
+        Рецепты, в которых есть хотя бы один ингредиент из pantry и доля
+        найденных ингредиентов не меньше min_coverage. Порядок: доля по
+        убыванию, затем меньше недостающих, затем новее.
+        """
+        with self._lock:
+            postings = [self._postings[pk] for pk in set(pantry)
+                        if pk in self._postings]
+            if np is not None:
+                return self._cover_numpy(postings, min_coverage)
+            return self._cover_python(postings, min_coverage)
+
+    def ingredient_counts(self, recipe_ids=None, top=20):
+        """
+        [(ingredient_id, число рецептов), ...] — top самых частых
+        ингредиентов среди recipe_ids (None — среди всех рецептов).
+        """
+        with self._lock:
+            if recipe_ids is None:
+                counts = ((pk, len(ids)) for pk, ids in self._postings.items())
+            elif np is not None:
+                counts = self._counts_numpy(recipe_ids)
+            else:
+                selected = set(recipe_ids)
+                counts = (
+                    (pk, sum(1 for recipe_id in ids if recipe_id in selected))
+                    for pk, ids in self._postings.items()
+                )
+            return heapq.nsmallest(
+                top, ((pk, count) for pk, count in counts if count),
+                key=lambda item: (-item[1], item[0]))
+
+    def _counts_numpy(self, recipe_ids):
+        if 'links' not in self._derived:
+            # Все связи индекса: позиция рецепта и номер ингредиента.
+            ingredient_ids = np.fromiter(self._postings, dtype=np.int64,
+                                         count=len(self._postings))
+            lengths = [len(ids) for ids in self._postings.values()]
+            linked = np.concatenate(
+                [np.array(ids, dtype=np.int64)
+                 for ids in self._postings.values()]
+                or [np.empty(0, dtype=np.int64)])
+            labels = np.repeat(np.arange(len(lengths)), lengths)
+            ids = self._arrays()[0]
+            rows = np.searchsorted(ids, linked)
+            known = rows < len(ids)
+            known[known] = ids[rows[known]] == linked[known]
+            self._derived['links'] = ingredient_ids, rows[known], labels[known]
+        ingredient_ids, rows, labels = self._derived['links']
+        selected = np.zeros(len(self._recipe_ids), dtype=bool)
+        selected[self._rows(np.fromiter(recipe_ids, dtype=np.int64))] = True
+        counts = np.bincount(labels[selected[rows]],
+                             minlength=len(ingredient_ids))
+        return zip(ingredient_ids.tolist(), counts.tolist())
+
+    def _arrays(self):
+        if 'numpy' not in self._derived:
+            self._derived['numpy'] = (
+                np.array(self._recipe_ids, dtype=np.int64),
+                np.array(self._pub_dates, dtype=np.float64),
+                np.array(self._sizes, dtype=np.int64),
+            )
+        return self._derived['numpy']
+
+    def _rows(self, recipe_ids):
+        """
+        Позиции recipe_ids (np.int64) в _recipe_ids; неизвестные id
+        отбрасываются. Пока id плотные, позиции берутся из таблицы
+        id → позиция, иначе — бинарным поиском.
+        """
+        ids = self._arrays()[0]
+        if not len(ids) or not len(recipe_ids):
+            return np.empty(0, dtype=np.int64)
+        if 'row_of' not in self._derived:
+            row_of = None
+            if ids[-1] <= 4 * len(ids):
+                row_of = np.full(ids[-1] + 1, -1, dtype=np.int32)
+                row_of[ids] = np.arange(len(ids), dtype=np.int32)
+            self._derived['row_of'] = row_of
+        row_of = self._derived['row_of']
+        if row_of is not None:
+            recipe_ids = recipe_ids[recipe_ids < len(row_of)]
+            rows = row_of[recipe_ids]
+            return rows[rows >= 0].astype(np.int64)
+        rows = np.searchsorted(ids, recipe_ids)
+        known = rows < len(ids)
+        known[known] = ids[rows[known]] == recipe_ids[known]
+        return rows[known]
+
+    def _cover_numpy(self, postings, min_coverage):
+        ids, pub_dates, sizes = self._arrays()
+        if not postings or not len(ids):
+            return Coverage([], [], [])
+        rows = self._rows(np.concatenate(
+            [np.array(posting, dtype=np.int64) for posting in postings]))
+        matched = np.bincount(rows, minlength=len(ids))
+        found = np.nonzero(matched)[0]
+        matched, total = matched[found], sizes[found]
+        coverage = matched / total
+        keep = coverage >= min_coverage
+        found, matched = found[keep], matched[keep]
+        total, coverage = total[keep], coverage[keep]
+        # lexsort: последний ключ — главный.
+        order = np.lexsort((-ids[found], -pub_dates[found],
+                            total - matched, -coverage))
+        return Coverage(ids[found[order]], matched[order], total[order])
+
+    def _cover_python(self, postings, min_coverage):
+        matched = Counter()
+        for posting in postings:
+            matched.update(posting)
+        keyed = []
+        for pk, count in matched.items():
+            pos = self._position(pk)
+            if pos is None:
+                continue
+            size = self._sizes[pos]
+            if count / size >= min_coverage:
+                keyed.append((-count / size, size - count,
+                              -self._pub_dates[pos], -pk, count, size))
+        keyed.sort()
+        return Coverage([-item[3] for item in keyed],
+                        [item[4] for item in keyed],
+                        [item[5] for item in keyed])
+
+
+def cover_queryset(pantry, min_coverage=0.0):
+    """
+    То же, что IngredientIndex.cover, одним агрегирующим запросом —
+    когда индекс отключён.
+    """
+    rows = (
+        Recipe.objects.annotate(
+            size=Count('recipe_ingredients'),
+            matched=Count('recipe_ingredients', filter=Q(
+                recipe_ingredients__ingredient_id__in=set(pantry))),
+        )
+        .filter(matched__gt=0)
+        .annotate(coverage=Cast('matched', FloatField()) / F('size'))
+        .filter(coverage__gte=min_coverage)
+        .order_by('-coverage', (F('size') - F('matched')).asc(),
+                  '-pub_date', '-pk')
+        .values_list('pk', 'matched', 'size')
+    )
+    rows = list(rows)
+    return Coverage([row[0] for row in rows], [row[1] for row in rows],
+                    [row[2] for row in rows])
+
+
+def get_ingredient_index():
+    """Индекс процесса или None, если журнал изменений отключён."""
+    global _index
+    if _index is None:
+        _index = IngredientIndex()
+    if not _index.feed.enabled():
+        return None
+    _index.refresh()
+    return _index
@@ -0,0 +1,40 @@
+import time
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.cooccurrence import pairs
+from recipes.models import IngredientPair, RecipeIngredient
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = ('Пересчитать совместную встречаемость ингредиентов для '
+            '/api/ingredients/suggest/ целиком. Правки рецептов через API '
+            'обновляют её и без этой команды.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = (RecipeIngredient.objects.order_by('recipe_id')
+                .values_list('recipe_id', 'ingredient_id')
+                .iterator(chunk_size=10000))
+        counts = Counter()
+        recipes = 0
+        for _, group in groupby(rows, key=itemgetter(0)):
+            counts.update(pairs(ingredient_id for _, ingredient_id in group))
+            recipes += 1
+        with transaction.atomic():
+            IngredientPair.objects.all().delete()
+            IngredientPair.objects.bulk_create(
+                (IngredientPair(ingredient_id=first, other_id=second,
+                                count=count)
+                 for (first, second), count in counts.items()),
+                batch_size=BATCH_SIZE,
+            )
+        self.stdout.write(
+            f'Рецептов: {recipes}, пар: {len(counts)} за '
+            f'{time.perf_counter() - started:.1f} с')
@@ -0,0 +1,148 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.models import (Favorite, Recipe, RecommendationNeighbours,
+                            Recommendations, RecommendationsState,
+                            ShoppingCart)
+from recipes.recommender import (POPULAR_KEY, ItemKNN, load_interactions,
+                                 load_user_items, popular_recipes,
+                                 recommend_from)
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Рассчитать рекомендации для /api/recipes/recommended/ по '
+            'избранному и корзинам пользователей. По умолчанию '
+            'пересчитываются только пользователи с новыми отметками.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=30,
+                            help='Сколько рецептов рекомендовать.')
+        parser.add_argument('--neighbours', type=int, default=50,
+                            help='Сколько похожих хранить для рецепта.')
+        parser.add_argument('--max-user-items', type=int, default=500,
+                            help='Пользователи с большим числом отметок '
+                                 'не учитываются в сходстве рецептов.')
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать сходство рецептов и всех '
+                                 'пользователей (учесть снятые отметки).')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        # Отметки из ещё не закоммиченных транзакций могут получить
+        # created_at чуть раньше until — их учтёт следующий запуск.
+        until = timezone.now() - timedelta(
+            seconds=settings.CHANGES_SAFETY_WINDOW)
+        state = RecommendationsState.objects.first()
+        if options['full'] or state is None:
+            state = state or RecommendationsState()
+            written, removed = self._full(options, started)
+            mode = 'полный пересчёт'
+        else:
+            written, removed = self._incremental(
+                options['top'], state.watermark, until), 0
+            mode = 'дозапуск'
+        state.watermark = until
+        state.save()
+        cache.delete(POPULAR_KEY)
+        popular_recipes()
+        self.stdout.write(
+            f'{mode}: записано {written}, удалено {removed} за '
+            f'{time.perf_counter() - started:.1f} с')
+
+    def _full(self, options, started):
+        started_at = timezone.now()
+        users, recipes = load_interactions(options['chunk_size'])
+        model = ItemKNN(users, recipes, options['neighbours'],
+                        options['max_user_items']).fit()
+        self.stdout.write(
+            f'Отметок: {len(users)}, пользователей: {len(model.user_ids)}, '
+            f'рецептов: {len(model.recipe_ids)}, модель за '
+            f'{time.perf_counter() - started:.1f} с')
+
+        # Свои рецепты пользователю не рекомендуем.
+        authored = defaultdict(list)
+        for pk, author_id in Recipe.objects.filter(
+                author_id__in=model.user_ids.tolist(),
+        ).values_list('pk', 'author_id').iterator():
+            pos = np.searchsorted(model.recipe_ids, pk)
+            if pos < len(model.recipe_ids) and model.recipe_ids[pos] == pk:
+                authored[author_id].append(pos)
+
+        top = options['top']
+        written = 0
+        with transaction.atomic():
+            RecommendationNeighbours.objects.all().delete()
+            RecommendationNeighbours.objects.bulk_create(
+                (RecommendationNeighbours(recipe_id=pk, neighbours=neighbours)
+                 for pk, neighbours in model.neighbour_lists()),
+                batch_size=BATCH_SIZE)
+            batch = []
+            for user_pos, user_id in enumerate(model.user_ids.tolist()):
+                batch.append(Recommendations(
+                    user_id=user_id,
+                    recipes=model.recommend(
+                        user_pos, top,
+                        np.array(authored.get(user_id, ()), dtype=np.int64)),
+                ))
+                if len(batch) == BATCH_SIZE:
+                    written += self._write(batch)
+                    batch = []
+            written += self._write(batch)
+            # Пользователи, у которых не осталось отметок.
+            removed, _ = Recommendations.objects.filter(
+                computed_at__lt=started_at).delete()
+        return written, removed
+
+    def _incremental(self, top, watermark, until):
+        """
+        Пересчитать пользователей, отметивших рецепты в (watermark,
+        until]: читаются только их отметки и соседи их рецептов.
+        """
+        touched = set()
+        for model in (Favorite, ShoppingCart):
+            touched.update(
+                model.objects.filter(created_at__gt=watermark,
+                                     created_at__lte=until)
+                .values_list('user_id', flat=True).distinct())
+        touched = sorted(touched)
+        written = 0
+        for start in range(0, len(touched), BATCH_SIZE):
+            user_ids = touched[start:start + BATCH_SIZE]
+            items = load_user_items(user_ids)
+            similar = dict(
+                RecommendationNeighbours.objects.filter(
+                    recipe_id__in={pk for own in items.values()
+                                   for pk in own},
+                ).values_list('recipe_id', 'neighbours'))
+            authored = defaultdict(list)
+            for pk, author_id in Recipe.objects.filter(
+                    author_id__in=user_ids).values_list('pk', 'author_id'):
+                authored[author_id].append(pk)
+            written += self._write([
+                Recommendations(
+                    user_id=user_id,
+                    recipes=recommend_from(
+                        own, similar, top, authored.get(user_id, ())),
+                )
+                for user_id, own in items.items()
+            ])
+        return written
+
+    @staticmethod
+    def _write(batch):
+        Recommendations.objects.bulk_create(
+            batch, update_conflicts=True, unique_fields=['user'],
+            update_fields=['recipes', 'computed_at'],
+        )
+        return len(batch)
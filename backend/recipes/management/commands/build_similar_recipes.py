@@ -0,0 +1,98 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import SimilarRecipes
+from recipes.similarity import (SimilarityModel, load_recipe_sets, rank,
+                                signature)
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Рассчитать похожие рецепты для /api/recipes/<id>/similar/. '
+            'По умолчанию пересчитываются только рецепты, состав которых '
+            'изменился с прошлого запуска, и те, чьи списки это затронуло.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10,
+                            help='Сколько похожих рецептов хранить '
+                                 '(после изменения нужен --full).')
+        parser.add_argument('--max-df', type=float, default=0.1,
+                            help='Доля рецептов, начиная с которой '
+                                 'ингредиент не используется для поиска '
+                                 'кандидатов.')
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать все рецепты.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        top = options['top']
+        sets = load_recipe_sets()
+        model = SimilarityModel(sets, options['max_df'])
+        signatures = {pk: signature(ingredients)
+                      for pk, ingredients in sets.items()}
+        stored = {
+            pk: (stored_signature, neighbours)
+            for pk, stored_signature, neighbours in
+            SimilarRecipes.objects.values_list(
+                'recipe_id', 'signature', 'neighbours').iterator()
+        }
+
+        # Рецепты без состава (обычно удалённые — их строки уже удалены
+        # каскадом) из таблицы убираем.
+        removed = set(stored) - set(sets)
+        changed = {pk for pk in sets
+                   if stored.get(pk, (None,))[0] != signatures[pk]}
+        top_lists = {pk: neighbours
+                     for pk, (_, neighbours) in stored.items()
+                     if pk not in removed}
+        if options['full'] or not stored:
+            targets, scores = set(sets), {}
+        else:
+            targets, scores = self._affected(
+                model, changed, removed, top_lists, top)
+
+        rows = [
+            SimilarRecipes(
+                recipe_id=pk,
+                signature=signatures[pk],
+                neighbours=model.neighbours(pk, top, scores.get(pk)),
+            )
+            for pk in targets
+        ]
+        with transaction.atomic():
+            SimilarRecipes.objects.filter(recipe_id__in=removed).delete()
+            SimilarRecipes.objects.bulk_create(
+                rows, batch_size=BATCH_SIZE, update_conflicts=True,
+                unique_fields=['recipe'],
+                update_fields=['neighbours', 'signature', 'computed_at'],
+            )
+        self.stdout.write(
+            f'Рецептов: {len(sets)}, изменилось: {len(changed)}, '
+            f'пересчитано: {len(rows)}, удалено: {len(removed)} '
+            f'за {time.perf_counter() - started:.1f} с')
+
+    def _affected(self, model, changed, removed, top_lists, top):
+        """
+        Рецепты, которые надо пересчитать: изменившиеся; те, в чьих
+        списках есть изменившийся или удалённый рецепт (его сходство
+        могло упасть, и нужен следующий кандидат); и те, для кого
+        изменившийся рецепт теперь лучше последнего в списке.
+        """
+        targets = set(changed)
+        scores = {}
+        stale = changed | removed
+        for pk, neighbours in top_lists.items():
+            if any(other in stale or other not in model.sets
+                   for other, _ in neighbours):
+                targets.add(pk)
+        for pk in changed:
+            scores[pk] = model.scores(pk)
+            for other, score in scores[pk].items():
+                neighbours = top_lists.get(other)
+                if (neighbours is None or len(neighbours) < top
+                        or rank([pk, round(score, 4)]) > rank(neighbours[-1])):
+                    targets.add(other)
+        return targets, scores
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.trending import refresh
+
+
+class Command(BaseCommand):
+    help = ('Обновить рейтинг ?ordering=trending: учесть отметки в '
+            'избранном и корзинах с прошлого запуска.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать все оценки заново (учесть '
+                                 'снятые отметки).')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        full, touched = refresh(options['full'])
+        mode = 'полный пересчёт' if full else 'дозапись'
+        self.stdout.write(
+            f'{mode}: рецептов {touched} за '
+            f'{time.perf_counter() - started:.2f} с')
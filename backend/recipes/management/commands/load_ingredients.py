@@ -1,28 +1,53 @@
 import csv
+import hashlib
 import os
 from django.core.management.base import BaseCommand
-from recipes.models import Ingredient
+from django.db import transaction
+from recipes.catalogue import rebuild_catalogue
+from recipes.models import DataImport, Ingredient
+
+BATCH_SIZE = 1000
+
 
 class Command(BaseCommand):
     help = 'Load ingredients from CSV file'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/app/data/ingredients.csv')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Load even if this file has already been loaded')
+
     def handle(self, *args, **options):
-        csv_file = '/app/data/ingredients.csv'
+        csv_file = options['path']
         self.stdout.write(f'Trying to load ingredients from {csv_file}')
-        
+
         if not os.path.exists(csv_file):
             self.stdout.write(self.style.ERROR(f'File not found: {csv_file}'))
             return
-            
-        with open(csv_file, encoding='utf-8') as file:
-            reader = csv.reader(file)
-            count = 0
-            for row in reader:
-                if len(row) == 2:  # проверяем, что в строке есть название и единица измерения
-                    name, measurement_unit = row
-                    Ingredient.objects.get_or_create(
-                        name=name.strip(),
-                        measurement_unit=measurement_unit.strip()
-                    )
-                    count += 1
-        self.stdout.write(self.style.SUCCESS(f'Ingredients loaded successfully: {count} items')) 
\ No newline at end of file
+
+        with open(csv_file, 'rb') as file:
+            content = file.read()
+        fingerprint = hashlib.sha256(content).hexdigest()
+        if not options['force'] and DataImport.objects.filter(
+                source=csv_file, fingerprint=fingerprint).exists():
+            self.stdout.write('Ingredients are up to date, skipping')
+            return
+
+        ingredients = []
+        for row in csv.reader(content.decode('utf-8').splitlines()):
+            if len(row) == 2:  # проверяем, что в строке есть название и единица измерения
+                name, measurement_unit = row
+                ingredients.append(Ingredient(
+                    name=name.strip(),
+                    measurement_unit=measurement_unit.strip()
+                ))
+        with transaction.atomic():
+            # Уже существующие ингредиенты пропускает unique_ingredient.
+            Ingredient.objects.bulk_create(
+                ingredients, batch_size=BATCH_SIZE, ignore_conflicts=True)
+            DataImport.objects.update_or_create(
+                source=csv_file, defaults={'fingerprint': fingerprint})
+        self.stdout.write(self.style.SUCCESS(
+            f'Ingredients loaded successfully: {len(ingredients)} items'))
+        rebuild_catalogue()
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+
+
+class Command(BaseCommand):
+    help = ('Подготовка контейнера к запуску: ожидание БД, migrate, '
+            'createcachetable и load_ingredients — только если '
+            'действительно есть что делать')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db-timeout', type=float, default=60)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        self._phase('БД доступна', self._wait_for_db, options['db_timeout'])
+        self._phase('Миграции', self._migrate)
+        # Для кэша в БД (без REDIS_URL); уже созданная таблица пропускается.
+        self._phase('Таблица кэша', call_command, 'createcachetable')
+        self._phase('Ингредиенты', call_command, 'load_ingredients')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.2f} с'))
+
+    def _phase(self, label, func, *args):
+        started = time.perf_counter()
+        func(*args)
+        self.stdout.write(f'{label}: {time.perf_counter() - started:.2f} с')
+
+    def _wait_for_db(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                connection.ensure_connection()
+                return
+            except DatabaseError as error:
+                if time.monotonic() > deadline:
+                    raise CommandError(f'БД недоступна: {error}')
+                time.sleep(0.5)
+
+    def _pending_migrations(self):
+        """
+        Миграции с диска, которых нет в django_migrations. Состояние БД
+        читается одним запросом; граф строится без обращения к БД.
+        """
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        table = MigrationRecorder.Migration._meta.db_table
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT app, name FROM {connection.ops.quote_name(table)}'
+                )
+                applied = set(cursor.fetchall())
+        except DatabaseError:
+            # Таблицы ещё нет — чистая БД.
+            return set(loader.graph.nodes)
+        return set(loader.graph.nodes) - applied
+
+    def _migrate(self):
+        pending = self._pending_migrations()
+        if not pending:
+            self.stdout.write('Новых миграций нет, migrate пропущен')
+            return
+        self.stdout.write(f'Новых миграций: {len(pending)}')
+        call_command('migrate', interactive=False)
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import RecipeTombstone
+
+
+class Command(BaseCommand):
+    help = ('Удалить записи об удалённых рецептах старше '
+            'RECIPE_TOMBSTONE_DAYS. Клиенты с более старым токеном '
+            '/api/recipes/changes/ получат 410 и синхронизируются заново.')
+
+    def handle(self, *args, **options):
+        oldest = timezone.now() - timedelta(
+            days=settings.RECIPE_TOMBSTONE_DAYS)
+        deleted, _ = RecipeTombstone.objects.filter(
+            deleted_at__lt=oldest).delete()
+        self.stdout.write(f'Удалено записей: {deleted}')
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_short_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True, verbose_name='Источник')),
+                ('fingerprint', models.CharField(max_length=64, verbose_name='Отпечаток')),
+                ('loaded_at', models.DateTimeField(auto_now=True, verbose_name='Загружен')),
+            ],
+            options={
+                'verbose_name': 'Загрузка справочника',
+                'verbose_name_plural': 'Загрузки справочников',
+            },
+        ),
+    ]
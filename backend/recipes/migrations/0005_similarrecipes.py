@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_dataimport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarRecipes',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='similar', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('neighbours', models.JSONField(default=list, verbose_name='Похожие рецепты')),
+                ('signature', models.CharField(max_length=16, verbose_name='Отпечаток состава')),
+                ('computed_at', models.DateTimeField(auto_now=True, verbose_name='Рассчитано')),
+            ],
+            options={
+                'verbose_name': 'Похожие рецепты',
+                'verbose_name_plural': 'Похожие рецепты',
+            },
+        ),
+    ]
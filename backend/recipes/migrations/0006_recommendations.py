@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('recipes', '0005_similarrecipes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recommendations',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recommendations', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('recipes', models.JSONField(default=list, verbose_name='Рекомендованные рецепты')),
+                ('computed_at', models.DateTimeField(auto_now=True, verbose_name='Рассчитано')),
+            ],
+            options={
+                'verbose_name': 'Рекомендации',
+                'verbose_name_plural': 'Рекомендации',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_cooking_time_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientPair',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(verbose_name='Рецептов')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.ingredient', verbose_name='Встречается вместе с')),
+            ],
+            options={
+                'verbose_name': 'Пара ингредиентов',
+                'verbose_name_plural': 'Пары ингредиентов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientpair',
+            constraint=models.UniqueConstraint(fields=('ingredient', 'other'), name='unique_ingredient_pair'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def copy_pub_date(apps, schema_editor):
+    """
+    Время старых отметок неизвестно: ставим дату публикации рецепта,
+    иначе все они разом оказались бы «свежими».
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    pub_date = Recipe.objects.filter(
+        pk=models.OuterRef('recipe_id')).values('pub_date')[:1]
+    for name in ('Favorite', 'ShoppingCart'):
+        apps.get_model('recipes', name).objects.update(
+            created_at=models.Subquery(pub_date))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_updated_at_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeTrending',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('score', models.FloatField(db_index=True, verbose_name='Оценка')),
+            ],
+            options={
+                'verbose_name': 'Рецепт в тренде',
+                'verbose_name_plural': 'Рецепты в тренде',
+            },
+        ),
+        migrations.CreateModel(
+            name='TrendingState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anchor', models.DateTimeField(verbose_name='Опорный момент')),
+                ('half_life_hours', models.FloatField(verbose_name='Период полураспада, ч')),
+                ('watermark', models.DateTimeField(verbose_name='Учтено до')),
+            ],
+            options={
+                'verbose_name': 'Состояние рейтинга',
+                'verbose_name_plural': 'Состояние рейтинга',
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Добавлено'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Добавлено'),
+        ),
+        migrations.RunPython(copy_pub_date, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_favorite_created_at_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationNeighbours',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('neighbours', models.JSONField(default=list, verbose_name='Соседи')),
+            ],
+            options={
+                'verbose_name': 'Соседи для рекомендаций',
+                'verbose_name_plural': 'Соседи для рекомендаций',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecommendationsState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('watermark', models.DateTimeField(verbose_name='Учтено до')),
+            ],
+            options={
+                'verbose_name': 'Состояние рекомендаций',
+                'verbose_name_plural': 'Состояние рекомендаций',
+            },
+        ),
+    ]
@@ -60,6 +60,7 @@ class Recipe(models.Model):
             MinValueValidator(MIN_COOKING_TIME),
             MaxValueValidator(MAX_COOKING_TIME)
         ],
+        db_index=True,
         verbose_name='Время приготовления (мин)'
     )
     pub_date = models.DateTimeField(
@@ -72,11 +73,20 @@ class Recipe(models.Model):
         blank=True,
         verbose_name='Короткая ссылка'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Изменён'
+    )
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            # Порядок ленты /api/recipes/changes/.
+            models.Index(fields=['updated_at', 'id'],
+                         name='recipe_updated_at_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -141,6 +151,11 @@ class Favorite(models.Model):
         related_name='favorited_by',
         verbose_name='Рецепт'
     )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name='Добавлено'
+    )
 
     class Meta:
         verbose_name = 'Избранное'
@@ -169,6 +184,11 @@ class ShoppingCart(models.Model):
         related_name='in_shopping_cart',
         verbose_name='Рецепт'
     )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name='Добавлено'
+    )
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -182,3 +202,241 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в список покупок'
+
+
+class DataImport(models.Model):
+    """
+    Отпечаток загруженного файла справочника. Повторная загрузка того же
+    файла (например, load_ingredients при каждом старте контейнера)
+    пропускается.
+    """
+    source = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Источник'
+    )
+    fingerprint = models.CharField(
+        max_length=64,
+        verbose_name='Отпечаток'
+    )
+    loaded_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Загружен'
+    )
+
+    class Meta:
+        verbose_name = 'Загрузка справочника'
+        verbose_name_plural = 'Загрузки справочников'
+
+    def __str__(self):
+        return f'{self.source} ({self.fingerprint[:12]})'
+
+
+class SimilarRecipes(models.Model):
+    """
+    Похожие рецепты, предрассчитанные командой build_similar_recipes:
+    список [[id, сходство], ...] по убыванию сходства. signature —
+    отпечаток состава рецепта на момент расчёта, по нему следующий
+    запуск находит изменившиеся рецепты.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='similar',
+        verbose_name='Рецепт'
+    )
+    neighbours = models.JSONField(
+        default=list,
+        verbose_name='Похожие рецепты'
+    )
+    signature = models.CharField(
+        max_length=16,
+        verbose_name='Отпечаток состава'
+    )
+    computed_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Рассчитано'
+    )
+
+    class Meta:
+        verbose_name = 'Похожие рецепты'
+        verbose_name_plural = 'Похожие рецепты'
+
+    def __str__(self):
+        return f'{self.recipe_id}: {len(self.neighbours)}'
+
+
+class Recommendations(models.Model):
+    """
+    Рекомендации пользователю, предрассчитанные командой
+    build_recommendations: список [[id рецепта, оценка], ...] по
+    убыванию оценки.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recommendations',
+        verbose_name='Пользователь'
+    )
+    recipes = models.JSONField(
+        default=list,
+        verbose_name='Рекомендованные рецепты'
+    )
+    computed_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Рассчитано'
+    )
+
+    class Meta:
+        verbose_name = 'Рекомендации'
+        verbose_name_plural = 'Рекомендации'
+
+    def __str__(self):
+        return f'{self.user}: {len(self.recipes)}'
+
+
+class RecommendationNeighbours(models.Model):
+    """
+    Соседи рецепта в модели рекомендаций (recipes/recommender.py):
+    список [[id рецепта, сходство], ...]. Пишет полный запуск
+    build_recommendations, читают дозапуски — по рецептам затронутых
+    пользователей.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name='Рецепт'
+    )
+    neighbours = models.JSONField(
+        default=list,
+        verbose_name='Соседи'
+    )
+
+    class Meta:
+        verbose_name = 'Соседи для рекомендаций'
+        verbose_name_plural = 'Соседи для рекомендаций'
+
+    def __str__(self):
+        return f'{self.recipe_id}: {len(self.neighbours)}'
+
+
+class RecommendationsState(models.Model):
+    """
+    Состояние build_recommendations (одна строка): водяной знак — до
+    какого момента отметки в избранном и корзинах уже учтены.
+    """
+    watermark = models.DateTimeField(verbose_name='Учтено до')
+
+    class Meta:
+        verbose_name = 'Состояние рекомендаций'
+        verbose_name_plural = 'Состояние рекомендаций'
+
+    def __str__(self):
+        return f'до {self.watermark:%Y-%m-%d %H:%M}'
+
+
+class IngredientPair(models.Model):
+    """
+    В скольких рецептах ингредиенты встречаются вместе. Хранятся обе
+    пары, (a, b) и (b, a), чтобы соседей ингредиента читать по индексу
+    уникальности. Считает build_ingredient_pairs, правки рецептов через
+    API поправляют счётчики сразу (recipes.cooccurrence).
+    """
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент'
+    )
+    other = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Встречается вместе с'
+    )
+    count = models.PositiveIntegerField(verbose_name='Рецептов')
+
+    class Meta:
+        verbose_name = 'Пара ингредиентов'
+        verbose_name_plural = 'Пары ингредиентов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['ingredient', 'other'],
+                name='unique_ingredient_pair'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient_id} + {self.other_id}: {self.count}'
+
+
+class RecipeTombstone(models.Model):
+    """
+    Запись об удалённом рецепте для /api/recipes/changes/: клиенты,
+    синхронизирующиеся по ленте изменений, узнают по ней, что рецепт
+    надо удалить у себя. Старые записи удаляет prune_recipe_tombstones.
+    """
+    recipe_id = models.PositiveBigIntegerField(verbose_name='Рецепт')
+    deleted_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Удалён'
+    )
+
+    class Meta:
+        verbose_name = 'Удалённый рецепт'
+        verbose_name_plural = 'Удалённые рецепты'
+        indexes = [
+            models.Index(fields=['deleted_at', 'recipe_id'],
+                         name='tombstone_deleted_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} ({self.deleted_at:%Y-%m-%d %H:%M})'
+
+
+class RecipeTrending(models.Model):
+    """
+    Оценка рецепта для ?ordering=trending: сумма отметок в избранном и
+    корзинах с затуханием по времени (см. recipes/trending.py). Считает
+    команда build_trending.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending',
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField(
+        db_index=True,
+        verbose_name='Оценка'
+    )
+
+    class Meta:
+        verbose_name = 'Рецепт в тренде'
+        verbose_name_plural = 'Рецепты в тренде'
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.score:.3g}'
+
+
+class TrendingState(models.Model):
+    """
+    Состояние расчёта RecipeTrending (одна строка): опорный момент
+    оценок, период полураспада, с которым они посчитаны, и водяной
+    знак — до какого момента отметки уже учтены.
+    """
+    anchor = models.DateTimeField(verbose_name='Опорный момент')
+    half_life_hours = models.FloatField(verbose_name='Период полураспада, ч')
+    watermark = models.DateTimeField(verbose_name='Учтено до')
+
+    class Meta:
+        verbose_name = 'Состояние рейтинга'
+        verbose_name_plural = 'Состояние рейтинга'
+
+    def __str__(self):
+        return f'до {self.watermark:%Y-%m-%d %H:%M}'
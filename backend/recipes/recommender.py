@@ -0,0 +1,216 @@
+"""
+Рекомендации рецептов по избранному и корзинам (item-item).
+
+Неявный отклик: в матрице пользователь × рецепт стоит 1, если рецепт
+у пользователя в избранном или в корзине. Сходство рецептов — косинус
+их столбцов: число общих пользователей / sqrt(n_i · n_j). Для каждого
+рецепта хранятся top-K соседей, оценка рецепта для пользователя — сумма
+сходств с его рецептами.
+
+Матрица хранится в двух CSR-представлениях на NumPy (по пользователям и
+по рецептам); строки соседей считаются по одной, поэтому памяти нужно
+O(связей), а не O(рецептов²). Результат пишет в Recommendations
+команда build_recommendations. Пользователям без истории отдаются
+популярные рецепты (popular_recipes).
+
+Полный запуск сохраняет соседей рецептов в RecommendationNeighbours.
+Дозапуск пересчитывает только пользователей с новыми отметками: их
+рецепты и соседи этих рецептов читаются по индексам (recommend_from),
+матрица целиком не строится. Сходство рецептов при этом — на момент
+последнего полного запуска.
+"""
+import heapq
+from array import array
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef, Q
+
+from .models import Favorite, Recipe, ShoppingCart
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+POPULAR_KEY = 'recommendations:popular'
+POPULAR_SIZE = 100
+POPULAR_TTL = 600
+
+
+def load_interactions(chunk_size=10000):
+    """
+    Пары (user_id, recipe_id) из избранного и корзин — двумя массивами
+    int64, без повторов.
+    """
+    users, recipes = array('q'), array('q')
+    for model in (Favorite, ShoppingCart):
+        rows = model.objects.values_list('user_id', 'recipe_id')
+        for user_id, recipe_id in rows.iterator(chunk_size=chunk_size):
+            users.append(user_id)
+            recipes.append(recipe_id)
+    pairs = np.unique(np.stack([
+        np.frombuffer(users, dtype=np.int64),
+        np.frombuffer(recipes, dtype=np.int64),
+    ], axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def load_user_items(user_ids):
+    """{user_id: [recipe_id, ...]} — избранное и корзины, id по возрастанию."""
+    items = defaultdict(set)
+    for model in (Favorite, ShoppingCart):
+        rows = model.objects.filter(user_id__in=user_ids).values_list(
+            'user_id', 'recipe_id')
+        for user_id, recipe_id in rows:
+            items[user_id].add(recipe_id)
+    return {user_id: sorted(recipes) for user_id, recipes in items.items()}
+
+
+def recommend_from(own, similar, top, exclude=()):
+    """
+    То же, что ItemKNN.recommend, по готовым спискам соседей:
+    own — рецепты пользователя, similar — {recipe_id: [[id, сходство],
+    ...]} (из RecommendationNeighbours), exclude — id рецептов, которые
+    не рекомендуются.
+    """
+    scores = defaultdict(float)
+    for pk in own:
+        for other, score in similar.get(pk, ()):
+            scores[other] += score
+    skip = set(own).union(exclude)
+    return heapq.nsmallest(
+        top,
+        ([pk, round(score, 4)] for pk, score in scores.items()
+         if pk not in skip),
+        key=lambda item: (-item[1], item[0]))
+
+
+def _csr(rows, cols, size):
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+    return indptr, cols[order]
+
+
+class ItemKNN:
+    """
+    Item-item модель по парам (user_id, recipe_id). Внутри id
+    пользователей и рецептов заменены позициями в self.user_ids и
+    self.recipe_ids.
+    """
+
+    def __init__(self, users, recipes, neighbours=50, max_user_items=500):
+        self.user_ids, user_rows = np.unique(users, return_inverse=True)
+        self.recipe_ids, recipe_rows = np.unique(recipes,
+                                                 return_inverse=True)
+        self.neighbours = neighbours
+        self.by_user = _csr(user_rows, recipe_rows, len(self.user_ids))
+        self.by_recipe = _csr(recipe_rows, user_rows, len(self.recipe_ids))
+        self.counts = np.diff(self.by_recipe[0])
+        # Пользователи с огромной историей связывают почти все рецепты
+        # и дороже всего обходятся — в сходстве они не учитываются.
+        self.active = np.diff(self.by_user[0]) <= max_user_items
+        self.similar = [None] * len(self.recipe_ids)
+
+    @staticmethod
+    def _row(matrix, pos):
+        indptr, indices = matrix
+        return indices[indptr[pos]:indptr[pos + 1]]
+
+    def _recipes_of(self, user_rows):
+        """Склеенные строки by_user для user_rows, без цикла по строкам."""
+        indptr, indices = self.by_user
+        starts = indptr[user_rows]
+        lengths = indptr[user_rows + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return indices[offsets + np.arange(lengths.sum())]
+
+    def fit(self):
+        for pos in range(len(self.recipe_ids)):
+            users = self._row(self.by_recipe, pos)
+            co_rated = self._recipes_of(users[self.active[users]])
+            others, common = np.unique(co_rated, return_counts=True)
+            keep = others != pos
+            others, common = others[keep], common[keep]
+            scores = common / np.sqrt(self.counts[pos] * self.counts[others])
+            if len(others) > self.neighbours:
+                best = np.argpartition(-scores, self.neighbours)
+                best = best[:self.neighbours]
+                others, scores = others[best], scores[best]
+            self.similar[pos] = others, scores
+        return self
+
+    def neighbour_lists(self):
+        """(recipe_id, [[id, сходство], ...]) для каждого рецепта."""
+        for pos, (others, scores) in enumerate(self.similar):
+            yield int(self.recipe_ids[pos]), [
+                [int(pk), float(score)]
+                for pk, score in zip(self.recipe_ids[others], scores)]
+
+    def recommend(self, user_pos, top, exclude=()):
+        """
+        [[recipe_id, оценка], ...] для пользователя на позиции user_pos,
+        без его рецептов и рецептов на позициях exclude.
+        """
+        own = self._row(self.by_user, user_pos)
+        if not len(own):
+            return []
+        others = np.concatenate([self.similar[pos][0] for pos in own])
+        weights = np.concatenate([self.similar[pos][1] for pos in own])
+        candidates, inverse = np.unique(others, return_inverse=True)
+        # Округляем сразу: равные оценки упорядочиваются по id.
+        scores = np.bincount(inverse, weights=weights).round(4)
+        keep = ~np.isin(candidates, np.concatenate([own, exclude]))
+        candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > top:
+            best = np.argpartition(-scores, top)[:top]
+            candidates, scores = candidates[best], scores[best]
+        order = np.lexsort((self.recipe_ids[candidates], -scores))
+        return [[int(self.recipe_ids[pos]), float(score)]
+                for pos, score in zip(candidates[order], scores[order])]
+
+
+def popular_recipes():
+    """
+    [[recipe_id, число добавлений], ...] — самые частые рецепты в
+    избранном и корзинах. Кэшируется на POPULAR_TTL секунд.
+    """
+    popular = cache.get(POPULAR_KEY)
+    if popular is None:
+        counts = Counter()
+        for model in (Favorite, ShoppingCart):
+            counts.update(dict(
+                model.objects.order_by().values('recipe_id')
+                .annotate(total=Count('pk'))
+                .values_list('recipe_id', 'total')
+            ))
+        popular = [[pk, total]
+                   for pk, total in counts.most_common(POPULAR_SIZE)]
+        if len(popular) < POPULAR_SIZE:
+            # Пока отметок мало, добираем свежими рецептами.
+            known = set(counts)
+            popular += [
+                [pk, 0] for pk in Recipe.objects.values_list(
+                    'pk', flat=True)[:POPULAR_SIZE * 2]
+                if pk not in known
+            ][:POPULAR_SIZE - len(popular)]
+        cache.set(POPULAR_KEY, popular, POPULAR_TTL)
+    return popular
+
+
+def popular_for_user(user_id):
+    """
+    popular_recipes() без рецептов самого пользователя и тех, что уже
+    у него в избранном или корзине.
+    """
+    popular = popular_recipes()
+    skip = set(Recipe.objects.filter(
+        Q(author_id=user_id)
+        | Exists(Favorite.objects.filter(
+            user_id=user_id, recipe_id=OuterRef('pk')))
+        | Exists(ShoppingCart.objects.filter(
+            user_id=user_id, recipe_id=OuterRef('pk'))),
+        pk__in=[pk for pk, _ in popular],
+    ).values_list('pk', flat=True))
+    return [item for item in popular if item[0] not in skip]
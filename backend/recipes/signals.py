@@ -0,0 +1,88 @@
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from .catalogue import schedule_rebuild
+from .changelog import mark_changed
+from .cooccurrence import apply_change
+from .models import Ingredient, Recipe, RecipeIngredient, RecipeTombstone
+
+# Отправляется после коммита, только если состав ингредиентов рецепта
+# действительно изменился. Аргументы: recipe, before и after —
+# множества id ингредиентов до и после правки.
+# Состав меняют bulk_create / bulk_update (они не шлют post_save) и
+# QuerySet.delete, у которого post_delete-получатель на RecipeIngredient
+# отнял бы удаление одним DELETE. Поэтому по строкам RecipeIngredient
+# сигналы не слушаются: кэши, построенные по составу, слушают этот
+# сигнал, а правки в обход сериализатора (админка) оборачиваются в
+# track_ingredient_changes.
+recipe_ingredients_changed = Signal()
+
+
+def _ingredient_sets(recipe_ids):
+    sets = defaultdict(set)
+    for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids).values_list(
+                'recipe_id', 'ingredient_id'):
+        sets[recipe_id].add(ingredient_id)
+    return sets
+
+
+@contextmanager
+def track_ingredient_changes(recipe_ids):
+    """
+    Правка состава рецептов recipe_ids внутри блока: после коммита для
+    каждого из них, если он не удалён, шлётся recipe_ingredients_changed.
+    """
+    before = _ingredient_sets(recipe_ids)
+    yield
+    after = _ingredient_sets(recipe_ids)
+    for recipe in Recipe.objects.filter(pk__in=recipe_ids):
+        transaction.on_commit(
+            lambda recipe=recipe: recipe_ingredients_changed.send(
+                sender=Recipe, recipe=recipe,
+                before=before[recipe.pk], after=after[recipe.pk]))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def refresh_ingredient_catalogue(sender, **kwargs):
+    """Правка ингредиента (например, в админке) обновляет каталог."""
+    schedule_rebuild()
+
+
+@receiver(recipe_ingredients_changed)
+def log_recipe_change(sender, recipe, **kwargs):
+    """
+    Индексы в памяти строятся по составу, поэтому правка только полей
+    рецепта (название, текст) в журнал не попадает.
+    """
+    mark_changed(recipe.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def log_recipe_delete(sender, instance, **kwargs):
+    mark_changed(instance.pk)
+
+
+@receiver(recipe_ingredients_changed)
+def update_ingredient_pairs(sender, before, after, **kwargs):
+    apply_change(before, after)
+
+
+@receiver(pre_delete, sender=Recipe)
+def forget_ingredient_pairs(sender, instance, **kwargs):
+    """Пары удаляемого рецепта вычитаются после коммита."""
+    before = set(instance.recipe_ingredients.values_list(
+        'ingredient_id', flat=True))
+    if before:
+        transaction.on_commit(lambda: apply_change(before, ()))
+
+
+@receiver(post_delete, sender=Recipe)
+def record_tombstone(sender, instance, **kwargs):
+    """Удаление попадает в /api/recipes/changes/ (api/sync.py)."""
+    RecipeTombstone.objects.create(recipe_id=instance.pk)
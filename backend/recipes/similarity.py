@@ -0,0 +1,79 @@
+"""
+Сходство рецептов по составу (коэффициент Жаккара множеств ингредиентов).
+
+Кандидаты для рецепта — рецепты, с которыми у него есть общий
+ингредиент: это строка произведения разреженной матрицы рецепт ×
+ингредиент на её транспонированную, посчитанная по posting lists.
+Слишком частые ингредиенты (соль, вода) связывают почти все рецепты,
+поэтому для поиска кандидатов они не используются (max_df), но в
+сходстве кандидатов учитываются.
+
+Результат хранится в SimilarRecipes; считает его build_similar_recipes.
+"""
+import hashlib
+import heapq
+from collections import defaultdict
+
+from .models import RecipeIngredient
+
+# Ингредиенты, которые встречаются не больше чем в стольких рецептах,
+# используются для кандидатов при любом max_df (важно на малых данных).
+MIN_DF_LIMIT = 100
+
+
+def signature(ingredient_ids):
+    digest = hashlib.blake2b(
+        ','.join(map(str, sorted(ingredient_ids))).encode(), digest_size=8)
+    return digest.hexdigest()
+
+
+def jaccard(first, second):
+    common = len(first & second)
+    return common / (len(first) + len(second) - common)
+
+
+def rank(neighbour):
+    """Ключ порядка [id, сходство]: сходство, при равенстве — меньший id."""
+    return neighbour[1], -neighbour[0]
+
+
+def load_recipe_sets():
+    """{recipe_id: frozenset(ingredient_id)} по всем рецептам с составом."""
+    sets = defaultdict(set)
+    rows = RecipeIngredient.objects.values_list('recipe_id', 'ingredient_id')
+    for recipe_id, ingredient_id in rows.iterator(chunk_size=10000):
+        sets[recipe_id].add(ingredient_id)
+    return {pk: frozenset(ingredients) for pk, ingredients in sets.items()}
+
+
+class SimilarityModel:
+
+    def __init__(self, sets, max_df=0.1):
+        self.sets = sets
+        postings = defaultdict(list)
+        for pk, ingredients in sets.items():
+            for ingredient_id in ingredients:
+                postings[ingredient_id].append(pk)
+        limit = max(MIN_DF_LIMIT, int(max_df * len(sets)))
+        self.postings = {
+            ingredient_id: ids for ingredient_id, ids in postings.items()
+            if len(ids) <= limit
+        }
+
+    def scores(self, pk):
+        """{id рецепта: сходство} для всех кандидатов рецепта pk."""
+        mine = self.sets[pk]
+        candidates = set()
+        for ingredient_id in mine:
+            candidates.update(self.postings.get(ingredient_id, ()))
+        candidates.discard(pk)
+        return {other: jaccard(mine, self.sets[other])
+                for other in candidates}
+
+    def neighbours(self, pk, top, scores=None):
+        """[[id, сходство], ...] — top самых похожих на pk рецептов."""
+        if scores is None:
+            scores = self.scores(pk)
+        return heapq.nlargest(
+            top, ([other, round(score, 4)] for other, score in scores.items()),
+            key=rank)
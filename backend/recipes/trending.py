@@ -0,0 +1,107 @@
+"""
+Рейтинг «в тренде» (?ordering=trending): отметки в избранном и
+корзинах, вес которых убывает вдвое каждые TRENDING_HALF_LIFE_HOURS.
+
+Сейчас отметка из момента t весит w * 2^((t - now) / T). Множитель
+2^(-now / T) общий для всех рецептов и порядок не меняет, поэтому в
+RecipeTrending хранится сумма w * 2^((t - anchor) / T) от опорного
+момента anchor: новая отметка прибавляется к оценке своего рецепта, а
+старые «остывают» сами, без пересчёта таблицы. Когда от anchor прошло
+MAX_HALVINGS периодов, все оценки умножаются на общий множитель и
+anchor переносится вперёд.
+
+Команда build_trending дочитывает отметки после водяного знака
+(TrendingState.watermark) по индексам created_at. Снятые отметки
+уходят из оценок только при полном пересчёте (--full) — его стоит
+запускать раз в сутки.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Favorite, RecipeTrending, ShoppingCart, TrendingState
+
+WEIGHTS = ((Favorite, 1.0), (ShoppingCart, 0.5))
+# 2^500 ещё далеко от предела float.
+MAX_HALVINGS = 500
+# Рецепты, остывшие ниже этого (относительно свежей отметки в избранном),
+# при полном пересчёте и переносе anchor из таблицы выпадают.
+MIN_SCORE = 2.0 ** -30
+BATCH_SIZE = 1000
+
+
+def _halvings(moment, anchor, half_life):
+    return (moment - anchor) / timedelta(hours=half_life)
+
+
+def _collect(anchor, half_life, after, until):
+    """{recipe_id: прибавка к оценке} по отметкам из (after, until]."""
+    scores = defaultdict(float)
+    for model, weight in WEIGHTS:
+        events = model.objects.filter(created_at__lte=until)
+        if after is not None:
+            events = events.filter(created_at__gt=after)
+        for recipe_id, created_at in events.values_list(
+                'recipe_id', 'created_at').iterator(chunk_size=10000):
+            scores[recipe_id] += weight * 2.0 ** _halvings(
+                created_at, anchor, half_life)
+    return scores
+
+
+def _add(scores, existing):
+    items = list(scores.items())
+    for start in range(0, len(items), BATCH_SIZE):
+        batch = dict(items[start:start + BATCH_SIZE])
+        if existing:
+            for recipe_id, score in RecipeTrending.objects.filter(
+                    recipe_id__in=batch).values_list('recipe_id', 'score'):
+                batch[recipe_id] += score
+        RecipeTrending.objects.bulk_create(
+            [RecipeTrending(recipe_id=recipe_id, score=score)
+             for recipe_id, score in batch.items()],
+            update_conflicts=True, unique_fields=['recipe'],
+            update_fields=['score'],
+        )
+
+
+def _rebase(state, anchor):
+    factor = 2.0 ** -_halvings(anchor, state.anchor, state.half_life_hours)
+    RecipeTrending.objects.update(score=F('score') * factor)
+    RecipeTrending.objects.filter(score__lt=MIN_SCORE).delete()
+    state.anchor = anchor
+
+
+def refresh(full=False):
+    """
+    Дописать в RecipeTrending отметки после водяного знака, а при
+    full, без состояния или при смене периода полураспада — пересчитать
+    всё. Возвращает (полный ли пересчёт, сколько рецептов затронуто).
+    """
+    half_life = settings.TRENDING_HALF_LIFE_HOURS
+    # Отметки из ещё не закоммиченных транзакций могут получить
+    # created_at чуть раньше until — их дождётся следующий запуск.
+    until = timezone.now() - timedelta(
+        seconds=settings.CHANGES_SAFETY_WINDOW)
+    with transaction.atomic():
+        state = TrendingState.objects.select_for_update().first()
+        full = (full or state is None
+                or state.half_life_hours != half_life)
+        if full:
+            state = state or TrendingState()
+            state.anchor, state.half_life_hours = until, half_life
+            RecipeTrending.objects.all().delete()
+            scores = _collect(until, half_life, None, until)
+            scores = {recipe_id: score for recipe_id, score in scores.items()
+                      if score >= MIN_SCORE}
+        else:
+            if _halvings(until, state.anchor, half_life) > MAX_HALVINGS:
+                _rebase(state, until)
+            scores = _collect(state.anchor, half_life, state.watermark, until)
+        _add(scores, existing=not full)
+        state.watermark = until
+        state.save()
+    return full, len(scores)
@@ -0,0 +1,88 @@
+import time
+
+import numpy as np
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import AuthorSuggestions
+from users.suggestions import (POPULAR_KEY, TOP, FollowGraph, load_follows)
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Рассчитать подсказки /api/users/suggestions/ по графу '
+            'подписок: авторы, на которых подписаны ваши подписки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=TOP,
+                            help='Сколько авторов подсказывать.')
+        parser.add_argument('--max-following', type=int, default=1000,
+                            help='Подписки пользователей с большим числом '
+                                 'подписок во втором шаге не учитываются.')
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--stale', action='store_true',
+                            help='Пересчитать только строки, помеченные '
+                                 'после подписок и отписок (stale).')
+
+    def handle(self, *args, **options):
+        started_at = timezone.now()
+        started = time.perf_counter()
+        graph = FollowGraph(*load_follows(options['chunk_size']),
+                            max_following=options['max_following'])
+        self.stdout.write(
+            f'Подписок: {len(graph.indices)}, пользователей: '
+            f'{len(graph.ids)}, граф за '
+            f'{time.perf_counter() - started:.1f} с')
+
+        top = options['top']
+        if options['stale']:
+            self._refresh_stale(graph, top, started)
+            return
+        written = 0
+        with transaction.atomic():
+            batch = []
+            # Подсказки есть только у тех, кто на кого-то подписан.
+            for pos in (graph.degree > 0).nonzero()[0].tolist():
+                batch.append(AuthorSuggestions(
+                    user_id=int(graph.ids[pos]),
+                    authors=graph.suggest(pos, top),
+                ))
+                if len(batch) == BATCH_SIZE:
+                    written += self._write(batch)
+                    batch = []
+            written += self._write(batch)
+            # Пользователи, отписавшиеся от всех.
+            removed, _ = AuthorSuggestions.objects.filter(
+                computed_at__lt=started_at).delete()
+        cache.delete(POPULAR_KEY)
+        self.stdout.write(
+            f'Записано: {written}, удалено: {removed} за '
+            f'{time.perf_counter() - started:.1f} с')
+
+    def _refresh_stale(self, graph, top, started):
+        user_ids = list(AuthorSuggestions.objects.filter(stale=True)
+                        .values_list('user_id', flat=True))
+        positions = np.searchsorted(graph.ids, user_ids)
+        batch = []
+        for user_id, pos in zip(user_ids, positions.tolist()):
+            known = pos < len(graph.ids) and graph.ids[pos] == user_id
+            batch.append(AuthorSuggestions(
+                user_id=user_id,
+                authors=graph.suggest(pos, top) if known else [],
+            ))
+        for start in range(0, len(batch), BATCH_SIZE):
+            self._write(batch[start:start + BATCH_SIZE])
+        self.stdout.write(
+            f'Пересчитано: {len(batch)} за '
+            f'{time.perf_counter() - started:.1f} с')
+
+    @staticmethod
+    def _write(batch):
+        AuthorSuggestions.objects.bulk_create(
+            batch, update_conflicts=True, unique_fields=['user'],
+            update_fields=['authors', 'computed_at', 'stale'],
+        )
+        return len(batch)
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorSuggestions',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='author_suggestions', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('authors', models.JSONField(default=list, verbose_name='Авторы')),
+                ('computed_at', models.DateTimeField(auto_now=True, verbose_name='Рассчитано')),
+            ],
+            options={
+                'verbose_name': 'Подсказки авторов',
+                'verbose_name_plural': 'Подсказки авторов',
+            },
+        ),
+    ]
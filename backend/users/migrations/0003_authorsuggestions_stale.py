@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_authorsuggestions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorsuggestions',
+            name='stale',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='Требует пересчёта'),
+        ),
+    ]
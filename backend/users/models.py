@@ -62,3 +62,38 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'{self.user} подписан на {self.author}'
+
+
+class AuthorSuggestions(models.Model):
+    """
+    Подсказки «на кого подписаться» (см. users/suggestions.py): список
+    [[id автора, mutual], ...] по убыванию mutual — числа подписок
+    пользователя, которые подписаны на этого автора.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='author_suggestions',
+        verbose_name='Пользователь'
+    )
+    authors = models.JSONField(
+        default=list,
+        verbose_name='Авторы'
+    )
+    computed_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Рассчитано'
+    )
+    stale = models.BooleanField(
+        default=False,
+        db_index=True,
+        verbose_name='Требует пересчёта'
+    )
+
+    class Meta:
+        verbose_name = 'Подсказки авторов'
+        verbose_name_plural = 'Подсказки авторов'
+
+    def __str__(self):
+        return f'{self.user}: {len(self.authors)}'
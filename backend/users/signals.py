@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Follow
+from .suggestions import mark_stale
+
+
+@receiver(post_save, sender=Follow)
+def mark_author_suggestions_stale(sender, instance, created, **kwargs):
+    """Новая подписка меняет подсказки самого подписчика."""
+    if created:
+        transaction.on_commit(lambda: mark_stale(instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def mark_author_suggestions_stale_on_delete(sender, instance, **kwargs):
+    """
+    Отписка тоже. Строку подсказок не создаём: без неё помечать нечего,
+    а при каскадном удалении пользователя её и не для кого создавать.
+    """
+    transaction.on_commit(
+        lambda: mark_stale(instance.user_id, create=False))
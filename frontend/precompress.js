@@ -0,0 +1,50 @@
+// Сжатые копии (.gz, .br) файлов сборки для gzip_static/brotli_static
+// в nginx: node precompress.js <каталог> [<каталог> ...]
+const fs = require('fs');
+const path = require('path');
+const zlib = require('zlib');
+
+const EXTENSIONS = new Set([
+  '.css', '.html', '.js', '.json', '.map', '.svg', '.txt', '.xml',
+  '.yaml', '.yml',
+]);
+const MIN_SIZE = 1024;
+
+function* walk(directory) {
+  for (const entry of fs.readdirSync(directory, { withFileTypes: true })) {
+    const target = path.join(directory, entry.name);
+    if (entry.isDirectory()) {
+      yield* walk(target);
+    } else {
+      yield target;
+    }
+  }
+}
+
+const totals = { raw: 0, gz: 0, br: 0 };
+for (const root of process.argv.slice(2)) {
+  for (const file of walk(root)) {
+    if (!EXTENSIONS.has(path.extname(file))) continue;
+    const data = fs.readFileSync(file);
+    if (data.length < MIN_SIZE) continue;
+    const variants = {
+      gz: zlib.gzipSync(data, { level: 9 }),
+      br: zlib.brotliCompressSync(data, {
+        params: { [zlib.constants.BROTLI_PARAM_QUALITY]: 11 },
+      }),
+    };
+    totals.raw += data.length;
+    for (const [suffix, compressed] of Object.entries(variants)) {
+      // Несжимаемое nginx отдаст как есть.
+      if (compressed.length >= data.length) {
+        totals[suffix] += data.length;
+        continue;
+      }
+      fs.writeFileSync(`${file}.${suffix}`, compressed);
+      totals[suffix] += compressed.length;
+    }
+  }
+}
+for (const [key, size] of Object.entries(totals)) {
+  console.log(`${key}: ${size} байт`);
+}